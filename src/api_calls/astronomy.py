@@ -1,13 +1,10 @@
 #%%
 import os
 import arrow
-import requests
 from datetime import datetime
-from typing import Dict, Any
+from typing import Dict, Any, Optional
 from dotenv import load_dotenv
-
-# Load environment variables from .env file.
-load_dotenv()
+from api_calls.stormglass import FetchJSON, get_json
 
 class AstronomyAPIClient:
     """
@@ -22,7 +19,8 @@ class AstronomyAPIClient:
     The API key is obtained from the environment variable STORMGLASS_API_KEY.
     """
 
-    def __init__(self, api_key: str = None, base_url: str = "https://api.stormglass.io/v2/astronomy/point"):
+    def __init__(self, api_key: str = None, base_url: str = "https://api.stormglass.io/v2/astronomy/point",
+                 fetch_json: Optional[FetchJSON] = None):
         """
         Initialize the AstronomyAPIClient.
 
@@ -31,6 +29,8 @@ class AstronomyAPIClient:
                                      from the STORMGLASS_API_KEY environment variable.
             base_url (str, optional): The base URL for the Stormglass Astronomy API.
                                       Defaults to "https://api.stormglass.io/v2/astronomy/point".
+            fetch_json (callable, optional): Function used to perform the HTTP request
+                                             (see api_calls.stormglass.FetchJSON). Defaults to get_json.
         """
         if api_key is None:
             api_key = os.getenv("STORMGLASS_API_KEY")
@@ -38,6 +38,7 @@ class AstronomyAPIClient:
             raise ValueError("API key is not set. Please set STORMGLASS_API_KEY in your environment.")
         self.api_key = api_key
         self.base_url = base_url
+        self.fetch_json = fetch_json or get_json
 
     def compute_light_level(self, target: datetime, data: Dict[str, Any]) -> str:
         """
@@ -135,24 +136,45 @@ class AstronomyAPIClient:
         Returns:
             dict: A dictionary containing the astronomy data and a "lightLevel" key.
         """
+        json_data = self.fetch_json(self.base_url, self.request_params(timestamp, lat, lon), self.headers)
+        return self.extract_astronomy(json_data, timestamp)
+
+    def request_params(self, timestamp: datetime, lat: float, lon: float) -> Dict[str, Any]:
+        """
+        Build the query parameters for the 24-hour window (midnight to midnight UTC) of the timestamp.
+
+        Args:
+            timestamp (datetime): The timestamp for which astronomy data is desired.
+            lat (float): Latitude of the location.
+            lon (float): Longitude of the location.
+
+        Returns:
+            dict: Query parameters for the astronomy endpoint.
+        """
         start = arrow.get(timestamp).floor('day')
         end = arrow.get(timestamp).shift(days=1).floor('day')
+        return {
+            'lat': lat,
+            'lng': lon,
+            'start': start.to('UTC').timestamp(),
+            'end': end.to('UTC').timestamp()
+        }
 
-        response = requests.get(
-            self.base_url,
-            params={
-                'lat': lat,
-                'lng': lon,
-                'start': start.to('UTC').timestamp(),
-                'end': end.to('UTC').timestamp()
-            },
-            headers={
-                'Authorization': self.api_key
-            }
-        )
-        response.raise_for_status()
-        json_data = response.json()
+    @property
+    def headers(self) -> Dict[str, str]:
+        return {'Authorization': self.api_key}
 
+    def extract_astronomy(self, json_data: Dict[str, Any], timestamp: datetime) -> Dict[str, Any]:
+        """
+        Extract the astronomy fields and compute the light level from an API response.
+
+        Args:
+            json_data (dict): Decoded response from the astronomy endpoint.
+            timestamp (datetime): The timestamp for which astronomy data is desired.
+
+        Returns:
+            dict: The astronomy data and a "lightLevel" key, or {} if the response has no data.
+        """
         if "data" not in json_data or not json_data["data"]:
             return {}
 
@@ -177,6 +199,8 @@ class AstronomyAPIClient:
         return result
 
 if __name__ == "__main__":
+    # Load environment variables from .env file.
+    load_dotenv()
     from datetime import datetime
     test_date = datetime.strptime("2023-09-16", "%Y-%m-%d")
     lat, lon = 50.220564, -4.801677
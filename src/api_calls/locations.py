@@ -0,0 +1,10 @@
+# Location cells shared by the API clients and the web process. Kept free of third-party
+# imports so modules loaded at web startup (hourly_series) do not pull in the HTTP clients.
+
+def snap_coordinate(value: float, decimals: int) -> float:
+    """Round a latitude or longitude to `decimals` places (2 places is roughly 1 km)."""
+    return round(float(value), decimals)
+
+def location_key(lat: float, lon: float, decimals: int = 2) -> str:
+    """Return the key identifying a location cell, e.g. "50.22,-4.80"."""
+    return f"{snap_coordinate(lat, decimals):.{decimals}f},{snap_coordinate(lon, decimals):.{decimals}f}"
@@ -0,0 +1,53 @@
+#%%
+import requests
+from typing import Any, Callable, Dict
+
+from api_calls.locations import location_key, snap_coordinate  # noqa: F401
+
+# Signature shared by every JSON fetcher the API clients accept:
+#   fetch_json(url, params, headers) -> decoded JSON body
+FetchJSON = Callable[[str, Dict[str, Any], Dict[str, str]], Dict[str, Any]]
+
+# (connect, read) timeouts in seconds, so an unresponsive upstream fails instead of hanging a worker.
+REQUEST_TIMEOUT = (5, 30)
+
+def get_json(url: str, params: Dict[str, Any], headers: Dict[str, str]) -> Dict[str, Any]:
+    """
+    Send a GET request to a Stormglass endpoint and return the decoded JSON body.
+
+    This is the default fetcher used by the tide, weather and astronomy clients. Callers can
+    substitute another function with the same signature (see FetchJSON) to add caching,
+    coalescing or circuit breaking around the HTTP call.
+
+    Args:
+        url (str): Endpoint URL.
+        params (dict): Query parameters.
+        headers (dict): Request headers (including Authorization).
+
+    Returns:
+        dict: The decoded JSON response.
+
+    Raises:
+        requests.HTTPError: If the response status is 4xx/5xx.
+        requests.Timeout: If upstream does not answer within REQUEST_TIMEOUT.
+    """
+    response = requests.get(url, params=params, headers=headers, timeout=REQUEST_TIMEOUT)
+    response.raise_for_status()
+    return response.json()
+
+def snapping_fetcher(fetch_json: FetchJSON, decimals: int) -> FetchJSON:
+    """
+    Wrap a fetcher so the 'lat'/'lng' query parameters are snapped to a grid of `decimals` places.
+
+    Nearby catches then produce identical requests, which lets caching, prefetching and
+    request coalescing treat them as one location. Stormglass data is far coarser than the
+    default grid, so the returned values are unaffected in practice.
+    """
+    def fetch(url: str, params: Dict[str, Any], headers: Dict[str, str]) -> Dict[str, Any]:
+        snapped = dict(params)
+        if 'lat' in snapped and 'lng' in snapped:
+            snapped['lat'] = snap_coordinate(snapped['lat'], decimals)
+            snapped['lng'] = snap_coordinate(snapped['lng'], decimals)
+        return fetch_json(url, snapped, headers)
+
+    return fetch
@@ -0,0 +1,202 @@
+#%%
+import json
+import threading
+from bisect import bisect_left, bisect_right
+from collections import OrderedDict
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import arrow
+
+EXTREMES = "extremes"
+SEA_LEVEL = "sea"
+
+def _epoch(value) -> float:
+    """Epoch seconds for a datetime (naive means UTC), an ISO string or an arrow object."""
+    if isinstance(value, datetime) and value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return arrow.get(value).timestamp()
+
+def _day(value) -> str:
+    return arrow.get(value).format("YYYY-MM-DD")
+
+class TideTimeline:
+    """
+    Tide extremes and sea levels for one location, merged across every day fetched so far.
+
+    Points are kept as sorted epoch-second arrays so the values get_tide_data needs (the last
+    high tide before a time, a day's extremes, the closest sea level) are binary searches.
+    `days` records which UTC days of each kind have been fetched, so a day with no events is
+    not mistaken for a day that was never requested.
+    """
+
+    def __init__(self):
+        self.days = set()
+        self._extremes: Dict[float, Tuple[str, float]] = {}
+        self._sea_levels: Dict[float, Optional[float]] = {}
+        self._lock = threading.Lock()
+        self._rebuild()
+
+    def _rebuild(self):
+        # Swapped in as one tuple so concurrent readers never see arrays from different merges.
+        extreme_times = sorted(self._extremes)
+        sea_times = sorted(self._sea_levels)
+        self._index = (
+            extreme_times,
+            [self._extremes[t] for t in extreme_times],
+            [t for t in extreme_times if self._extremes[t][0] == "high"],
+            sea_times,
+            [self._sea_levels[t] for t in sea_times],
+        )
+
+    def covers(self, kind: str, day) -> bool:
+        """True if `kind` (EXTREMES or SEA_LEVEL) data for the UTC day of `day` has been merged."""
+        return f"{kind}:{_day(day)}" in self.days
+
+    def merge(self, kind: str, day, points: Iterable[Tuple[float, Any]]):
+        """Add (epoch, value) points fetched for the UTC day of `day`."""
+        with self._lock:
+            target = self._extremes if kind == EXTREMES else self._sea_levels
+            target.update(points)
+            self._rebuild()
+            self.days.add(f"{kind}:{_day(day)}")
+
+    @staticmethod
+    def extreme_points(events: List[Dict[str, Any]]) -> List[Tuple[float, Tuple[str, float]]]:
+        """Convert extremes endpoint events to (epoch, (type, height)) points."""
+        return [(_epoch(event["time"]), (event.get("type"), float(event["height"]))) for event in events]
+
+    @staticmethod
+    def sea_level_points(points: List[Dict[str, Any]]) -> List[Tuple[float, Optional[float]]]:
+        """Convert sea-level endpoint points to (epoch, height) points."""
+        return [(_epoch(point["time"]), None if point.get("sg") is None else float(point["sg"])) for point in points]
+
+    @staticmethod
+    def _recent_high(high_times: List[float], target: float, since: float) -> Optional[float]:
+        index = bisect_right(high_times, target) - 1
+        if index >= 0 and high_times[index] >= since:
+            return high_times[index]
+        return None
+
+    def needs_previous_day(self, timestamp: datetime) -> bool:
+        """True if the timestamp's day has no high tide at or before it (see TideAPIClient.needs_previous_day)."""
+        day_start = _epoch(arrow.get(timestamp).floor("day"))
+        return self._recent_high(self._index[2], _epoch(timestamp), day_start) is None
+
+    def tide_data(self, timestamp: datetime) -> Dict[str, Any]:
+        """
+        Compute the same values as TideAPIClient.compute_tide_data from the stored timeline.
+
+        The timeline must cover the timestamp's day (and the previous day's extremes when
+        needs_previous_day is True).
+        """
+        extreme_times, extreme_values, high_times, sea_times, sea_heights = self._index
+        target = _epoch(timestamp)
+        day_start = _epoch(arrow.get(timestamp).floor("day"))
+        day_end = day_start + 86400
+
+        # currentTideHeight: the day's sea level point closest to the target (earlier wins ties).
+        current_tide_height = None
+        # Each day is fetched as the window [day, next midnight], so both ends are included.
+        low, high = bisect_left(sea_times, day_start), bisect_right(sea_times, day_end)
+        if low < high:
+            index = min(bisect_left(sea_times, target, low, high), high - 1)
+            if index > low and target - sea_times[index - 1] <= abs(sea_times[index] - target):
+                index -= 1
+            current_tide_height = sea_heights[index]
+
+        # tideHour: hours since the last high tide on the day, or else on the previous day.
+        recent_high = self._recent_high(high_times, target, day_start)
+        if recent_high is None:
+            recent_high = self._recent_high(high_times, target, day_start - 86400)
+        tide_hour = None
+        if recent_high is not None:
+            tide_hour = max(0, min((target - recent_high) / 3600.0, 12))
+
+        # maxHighTide and minLowTide: over the day's extremes.
+        low, high = bisect_left(extreme_times, day_start), bisect_right(extreme_times, day_end)
+        day_extremes = extreme_values[low:high]
+        high_values = [height for kind, height in day_extremes if kind == "high"]
+        low_values = [height for kind, height in day_extremes if kind == "low"]
+        return {
+            "currentTideHeight": current_tide_height,
+            "tideHour": tide_hour,
+            "maxHighTide": max(high_values) if high_values else None,
+            "minLowTide": min(low_values) if low_values else None,
+        }
+
+class RedisTideTimelineStore:
+    """
+    Persists TideTimelines in Redis, one set of hashes per location, shared by every worker.
+
+    Keys (for location "50.22,-4.80"):
+      tide:50.22,-4.80:extremes  hash epoch -> [type, height]
+      tide:50.22,-4.80:sea       hash epoch -> height
+      tide:50.22,-4.80:days      set of fetched "<kind>:<YYYY-MM-DD>" days
+
+    Recently used timelines are also kept in process (up to `local_size` locations); a day
+    missing locally is re-read from Redis before anything is fetched upstream.
+    """
+
+    def __init__(self, redis_client, prefix: str = "tide", ttl_seconds: int = 400 * 86400, local_size: int = 1024):
+        self.redis = redis_client
+        self.prefix = prefix
+        self.ttl_seconds = ttl_seconds
+        self.local_size = local_size
+        self._local: "OrderedDict[str, TideTimeline]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _keys(self, location: str) -> Tuple[str, str, str]:
+        base = f"{self.prefix}:{location}"
+        return f"{base}:extremes", f"{base}:sea", f"{base}:days"
+
+    def get(self, location: str, refresh: bool = False) -> TideTimeline:
+        """Return the timeline for `location`, reading it from Redis if not held locally (or if `refresh`)."""
+        with self._lock:
+            timeline = self._local.get(location)
+            if timeline is not None and not refresh:
+                self._local.move_to_end(location)
+                return timeline
+        try:
+            timeline = self._load(location)
+        except Exception as e:
+            # Without Redis the timeline only lives in this process.
+            print(f"Tide timeline store unavailable: {e}")
+            if timeline is not None:
+                return timeline
+            timeline = TideTimeline()
+        with self._lock:
+            self._local[location] = timeline
+            self._local.move_to_end(location)
+            while len(self._local) > self.local_size:
+                self._local.popitem(last=False)
+        return timeline
+
+    def _load(self, location: str) -> TideTimeline:
+        extremes_key, sea_key, days_key = self._keys(location)
+        pipe = self.redis.pipeline()
+        pipe.hgetall(extremes_key)
+        pipe.hgetall(sea_key)
+        pipe.smembers(days_key)
+        extremes, sea_levels, days = pipe.execute()
+        timeline = TideTimeline()
+        timeline._extremes.update((float(t), tuple(json.loads(v))) for t, v in extremes.items())
+        timeline._sea_levels.update((float(t), json.loads(v)) for t, v in sea_levels.items())
+        timeline.days.update(day.decode() if isinstance(day, bytes) else day for day in days)
+        timeline._rebuild()
+        return timeline
+
+    def save(self, location: str, kind: str, day, points: List[Tuple[float, Any]]):
+        """Persist points fetched for one day of one kind."""
+        extremes_key, sea_key, days_key = self._keys(location)
+        key = extremes_key if kind == EXTREMES else sea_key
+        pipe = self.redis.pipeline()
+        if points:
+            pipe.hset(key, mapping={repr(t): json.dumps(value) for t, value in points})
+        pipe.sadd(days_key, f"{kind}:{_day(day)}")
+        for name in (extremes_key, sea_key, days_key):
+            pipe.expire(name, self.ttl_seconds)
+        try:
+            pipe.execute()
+        except Exception as e:
+            print(f"Could not save tide timeline for {location}: {e}")
@@ -1,13 +1,11 @@
 #%%
 import os
 import arrow
-import requests
 from datetime import datetime, timedelta, timezone
 from typing import Dict, Any, List, Optional
 from dotenv import load_dotenv
-
-# Load environment variables from .env file.
-load_dotenv()
+from api_calls.stormglass import FetchJSON, get_json, location_key
+from api_calls.tide_timeline import EXTREMES, SEA_LEVEL, TideTimeline
 
 class TideAPIClient:
     """
@@ -27,6 +25,10 @@ class TideAPIClient:
       - maxHighTide: The highest tide height (for high tide events).
       - minLowTide: The lowest tide height (for low tide events).
 
+    With a timeline store (see api_calls.tide_timeline), fetched days are merged into a
+    per-location timeline and only days the timeline does not cover yet are requested, so
+    neighbouring days and repeat locations reuse earlier responses.
+
     The API key is read from the environment variable STORMGLASS_API_KEY.
     """
 
@@ -34,7 +36,11 @@ class TideAPIClient:
                  api_key: str = None, 
                  datum: str = "MSL", 
                  base_url_extremes: str = "https://api.stormglass.io/v2/tide/extremes/point",
-                 base_url_sea_level: str = "https://api.stormglass.io/v2/tide/sea-level/point"):
+                 base_url_sea_level: str = "https://api.stormglass.io/v2/tide/sea-level/point",
+                 fetch_json: Optional[FetchJSON] = None,
+                 timeline_store=None,
+                 location_decimals: int = 2,
+                 series_store=None):
         """
         Initialize the TideAPIClient.
 
@@ -43,6 +49,12 @@ class TideAPIClient:
             datum (str, optional): The datum to use (e.g., "MSL" or "MLLW"). Defaults to "MSL".
             base_url_extremes (str, optional): URL for the extremes endpoint.
             base_url_sea_level (str, optional): URL for the sea-level endpoint.
+            fetch_json (callable, optional): Function used to perform the HTTP requests
+                                             (see api_calls.stormglass.FetchJSON). Defaults to get_json.
+            timeline_store (RedisTideTimelineStore, optional): Store of per-location tide timelines.
+            location_decimals (int, optional): Decimal places identifying a timeline's location.
+            series_store (HourlySeriesStore, optional): Receives each fetched day's hourly sea
+                                                        levels (see hourly_series.py).
         """
         if api_key is None:
             api_key = os.getenv("STORMGLASS_API_KEY")
@@ -52,10 +64,14 @@ class TideAPIClient:
         self.datum = datum
         self.base_url_extremes = base_url_extremes
         self.base_url_sea_level = base_url_sea_level
+        self.fetch_json = fetch_json or get_json
+        self.timeline_store = timeline_store
+        self.location_decimals = location_decimals
+        self.series_store = series_store
 
-    def _query_extremes(self, start: arrow.Arrow, end: arrow.Arrow, lat: float, lon: float) -> List[Dict[str, Any]]:
+    def window_params(self, start: arrow.Arrow, end: arrow.Arrow, lat: float, lon: float) -> Dict[str, Any]:
         """
-        Query the extremes endpoint for the given period.
+        Build the query parameters shared by the extremes and sea-level endpoints.
 
         Args:
             start (arrow.Arrow): Start of the query period.
@@ -64,19 +80,34 @@ class TideAPIClient:
             lon (float): Longitude.
 
         Returns:
-            List[dict]: List of extreme tide events.
+            dict: Query parameters.
         """
-        params = {
+        return {
             'lat': lat,
             'lng': lon,
             'start': start.to('UTC').timestamp(),
             'end': end.to('UTC').timestamp(),
             'datum': self.datum
         }
-        response = requests.get(self.base_url_extremes, params=params,
-                                headers={'Authorization': self.api_key})
-        response.raise_for_status()
-        json_data = response.json()
+
+    @property
+    def headers(self) -> Dict[str, str]:
+        return {'Authorization': self.api_key}
+
+    def _query_extremes(self, start: arrow.Arrow, end: arrow.Arrow, lat: float, lon: float) -> List[Dict[str, Any]]:
+        """
+        Query the extremes endpoint for the given period.
+
+        Args:
+            start (arrow.Arrow): Start of the query period.
+            end (arrow.Arrow): End of the query period.
+            lat (float): Latitude.
+            lon (float): Longitude.
+
+        Returns:
+            List[dict]: List of extreme tide events.
+        """
+        json_data = self.fetch_json(self.base_url_extremes, self.window_params(start, end, lat, lon), self.headers)
         return json_data.get("data", [])
 
     def _query_sea_level(self, start: arrow.Arrow, end: arrow.Arrow, lat: float, lon: float) -> List[Dict[str, Any]]:
@@ -92,17 +123,7 @@ class TideAPIClient:
         Returns:
             List[dict]: List of sea level data points.
         """
-        params = {
-            'lat': lat,
-            'lng': lon,
-            'start': start.to('UTC').timestamp(),
-            'end': end.to('UTC').timestamp(),
-            'datum': self.datum
-        }
-        response = requests.get(self.base_url_sea_level, params=params,
-                                headers={'Authorization': self.api_key})
-        response.raise_for_status()
-        json_data = response.json()
+        json_data = self.fetch_json(self.base_url_sea_level, self.window_params(start, end, lat, lon), self.headers)
         return json_data.get("data", [])
 
     def _get_most_recent_high_tide(self, target: datetime, extremes: List[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
@@ -162,11 +183,131 @@ class TideAPIClient:
         Returns:
             dict: A dictionary with keys "currentTideHeight", "tideHour", "maxHighTide", and "minLowTide".
         """
+        if self.timeline_store is not None:
+            return self._get_tide_data_from_timeline(timestamp, lat, lon)
         start = arrow.get(timestamp).floor('day')
         end = arrow.get(timestamp).shift(days=1).floor('day')
         extremes = self._query_extremes(start, end, lat, lon)
         sea_levels = self._query_sea_level(start, end, lat, lon)
+        self.store_series(sea_levels, timestamp, lat, lon)
+        prev_extremes = None
+        if self.needs_previous_day(timestamp, extremes):
+            # Query previous day if no high tide is found in current day.
+            prev_extremes = self._query_extremes(start.shift(days=-1), start, lat, lon)
+        return self.compute_tide_data(timestamp, extremes, sea_levels, prev_extremes)
+
+    def _get_tide_data_from_timeline(self, timestamp: datetime, lat: float, lon: float) -> Dict[str, Any]:
+        """get_tide_data using the location's timeline, fetching only the days it lacks."""
+        cached = self.cached_tide_data(timestamp, lat, lon)
+        if cached is not None:
+            return cached
+        location = location_key(lat, lon, self.location_decimals)
+        timeline = self.timeline_store.get(location)
+        start = arrow.get(timestamp).floor('day')
+        end = start.shift(days=1)
+        if not timeline.covers(EXTREMES, start):
+            self._remember(location, timeline, EXTREMES, start,
+                           TideTimeline.extreme_points(self._query_extremes(start, end, lat, lon)))
+        if not timeline.covers(SEA_LEVEL, start):
+            sea_levels = self._query_sea_level(start, end, lat, lon)
+            self.store_series(sea_levels, timestamp, lat, lon)
+            self._remember(location, timeline, SEA_LEVEL, start, TideTimeline.sea_level_points(sea_levels))
+        previous = start.shift(days=-1)
+        if timeline.needs_previous_day(timestamp) and not timeline.covers(EXTREMES, previous):
+            self._remember(location, timeline, EXTREMES, previous,
+                           TideTimeline.extreme_points(self._query_extremes(previous, start, lat, lon)))
+        return timeline.tide_data(timestamp)
 
+    def _remember(self, location: str, timeline: TideTimeline, kind: str, day: arrow.Arrow, points):
+        timeline.merge(kind, day, points)
+        self.timeline_store.save(location, kind, day, points)
+
+    def cached_tide_data(self, timestamp: datetime, lat: float, lon: float) -> Optional[Dict[str, Any]]:
+        """
+        Compute the tide values from the stored timeline alone.
+
+        Returns:
+            dict or None: The values, or None if there is no timeline store or it lacks a day
+                          they depend on.
+        """
+        if self.timeline_store is None:
+            return None
+        location = location_key(lat, lon, self.location_decimals)
+        timeline = self.timeline_store.get(location)
+        if not self._timeline_covers(timeline, timestamp):
+            # Another worker may have fetched the day since this process loaded the timeline.
+            timeline = self.timeline_store.get(location, refresh=True)
+            if not self._timeline_covers(timeline, timestamp):
+                return None
+        return timeline.tide_data(timestamp)
+
+    @staticmethod
+    def _timeline_covers(timeline: TideTimeline, timestamp: datetime) -> bool:
+        day = arrow.get(timestamp).floor('day')
+        if not (timeline.covers(EXTREMES, day) and timeline.covers(SEA_LEVEL, day)):
+            return False
+        return not timeline.needs_previous_day(timestamp) or timeline.covers(EXTREMES, day.shift(days=-1))
+
+    def remember(self, timestamp: datetime, lat: float, lon: float, extremes: List[Dict[str, Any]],
+                 sea_levels: List[Dict[str, Any]], prev_extremes: Optional[List[Dict[str, Any]]] = None):
+        """
+        Add responses fetched outside this client (e.g. by the async engine) to the location's timeline.
+
+        Args:
+            timestamp (datetime): The target time the day windows were fetched for.
+            lat (float): Latitude.
+            lon (float): Longitude.
+            extremes (List[dict]): Extremes for the day of the timestamp.
+            sea_levels (List[dict]): Hourly sea levels for the day of the timestamp.
+            prev_extremes (List[dict], optional): Extremes for the previous day, if fetched.
+        """
+        if self.timeline_store is None:
+            return
+        location = location_key(lat, lon, self.location_decimals)
+        timeline = self.timeline_store.get(location)
+        start = arrow.get(timestamp).floor('day')
+        self._remember(location, timeline, EXTREMES, start, TideTimeline.extreme_points(extremes))
+        self._remember(location, timeline, SEA_LEVEL, start, TideTimeline.sea_level_points(sea_levels))
+        if prev_extremes is not None:
+            self._remember(location, timeline, EXTREMES, start.shift(days=-1),
+                           TideTimeline.extreme_points(prev_extremes))
+
+    def store_series(self, sea_levels: List[Dict[str, Any]], timestamp: datetime, lat: float, lon: float):
+        """Pass a day's hourly sea levels (indexed by UTC hour) to the series store, if there is one."""
+        if self.series_store is None:
+            return
+        day_start = arrow.get(timestamp).floor('day')
+        hourly = [None] * 24
+        for point in sea_levels:
+            seconds = (arrow.get(point["time"]) - day_start).total_seconds()
+            if 0 <= seconds < 24 * 3600 and not seconds % 3600 and point.get("sg") is not None:
+                hourly[int(seconds // 3600)] = float(point["sg"])
+        self.series_store.save(lat, lon, timestamp, "seaLevel", {"seaLevel": hourly})
+
+    def needs_previous_day(self, timestamp: datetime, extremes: List[Dict[str, Any]]) -> bool:
+        """
+        Return True if no high tide at or before the timestamp appears in the day's extremes,
+        in which case the previous day's extremes are needed to compute tideHour.
+        """
+        target_dt = timestamp if timestamp.tzinfo else timestamp.replace(tzinfo=timezone.utc)
+        return self._get_most_recent_high_tide(target_dt, extremes) is None
+
+    def compute_tide_data(self, timestamp: datetime, extremes: List[Dict[str, Any]],
+                          sea_levels: List[Dict[str, Any]],
+                          prev_extremes: Optional[List[Dict[str, Any]]] = None) -> Dict[str, Any]:
+        """
+        Compute the tide values from already-fetched extremes and sea-level data.
+
+        Args:
+            timestamp (datetime): The target time (UTC). If naive, assumed UTC.
+            extremes (List[dict]): Extremes for the day of the timestamp.
+            sea_levels (List[dict]): Hourly sea levels for the day of the timestamp.
+            prev_extremes (List[dict], optional): Extremes for the previous day, used for tideHour
+                                                  when the day has no earlier high tide.
+
+        Returns:
+            dict: A dictionary with keys "currentTideHeight", "tideHour", "maxHighTide", and "minLowTide".
+        """
         # 1. currentTideHeight: find the sea level data point closest to target time.
         current_tide_height = None
         if sea_levels:
@@ -179,11 +320,7 @@ class TideAPIClient:
         # 2. tideHour: compute hours since the most recent high tide.
         target_dt = timestamp if timestamp.tzinfo else timestamp.replace(tzinfo=timezone.utc)
         recent_high = self._get_most_recent_high_tide(target_dt, extremes)
-        if recent_high is None:
-            # Query previous day if no high tide is found in current day.
-            prev_start = start.shift(days=-1)
-            prev_end = start
-            prev_extremes = self._query_extremes(prev_start, prev_end, lat, lon)
+        if recent_high is None and prev_extremes:
             recent_high = self._get_most_recent_high_tide(target_dt, prev_extremes)
         tide_hour = None
         if recent_high:
@@ -211,6 +348,8 @@ class TideAPIClient:
         }
 
 if __name__ == "__main__":
+    # Load environment variables from .env file.
+    load_dotenv()
     from datetime import datetime
     # Example usage with a fixed date.
     test_date = datetime.strptime("2023-09-16", "%Y-%m-%d")
@@ -1,14 +1,20 @@
 #%%
 import os
 import arrow
-import requests
 import math
 from datetime import datetime
-from typing import Dict, Optional
+from typing import Any, Dict, List, Optional
 from dotenv import load_dotenv
+from api_calls.stormglass import FetchJSON, get_json
 
-# Load environment variables from .env file
-load_dotenv()
+# Weather parameters requested from Stormglass and returned by get_weather_data.
+WEATHER_PARAMS = [
+    "airTemperature", "pressure", "cloudCover", "currentDirection", "currentSpeed",
+    "swellDirection", "swellHeight", "swellPeriod", "secondarySwellPeriod", "secondarySwellDirection",
+    "secondarySwellHeight", "waveDirection", "waveHeight", "wavePeriod",
+    "windWaveDirection", "windWaveHeight", "windWavePeriod",
+    "windDirection", "windSpeed", "gust"
+]
 
 class WeatherAPIClient:
     """
@@ -23,7 +29,8 @@ class WeatherAPIClient:
         base_url (str): The base URL for the Stormglass weather endpoint.
     """
     
-    def __init__(self, api_key: Optional[str] = None, base_url: str = "https://api.stormglass.io/v2/weather/point"):
+    def __init__(self, api_key: Optional[str] = None, base_url: str = "https://api.stormglass.io/v2/weather/point",
+                 fetch_json: Optional[FetchJSON] = None, series_store=None):
         """
         Initialize the WeatherAPIClient.
         
@@ -35,6 +42,10 @@ class WeatherAPIClient:
                                      read from the environment.
             base_url (str, optional): The Stormglass weather endpoint URL.
                                       Defaults to "https://api.stormglass.io/v2/weather/point".
+            fetch_json (callable, optional): Function used to perform the HTTP request
+                                             (see api_calls.stormglass.FetchJSON). Defaults to get_json.
+            series_store (HourlySeriesStore, optional): Receives the day's hourly values from each
+                                                        response (see hourly_series.py).
         """
         if api_key is None:
             api_key = os.getenv("STORMGLASS_API_KEY")
@@ -42,6 +53,8 @@ class WeatherAPIClient:
             raise ValueError("API key is not set. Please set STORMGLASS_API_KEY in your environment.")
         self.api_key = api_key
         self.base_url = base_url
+        self.fetch_json = fetch_json or get_json
+        self.series_store = series_store
 
     def _select_value(self, data: Dict) -> Optional[float]:
         """
@@ -67,57 +80,43 @@ class WeatherAPIClient:
                 continue
         return None
 
-    def get_weather_data(self, timestamp: datetime, lat: float, lon: float) -> Dict:
+    def request_params(self, timestamp: datetime, lat: float, lon: float) -> Dict[str, Any]:
         """
-        Fetch weather data for a given timestamp and geographic coordinates.
-        
-        This method:
-          1. Determines the start and end times (full day) using Arrow.
-          2. Sends a GET request to the Stormglass API with the desired parameters.
-          3. Finds the hourly data entry closest in time to the provided timestamp.
-          4. Extracts and returns a subset of weather parameters.
-        
-        Desired parameters include air temperature, pressure, cloud cover, current and swell data,
-        wave data, wind direction/speed, gust, etc.
-        
+        Build the query parameters for a full day of weather data around the timestamp.
+
         Args:
             timestamp (datetime): The timestamp for which weather data is desired.
             lat (float): Latitude of the location.
             lon (float): Longitude of the location.
-        
+
         Returns:
-            dict: A dictionary containing the selected weather parameters and their values.
+            dict: Query parameters for the weather endpoint.
         """
         start = arrow.get(timestamp).floor('day')
         end = arrow.get(timestamp).ceil('day')
-        
-        params_list = [
-            "airTemperature", "pressure", "cloudCover", "currentDirection", "currentSpeed",
-            "swellDirection", "swellHeight", "swellPeriod", "secondarySwellPeriod", "secondarySwellDirection",
-            "secondarySwellHeight", "waveDirection", "waveHeight", "wavePeriod",
-            "windWaveDirection", "windWaveHeight", "windWavePeriod",
-            "windDirection", "windSpeed", "gust"
-        ]
-        
-        params_str = ",".join(params_list)
-        
-        response = requests.get(
-            self.base_url,
-            params={
-                'lat': lat,
-                'lng': lon,
-                'params': params_str,
-                'start': start.to('UTC').timestamp(),
-                'end': end.to('UTC').timestamp()
-            },
-            headers={
-                'Authorization': self.api_key
-            }
-        )
-        
-        response.raise_for_status()
-        json_data = response.json()
-        
+        return {
+            'lat': lat,
+            'lng': lon,
+            'params': ",".join(WEATHER_PARAMS),
+            'start': start.to('UTC').timestamp(),
+            'end': end.to('UTC').timestamp()
+        }
+
+    @property
+    def headers(self) -> Dict[str, str]:
+        return {'Authorization': self.api_key}
+
+    def extract_weather(self, json_data: Dict[str, Any], timestamp: datetime) -> Dict:
+        """
+        Select the hourly entry closest to the timestamp and extract the weather parameters.
+
+        Args:
+            json_data (dict): Decoded response from the weather endpoint.
+            timestamp (datetime): The timestamp for which weather data is desired.
+
+        Returns:
+            dict: The selected weather parameters and their values, or {} if no hours were returned.
+        """
         target = arrow.get(timestamp)
         closest_hour = None
         min_diff = None
@@ -132,7 +131,7 @@ class WeatherAPIClient:
             return {}
         
         result = {}
-        for key in params_list:
+        for key in WEATHER_PARAMS:
             if key in closest_hour:
                 result[key] = self._select_value(closest_hour[key])
             else:
@@ -140,7 +139,61 @@ class WeatherAPIClient:
         
         return result
 
+    def hourly_series(self, json_data: Dict[str, Any], timestamp: datetime) -> Dict[str, List[Optional[float]]]:
+        """
+        Extract every hour of the response's day, as parameter -> 24 values indexed by hour (UTC).
+
+        Args:
+            json_data (dict): Decoded response from the weather endpoint.
+            timestamp (datetime): Any time on the requested day.
+
+        Returns:
+            dict: WEATHER_PARAMS values per hour, None where the response has no value.
+        """
+        day_start = arrow.get(timestamp).floor('day')
+        series = {key: [None] * 24 for key in WEATHER_PARAMS}
+        for hour in json_data.get("hours", []):
+            seconds = (arrow.get(hour["time"]) - day_start).total_seconds()
+            if seconds < 0 or seconds >= 24 * 3600 or seconds % 3600:
+                continue
+            for key in WEATHER_PARAMS:
+                if key in hour:
+                    series[key][int(seconds // 3600)] = self._select_value(hour[key])
+        return series
+
+    def store_series(self, json_data: Dict[str, Any], timestamp: datetime, lat: float, lon: float):
+        """Pass the response's hourly values to the series store, if there is one."""
+        if self.series_store is not None:
+            self.series_store.save(lat, lon, timestamp, "weather", self.hourly_series(json_data, timestamp))
+
+    def get_weather_data(self, timestamp: datetime, lat: float, lon: float) -> Dict:
+        """
+        Fetch weather data for a given timestamp and geographic coordinates.
+        
+        This method:
+          1. Determines the start and end times (full day) using Arrow.
+          2. Sends a GET request to the Stormglass API with the desired parameters.
+          3. Finds the hourly data entry closest in time to the provided timestamp.
+          4. Extracts and returns a subset of weather parameters.
+        
+        Desired parameters include air temperature, pressure, cloud cover, current and swell data,
+        wave data, wind direction/speed, gust, etc.
+        
+        Args:
+            timestamp (datetime): The timestamp for which weather data is desired.
+            lat (float): Latitude of the location.
+            lon (float): Longitude of the location.
+        
+        Returns:
+            dict: A dictionary containing the selected weather parameters and their values.
+        """
+        json_data = self.fetch_json(self.base_url, self.request_params(timestamp, lat, lon), self.headers)
+        self.store_series(json_data, timestamp, lat, lon)
+        return self.extract_weather(json_data, timestamp)
+
 if __name__ == "__main__":
+    # Load environment variables from .env file.
+    load_dotenv()
     # Example usage:
     test_date = datetime.strptime("2023-09-16", "%Y-%m-%d")
     lat, lon = 50.220564, -4.801677
@@ -0,0 +1,372 @@
+#%%
+import argparse
+import json
+import math
+import os
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from api_calls.locations import location_key
+from api_calls.weather import WEATHER_PARAMS, WeatherAPIClient
+
+META_FILE = "meta.json"
+DATA_FILE = "data.f32"
+
+# Circular parameters are interpolated as unit vectors so 350° and 10° average to 0°, not 180°.
+DIRECTION_PARAMS = frozenset(param for param in WEATHER_PARAMS if param.endswith("Direction"))
+
+def _epoch_seconds(timestamp) -> float:
+    """Seconds since the epoch for a datetime (naive datetimes are taken as UTC) or a number."""
+    if isinstance(timestamp, datetime):
+        if timestamp.tzinfo is None:
+            timestamp = timestamp.replace(tzinfo=timezone.utc)
+        return timestamp.timestamp()
+    return float(timestamp)
+
+class GridWeatherStore:
+    """
+    Gridded weather values in a memory-mapped float32 array indexed by (time, lat, lon, param).
+
+    The grid is regular: times start at `time_start` (epoch seconds) and advance by `time_step`
+    seconds, latitudes and longitudes by a fixed step (which may be negative, as in most
+    reanalysis files). Longitudes are matched modulo 360, so a grid stored as 0..360 answers
+    -180..180 positions and vice versa, and a grid spanning the whole globe wraps from its last
+    column to its first. All parameters of one cell are adjacent on disk, so a point lookup touches
+    a single page and the OS page cache keeps hot regions in memory. Missing values (land cells,
+    parameters the source does not provide) are NaN.
+
+    A store is a directory holding meta.json and data.f32; build one with create() and write(),
+    or with `python -m api_calls.weather_grid ingest` from a NetCDF file.
+    """
+
+    def __init__(self, path: str, mode: str = "r"):
+        """
+        Open an existing store.
+
+        Args:
+            path (str): Store directory.
+            mode (str, optional): numpy memmap mode; "r" (default) for lookups, "r+" to write.
+        """
+        with open(os.path.join(path, META_FILE)) as f:
+            self.meta = json.load(f)
+        self.path = path
+        self.params: List[str] = self.meta["params"]
+        self.data = np.memmap(os.path.join(path, DATA_FILE), dtype=np.float32, mode=mode, shape=self.shape)
+
+    @property
+    def shape(self) -> Tuple[int, int, int, int]:
+        meta = self.meta
+        return meta["n_times"], meta["n_lat"], meta["n_lon"], len(meta["params"])
+
+    @classmethod
+    def create(cls, path: str, time_start: float, time_step: float, n_times: int,
+               lat_start: float, lat_step: float, n_lat: int,
+               lon_start: float, lon_step: float, n_lon: int,
+               params: Sequence[str] = WEATHER_PARAMS) -> "GridWeatherStore":
+        """
+        Create an empty (all-NaN) store and return it opened for writing.
+
+        Args:
+            path (str): Store directory (created if missing).
+            time_start (float): Epoch seconds of the first time step.
+            time_step (float): Seconds between time steps (3600 for hourly data).
+            n_times (int): Number of time steps.
+            lat_start, lat_step, n_lat: First latitude, spacing in degrees and count.
+            lon_start, lon_step, n_lon: First longitude, spacing in degrees and count.
+            params (list, optional): Parameter names stored. Defaults to WEATHER_PARAMS.
+        """
+        os.makedirs(path, exist_ok=True)
+        meta = {
+            "params": list(params),
+            "time_start": float(time_start), "time_step": float(time_step), "n_times": int(n_times),
+            "lat_start": float(lat_start), "lat_step": float(lat_step), "n_lat": int(n_lat),
+            "lon_start": float(lon_start), "lon_step": float(lon_step), "n_lon": int(n_lon),
+        }
+        with open(os.path.join(path, META_FILE), "w") as f:
+            json.dump(meta, f, indent=2)
+        data = np.memmap(os.path.join(path, DATA_FILE), dtype=np.float32, mode="w+",
+                         shape=(n_times, n_lat, n_lon, len(params)))
+        data[:] = np.nan
+        data.flush()
+        del data
+        return cls(path, mode="r+")
+
+    def write(self, param: str, values: np.ndarray, time_offset: int = 0):
+        """Write a (time, lat, lon) block of one parameter starting at time index `time_offset`."""
+        values = np.asarray(values, dtype=np.float32)
+        self.data[time_offset:time_offset + values.shape[0], :, :, self.params.index(param)] = values
+
+    def flush(self):
+        self.data.flush()
+
+    def lookup(self, timestamps: Sequence[Any], lats: Sequence[float], lons: Sequence[float],
+               method: str = "linear") -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Look up every parameter for many points at once.
+
+        The time is the nearest grid step (as the Stormglass client picks the closest hour). In
+        space, "nearest" takes the closest cell and "linear" interpolates bilinearly between the
+        four surrounding cells, ignoring NaN neighbours.
+
+        Args:
+            timestamps (list): datetimes (naive means UTC) or epoch seconds.
+            lats (list): Latitudes.
+            lons (list): Longitudes.
+            method (str, optional): "linear" (default) or "nearest".
+
+        Returns:
+            tuple: (values, covered) where values has shape (n, len(params)) with NaN for missing
+                   data, and covered is a boolean array marking the points inside the grid.
+        """
+        times = np.array([_epoch_seconds(t) for t in timestamps], dtype=np.float64)
+        lats = np.asarray(lats, dtype=np.float64)
+        lons = np.asarray(lons, dtype=np.float64)
+        n_times, n_lat, n_lon, n_params = self.shape
+
+        t_index = np.rint((times - self.meta["time_start"]) / self.meta["time_step"])
+        lat_pos = (lats - self.meta["lat_start"]) / self.meta["lat_step"]
+        lon_step = self.meta["lon_step"]
+        # Columns from the first one eastwards (westwards for a negative step), modulo 360.
+        lon_pos = ((lons - self.meta["lon_start"]) * np.sign(lon_step)) % 360.0 / abs(lon_step)
+        wraps = math.isclose(n_lon * abs(lon_step), 360.0)
+        if wraps:
+            lon_pos = lon_pos % n_lon
+            lon_inside = np.ones(len(lons), dtype=bool)
+        else:
+            # Just before the first column rather than far past the last.
+            lon_pos = np.where(lon_pos > n_lon - 0.5, lon_pos - 360.0 / abs(lon_step), lon_pos)
+            lon_inside = (lon_pos >= -0.5) & (lon_pos <= n_lon - 0.5)
+        covered = ((t_index >= 0) & (t_index < n_times)
+                   & (lat_pos >= -0.5) & (lat_pos <= n_lat - 0.5) & lon_inside)
+        values = np.full((len(times), n_params), np.nan, dtype=np.float64)
+        if not covered.any():
+            return values, covered
+
+        t = t_index[covered].astype(np.intp)
+        lat_pos, lon_pos = lat_pos[covered], lon_pos[covered]
+        if method == "nearest" or n_lat < 2 or n_lon < 2:
+            i = np.clip(np.rint(lat_pos), 0, n_lat - 1).astype(np.intp)
+            if wraps:
+                j = np.rint(lon_pos).astype(np.intp) % n_lon
+            else:
+                j = np.clip(np.rint(lon_pos), 0, n_lon - 1).astype(np.intp)
+            values[covered] = self.data[t, i, j]
+            return values, covered
+
+        i0 = np.clip(np.floor(lat_pos), 0, n_lat - 2).astype(np.intp)
+        if wraps:
+            # Between the last column and the first, j1 wraps around to 0.
+            j0 = np.floor(lon_pos).astype(np.intp)
+            j1 = (j0 + 1) % n_lon
+        else:
+            j0 = np.clip(np.floor(lon_pos), 0, n_lon - 2).astype(np.intp)
+            j1 = j0 + 1
+        wi = np.clip(lat_pos - i0, 0.0, 1.0)[:, None]
+        wj = np.clip(lon_pos - j0, 0.0, 1.0)[:, None]
+        corners = [(self.data[t, i0, j0], (1 - wi) * (1 - wj)),
+                   (self.data[t, i0 + 1, j0], wi * (1 - wj)),
+                   (self.data[t, i0, j1], (1 - wi) * wj),
+                   (self.data[t, i0 + 1, j1], wi * wj)]
+        direction = np.array([param in DIRECTION_PARAMS for param in self.params])
+        total = np.zeros((len(t), n_params))
+        sin_total = np.zeros((len(t), n_params))
+        cos_total = np.zeros((len(t), n_params))
+        weight_total = np.zeros((len(t), n_params))
+        for corner, weight in corners:
+            valid = ~np.isnan(corner)
+            weight = np.where(valid, weight, 0.0)
+            filled = np.where(valid, corner, 0.0)
+            total += weight * filled
+            radians = np.radians(filled)
+            sin_total += weight * np.sin(radians)
+            cos_total += weight * np.cos(radians)
+            weight_total += weight
+        with np.errstate(invalid="ignore", divide="ignore"):
+            interpolated = np.where(weight_total > 0, total / weight_total, np.nan)
+            angles = np.degrees(np.arctan2(sin_total, cos_total)) % 360.0
+        interpolated[:, direction] = np.where(weight_total[:, direction] > 0, angles[:, direction], np.nan)
+        values[covered] = interpolated
+        return values, covered
+
+class GridWeatherClient:
+    """
+    Weather client that answers from a local GridWeatherStore and falls back to Stormglass.
+
+    Points inside the grid (with at least one parameter available) are served from the
+    memory-mapped store with no API call, and the grid's hours for their day go to the series
+    store as a Stormglass response's would; everything else goes to the wrapped
+    WeatherAPIClient. A grid lacking some WEATHER_PARAMS (ingested with only a few variables)
+    cannot answer alone: its points are still fetched from Stormglass, and the grid's values
+    replace Stormglass's where it has them. Returns the same parameters as
+    WeatherAPIClient.get_weather_data.
+    """
+
+    def __init__(self, store: GridWeatherStore, fallback: Optional[WeatherAPIClient] = None,
+                 method: str = "linear", series_store=None):
+        """
+        Args:
+            store (GridWeatherStore): The gridded data.
+            fallback (WeatherAPIClient, optional): Client used outside the grid. Without one,
+                                                   uncovered points return {}.
+            method (str, optional): Spatial lookup, "linear" or "nearest".
+            series_store (HourlySeriesStore, optional): Receives the grid's hourly values.
+                                                        Defaults to the fallback's.
+        """
+        self.store = store
+        self.fallback = fallback
+        self.method = method
+        self.series_store = series_store if series_store is not None else getattr(fallback, "series_store", None)
+        self.missing_params = [param for param in WEATHER_PARAMS if param not in store.params]
+        self._columns = {param: store.params.index(param) for param in WEATHER_PARAMS if param in store.params}
+
+    def lookup_many(self, timestamps: Sequence[Any], lats: Sequence[float],
+                    lons: Sequence[float]) -> List[Optional[Dict[str, Optional[float]]]]:
+        """
+        Vectorized grid lookup for many points.
+
+        Returns:
+            list: For each point, a dict of WEATHER_PARAMS values, or None if the grid has no
+                  data there (so the caller should use Stormglass).
+        """
+        values, covered = self.store.lookup(timestamps, lats, lons, self.method)
+        results = []
+        for row, inside in zip(values, covered):
+            results.append(self._row_values(row) if inside and not np.isnan(row).all() else None)
+        return results
+
+    def _row_values(self, row: np.ndarray) -> Dict[str, Optional[float]]:
+        result = {}
+        for param in WEATHER_PARAMS:
+            value = row[self._columns[param]] if param in self._columns else math.nan
+            result[param] = None if math.isnan(value) else float(value)
+        return result
+
+    @staticmethod
+    def merge(grid_values: Dict[str, Optional[float]], fallback_values: Optional[Dict]) -> Dict[str, Optional[float]]:
+        """The grid's values, with the fallback's for the parameters the grid has no value for."""
+        fallback_values = fallback_values or {}
+        return {param: grid_values.get(param) if grid_values.get(param) is not None else fallback_values.get(param)
+                for param in WEATHER_PARAMS}
+
+    def store_series(self, points: Sequence[Tuple[Any, float, float]]):
+        """
+        Pass the grid's 24 hourly values for the UTC day of each (timestamp, lat, lon) point to
+        the series store, once per location cell and day.
+        """
+        if self.series_store is None or not points:
+            return
+        days = {}
+        for timestamp, lat, lon in points:
+            day_start = _epoch_seconds(timestamp) // 86400 * 86400
+            days.setdefault((location_key(lat, lon, self.series_store.decimals), day_start), (timestamp, lat, lon))
+        hours = range(24)
+        times = [day_start + hour * 3600 for _, day_start in days for hour in hours]
+        lats = [lat for _, lat, _ in days.values() for _ in hours]
+        lons = [lon for _, _, lon in days.values() for _ in hours]
+        values, covered = self.store.lookup(times, lats, lons, self.method)
+        for index, (timestamp, lat, lon) in enumerate(days.values()):
+            rows = [self._row_values(row) if inside else {}
+                    for row, inside in zip(values[index * 24:(index + 1) * 24], covered[index * 24:(index + 1) * 24])]
+            series = {param: [row.get(param) for row in rows] for param in WEATHER_PARAMS}
+            self.series_store.save(lat, lon, timestamp, "weather", series)
+
+    def get_weather_data_many(self, points: Sequence[Tuple[Any, float, float]]) -> List[Dict]:
+        """
+        Weather data for many (timestamp, lat, lon) points: one vectorized grid lookup, then a
+        Stormglass call for each point outside the grid (or for every point, merged with the
+        grid's values, when the grid lacks some parameters).
+        """
+        if not points:
+            return []
+        timestamps, lats, lons = zip(*points)
+        results = self.lookup_many(timestamps, lats, lons)
+        served = []
+        for index, result in enumerate(results):
+            if result is None:
+                results[index] = self.fallback.get_weather_data(*points[index]) if self.fallback else {}
+            elif self.missing_params and self.fallback:
+                # Stormglass also stores the day's series for these points.
+                results[index] = self.merge(result, self.fallback.get_weather_data(*points[index]))
+            else:
+                served.append(points[index])
+        self.store_series(served)
+        return results
+
+    def get_weather_data(self, timestamp: datetime, lat: float, lon: float) -> Dict:
+        """Same contract as WeatherAPIClient.get_weather_data."""
+        return self.get_weather_data_many([(timestamp, lat, lon)])[0]
+
+def ingest_netcdf(source: str, store_path: str, variables: Dict[str, str], chunk_size: int = 24) -> GridWeatherStore:
+    """
+    Build a store from a gridded NetCDF file (e.g. a reanalysis or forecast download).
+
+    The file needs 1-D time (or valid_time, as in current ERA5 downloads), latitude and
+    longitude coordinates on a regular grid. Values must already be in the units Stormglass
+    returns (m, s, degrees, hPa, m/s, °C). Requires xarray with a NetCDF engine
+    (pip install xarray netCDF4).
+
+    Args:
+        source (str): NetCDF file path.
+        store_path (str): Directory of the store to create.
+        variables (dict): Maps weather parameters to variable names in the file, e.g.
+                          {"waveHeight": "swh"}. Unmapped parameters stay NaN (missing).
+        chunk_size (int, optional): Time steps copied per block, bounding memory use.
+    """
+    try:
+        import xarray as xr
+    except ImportError:
+        raise RuntimeError("Ingesting NetCDF files requires xarray (pip install xarray netCDF4).")
+
+    dataset = xr.open_dataset(source)
+    time_name = "time" if "time" in dataset.coords else "valid_time"
+    lat_name = "latitude" if "latitude" in dataset.coords else "lat"
+    lon_name = "longitude" if "longitude" in dataset.coords else "lon"
+    axes = {}
+    for name, coordinate in (("time", dataset[time_name].values.astype("datetime64[s]").astype(np.float64)),
+                             ("lat", dataset[lat_name].values.astype(np.float64)),
+                             ("lon", dataset[lon_name].values.astype(np.float64))):
+        steps = np.diff(coordinate)
+        if len(coordinate) > 1 and not np.allclose(steps, steps[0]):
+            raise ValueError(f"The {name} axis of {source} is not regularly spaced.")
+        axes[name] = (coordinate[0], steps[0] if len(steps) else 1.0, len(coordinate))
+
+    store = GridWeatherStore.create(store_path, *axes["time"], *axes["lat"], *axes["lon"])
+    n_times = axes["time"][2]
+    for param, variable in variables.items():
+        array = dataset[variable].transpose(time_name, lat_name, lon_name)
+        for start in range(0, n_times, chunk_size):
+            store.write(param, array[start:start + chunk_size].values, time_offset=start)
+    store.flush()
+    return store
+
+def main():
+    parser = argparse.ArgumentParser(description="Build or inspect a gridded weather store.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    ingest = subparsers.add_parser("ingest", help="Create a store from a NetCDF file.")
+    ingest.add_argument("source", help="NetCDF file.")
+    ingest.add_argument("store", help="Store directory to create (WEATHER_GRID_DIR).")
+    ingest.add_argument("--var", action="append", default=[], metavar="PARAM=VARIABLE",
+                        help="Map a weather parameter to a variable in the file (repeatable).")
+    info = subparsers.add_parser("info", help="Describe an existing store.")
+    info.add_argument("store", help="Store directory.")
+    args = parser.parse_args()
+
+    if args.command == "ingest":
+        variables = dict(mapping.split("=", 1) for mapping in args.var)
+        unknown = set(variables) - set(WEATHER_PARAMS)
+        if unknown:
+            parser.error(f"Unknown weather parameters: {', '.join(sorted(unknown))}")
+        store = ingest_netcdf(args.source, args.store, variables)
+    else:
+        store = GridWeatherStore(args.store)
+    meta = store.meta
+    first = datetime.fromtimestamp(meta["time_start"], timezone.utc)
+    last = datetime.fromtimestamp(meta["time_start"] + meta["time_step"] * (meta["n_times"] - 1), timezone.utc)
+    print(f"{store.path}: {meta['n_times']} steps {first:%Y-%m-%d %H:%M} .. {last:%Y-%m-%d %H:%M}, "
+          f"{meta['n_lat']} x {meta['n_lon']} cells from ({meta['lat_start']}, {meta['lon_start']}) "
+          f"step ({meta['lat_step']}, {meta['lon_step']})")
+
+if __name__ == "__main__":
+    main()
@@ -1,14 +1,24 @@
 from flask import Flask, request, jsonify, g, render_template, redirect, url_for
 from datetime import datetime, timedelta
 import jwt
+import os
 import traceback
+import uuid
 from functools import wraps
-from models import db, User, EnvironmentData
-from celery_app import flask_app, celery
-from tasks import fetch_env_data
+from models import db, User, EnvironmentData, ConditionProfile
+from celery_app import get_flask_app, celery
+from queues import enqueue_enrichment, admission_decision, BULK_QUEUE
+from ratelimit import rate_limited
+from db_routing import read_only
+from purge import record_filter_conditions, delete_records_returning, InvalidFilterError
+from profiles import profile_summary
+from hourly_series import context_window
+from importer import detect_format, ImportFormatError, IMPORT_FORMATS
+import profiling
+from profiling import stage
 
-app = flask_app
-app.config['SECRET_KEY'] = 'your-secret-key'  # Change for production!
+app = get_flask_app()
+profiling.init_app(app)
 
 def token_required(f):
     @wraps(f)
@@ -81,8 +91,16 @@ def login():
 # Endpoint to submit a timestamp and coordinates (associates the record with the current user).
 @app.route('/submit_timestamp', methods=['POST'])
 @token_required
+@rate_limited('submit')
 def submit_timestamp():
     try:
+        # While the enrichment backlog is over its limit, either refuse new submissions or
+        # store them as deferred for the admit_deferred job to queue later.
+        admission = admission_decision()
+        if admission == 'shed':
+            return (jsonify({'message': 'Server busy. Try again later.'}), 503,
+                    {'Retry-After': str(app.config['ADMISSION_RETRY_AFTER'])})
+        
         data = request.get_json()
         timestamp_str = data.get('timestamp')
         timestamp = datetime.fromisoformat(timestamp_str)
@@ -98,13 +116,18 @@ def submit_timestamp():
         env_data = EnvironmentData(timestamp=timestamp,
                                      latitude=lat,
                                      longitude=lng,
-                                     status='pending',
+                                     status='deferred' if admission == 'defer' else 'pending',
                                      user_id=current_user.id)
         db.session.add(env_data)
         db.session.commit()
+        if env_data.status == 'deferred':
+            return jsonify({'message': 'Data accepted; enrichment deferred', 'id': env_data.id}), 202
         
-        # Queue the task for processing.
-        fetch_env_data.apply_async(args=[env_data.id])
+        # Queue the task on the high-priority live queue (by name, so the web process never
+        # imports the API clients). With the async backend the record stays pending until an
+        # async worker claims it.
+        if app.config['ENRICHMENT_BACKEND'] == 'celery':
+            enqueue_enrichment(env_data.id, priority='live', location=(env_data.latitude, env_data.longitude))
         return jsonify({'message': 'Data pending', 'id': env_data.id}), 202
     except Exception as e:
         print("Error occurred:", e)
@@ -114,23 +137,87 @@ def submit_timestamp():
 # Endpoint for a user to view their own EnvironmentData.
 @app.route('/my_data', methods=['GET'])
 @token_required
+@read_only
 def my_data():
     current_user = g.current_user
     records = EnvironmentData.query.filter_by(user_id=current_user.id).all()
     data = [record.to_dict() for record in records]
     return jsonify(data)
 
+# Endpoint for a user to view the summary of conditions across their complete catches.
+# The summary is maintained incrementally (see profiles.py), so this is one primary-key read.
+@app.route('/my_profile', methods=['GET'])
+@token_required
+@read_only
+def my_profile():
+    current_user = g.current_user
+    profile = db.session.get(ConditionProfile, current_user.id)
+    return jsonify(profile_summary(profile))
+
+# Endpoint for the hourly conditions from ?hours= hours before to after one of the user's
+# catches (admins: any catch), served from stored hourly series without calling Stormglass.
+@app.route('/record_context/<record_id>', methods=['GET'])
+@token_required
+@read_only
+def record_context(record_id):
+    current_user = g.current_user
+    hours = request.args.get('hours', 6, type=int)
+    if hours < 0 or hours > app.config['CONTEXT_MAX_HOURS']:
+        return jsonify({'error': f"'hours' must be between 0 and {app.config['CONTEXT_MAX_HOURS']}."}), 400
+    try:
+        record = db.session.get(EnvironmentData, uuid.UUID(record_id))
+    except ValueError:
+        record = None
+    if record is None or (record.user_id != current_user.id and not current_user.is_admin):
+        return jsonify({'message': 'Record not found.'}), 404
+    context = context_window(record.timestamp, record.latitude, record.longitude, hours,
+                             app.config['STORMGLASS_COORD_DECIMALS'])
+    return jsonify({'id': str(record.id), 'timestamp': record.timestamp.isoformat(), **context})
+
 # Endpoint for an admin to view all EnvironmentData.
 @app.route('/all_data', methods=['GET'])
 @token_required
+@read_only
 def all_data():
     current_user = g.current_user
     if not current_user.is_admin:
         return jsonify({'message': 'Access forbidden: Admins only.'}), 403
-    records = EnvironmentData.query.all()
-    data = [record.to_dict() for record in records]
+    with stage("db_query"):
+        records = EnvironmentData.query.all()
+    with stage("serialize"):
+        data = [record.to_dict() for record in records]
     return jsonify(data)
 
+# Endpoint for an admin to switch slow-request/task profiling on or off at runtime.
+@app.route('/admin/profiling', methods=['GET', 'POST'])
+@token_required
+def admin_profiling():
+    current_user = g.current_user
+    if not current_user.is_admin:
+        return jsonify({'message': 'Access forbidden: Admins only.'}), 403
+    if request.method == 'POST':
+        data = request.get_json() or {}
+        threshold_ms = data.get('threshold_ms')
+        if threshold_ms is not None:
+            try:
+                threshold_ms = float(threshold_ms)
+            except (TypeError, ValueError):
+                return jsonify({'error': "'threshold_ms' must be a number."}), 400
+        # Either setting may be changed alone; a missing 'enabled' keeps the current switch.
+        enabled = data['enabled'] if 'enabled' in data else profiling.profiling_status()['enabled']
+        profiling.set_profiling(bool(enabled), threshold_ms)
+    return jsonify(profiling.profiling_status())
+
+# Endpoint for an admin to list the most recently captured slow profiles.
+@app.route('/admin/profiles', methods=['GET'])
+@token_required
+def admin_profiles():
+    current_user = g.current_user
+    if not current_user.is_admin:
+        return jsonify({'message': 'Access forbidden: Admins only.'}), 403
+    limit = request.args.get('limit', 50, type=int)
+    return jsonify(profiling.list_profiles(limit))
+
 @app.route('/dashboard')
 def dashboard():
     return render_template("dashboard.html")
@@ -146,9 +233,9 @@ def delete_user(user_id):
     if not user:
         return jsonify({'message': 'User not found.'}), 404
     
-    db.session.delete(user)
-    db.session.commit()
-    return jsonify({'message': f'User {user_id} deleted successfully.'})
+    # Records are purged in batches by a background job; poll /jobs/<job_id> for progress.
+    job = celery.send_task('purge_user', args=[str(user.id)], queue=BULK_QUEUE)
+    return jsonify({'message': f'Deletion of user {user_id} scheduled.', 'job_id': job.id}), 202
 
 @app.route('/delete_record/<record_id>', methods=['DELETE'])
 @token_required
@@ -157,14 +244,90 @@ def delete_record(record_id):
     if not current_user.is_admin:
         return jsonify({'message': 'Access forbidden: Admins only.'}), 403
     
-    record = EnvironmentData.query.get(record_id)
-    if not record:
+    try:
+        deleted = delete_records_returning(EnvironmentData.id == uuid.UUID(str(record_id)))
+    except ValueError:
+        deleted = None
+    if not deleted:
         return jsonify({'message': 'Record not found.'}), 404
     
-    db.session.delete(record)
     db.session.commit()
     return jsonify({'message': f'Record {record_id} deleted successfully.'})
 
+# Endpoint for an admin to bulk delete records by ids or criteria
+# (JSON body with any of: ids, user_id, status, before, after).
+@app.route('/delete_records', methods=['POST'])
+@token_required
+def delete_records():
+    current_user = g.current_user
+    if not current_user.is_admin:
+        return jsonify({'message': 'Access forbidden: Admins only.'}), 403
+    
+    filters = request.get_json() or {}
+    try:
+        record_filter_conditions(filters)
+    except InvalidFilterError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    job = celery.send_task('purge_records', args=[filters], queue=BULK_QUEUE)
+    return jsonify({'message': 'Bulk deletion scheduled.', 'job_id': job.id}), 202
+
+# Endpoint for an admin to check the progress of a background job.
+@app.route('/jobs/<job_id>', methods=['GET'])
+@token_required
+def job_status(job_id):
+    current_user = g.current_user
+    if not current_user.is_admin:
+        return jsonify({'message': 'Access forbidden: Admins only.'}), 403
+    
+    result = celery.AsyncResult(job_id)
+    info = result.info
+    if isinstance(info, Exception):
+        info = {'error': str(info)}
+    return jsonify({'job_id': job_id, 'state': result.state, 'info': info})
+
+# Endpoint for a user to import a CSV or GPX catch log (multipart field 'file', optional
+# 'format'). The file is loaded and queued for enrichment by a background job; poll
+# /import_status/<job_id> for progress.
+@app.route('/import_catches', methods=['POST'])
+@token_required
+@rate_limited('import')
+def import_catches():
+    current_user = g.current_user
+    upload = request.files.get('file')
+    if upload is None or not upload.filename:
+        return jsonify({'error': "Upload the catch log as the multipart field 'file'."}), 400
+    try:
+        file_format = request.form.get('format', '').lower() or detect_format(upload.filename)
+    except ImportFormatError as e:
+        return jsonify({'error': str(e)}), 400
+    if file_format not in IMPORT_FORMATS:
+        return jsonify({'error': f"Unknown format {file_format!r}; expected one of {', '.join(IMPORT_FORMATS)}."}), 400
+    
+    # The job id carries the owner, so /import_status needs no lookup to authorise.
+    job_id = f'import-{current_user.id}-{uuid.uuid4()}'
+    import_dir = app.config['IMPORT_DIR']
+    os.makedirs(import_dir, exist_ok=True)
+    path = os.path.join(import_dir, f'{job_id}.{file_format}')
+    upload.save(path)
+    job = celery.send_task('import_catches', args=[str(current_user.id), path, file_format],
+                           task_id=job_id, queue=BULK_QUEUE)
+    return jsonify({'message': 'Import scheduled.', 'job_id': job.id}), 202
+
+# Endpoint for a user (or an admin) to check the progress of an import.
+@app.route('/import_status/<job_id>', methods=['GET'])
+@token_required
+def import_status(job_id):
+    current_user = g.current_user
+    if not job_id.startswith(f'import-{current_user.id}-') and not current_user.is_admin:
+        return jsonify({'message': 'Import not found.'}), 404
+    
+    result = celery.AsyncResult(job_id)
+    info = result.info
+    if isinstance(info, Exception):
+        info = {'error': str(info)}
+    return jsonify({'job_id': job_id, 'state': result.state, 'info': info})
+
 # --- Additional Routes for Rendering Frontend Templates ---
 
 # Landing page with login and register options.
@@ -182,5 +345,6 @@ def login_page():
 def register_page():
     return render_template("register.html")
 
+# Single-process development server; production uses serve.py (uvicorn).
 if __name__ == '__main__':
     app.run(debug=False, port=5001)
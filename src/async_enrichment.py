@@ -0,0 +1,409 @@
+import argparse
+import asyncio
+import contextvars
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Iterable, List, NamedTuple, Optional
+
+import arrow
+from sqlalchemy import or_, select, text, update
+
+from flask import current_app
+
+from circuitbreaker import is_upstream_failure
+from models import db, EnvironmentData, TIDE_FIELDS, WEATHER_FIELDS, ASTRONOMY_FIELDS
+from neighbours import reuse_values, UPSTREAM_SOURCE
+from profiles import PROFILE_COLUMNS, update_profiles
+from singleflight import request_key
+from tasks import build_api_clients
+from upstream import build_fetch_json
+
+try:
+    import aiohttp
+except ImportError:  # pragma: no cover - optional dependency
+    aiohttp = None
+
+
+class PendingRecord(NamedTuple):
+    """The columns of an EnvironmentData row needed to enrich it."""
+    id: Any
+    timestamp: Any
+    latitude: float
+    longitude: float
+
+
+# Claims a batch of pending records for this process. SKIP LOCKED lets several async workers
+# drain the same table without handing out a record twice; claimed_at (UTC) lets --reset-stale
+# tell a crashed worker's claims from live ones.
+CLAIM_PENDING_SQL = text("""
+    UPDATE environment_data SET status = 'processing', claimed_at = timezone('utc', now())
+    WHERE id IN (
+        SELECT id FROM environment_data
+        WHERE status = 'pending'
+        ORDER BY timestamp
+        LIMIT :limit
+        FOR UPDATE SKIP LOCKED
+    )
+    RETURNING id, timestamp, latitude, longitude
+""")
+
+
+class AsyncEnrichmentEngine:
+    """
+    Enriches many EnvironmentData records concurrently from a single process.
+
+    The tide, weather and astronomy requests for each record are issued on non-blocking HTTP
+    (aiohttp) and parsed with the same client code fetch_env_data uses, so results are
+    identical. Each request goes through the same fetch chain as the Celery tasks
+    (upstream.build_fetch_json: coordinate snapping, the Redis response cache, the circuit
+    breaker and cross-worker single-flight), run on a pool of `max_connections` threads whose
+    innermost HTTP call is handed back to the event loop. Identical requests in flight at the
+    same time in this process share one call. Concurrency is bounded twice: at most
+    `max_records` records are in flight and at most `max_connections` HTTP requests are open at once. Results are written back in batches
+    of `batch_size` rows (or every `flush_interval` seconds) with a single bulk UPDATE.
+
+    Database work (claims, neighbour lookups, writes) and Redis calls are blocking, so they run
+    on worker threads and never stall the event loop; database work runs one call at a time
+    because it shares the app context's session.
+
+    Must be used inside a Flask application context.
+    """
+
+    def __init__(self, max_records: int = 200, max_connections: int = 100, batch_size: int = 50,
+                 flush_interval: float = 1.0, request_timeout: float = 30.0,
+                 on_result: Optional[Callable[[Dict[str, Any]], None]] = None):
+        """
+        Initialize the engine.
+
+        Args:
+            max_records (int, optional): Maximum number of records enriched concurrently.
+            max_connections (int, optional): Maximum number of concurrent HTTP requests.
+            batch_size (int, optional): Number of finished records written per DB round-trip.
+            flush_interval (float, optional): Maximum seconds a finished record waits before being written.
+            request_timeout (float, optional): Total timeout per HTTP request, in seconds.
+            on_result (callable, optional): Called with each record's update mapping as it finishes.
+        """
+        if aiohttp is None:
+            raise RuntimeError("The async enrichment engine requires aiohttp (pip install aiohttp).")
+        self.max_records = max_records
+        self.max_connections = max_connections
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.request_timeout = request_timeout
+        self.on_result = on_result
+        self.tide_client, self.weather_client, self.astronomy_client = build_api_clients()
+        # With a gridded weather store (WEATHER_GRID_DIR), weather for the records it covers is
+        # looked up in one vectorized call per batch; only the rest goes to Stormglass.
+        self.weather_grid = None
+        if hasattr(self.weather_client, "lookup_many"):
+            self.weather_grid, self.weather_client = self.weather_client, self.weather_client.fallback
+        self._grid_weather: Dict[Any, Dict[str, Any]] = {}
+        # Update mappings for records enriched from nearby complete records (see neighbours.py).
+        self._reused: Dict[Any, Dict[str, Any]] = {}
+        self._fetch_json = build_fetch_json(current_app.config, http_fetch=self._http_fetch)
+        self._session = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._in_flight_requests: Dict[str, asyncio.Future] = {}
+        self._pending_writes: List[Dict[str, Any]] = []
+        self._db_lock = asyncio.Lock()
+        self._last_flush = time.monotonic()
+        self.completed = 0
+        self.reused = 0
+        self.errors = 0
+
+    async def _in_db(self, fn: Callable, *args) -> Any:
+        """
+        Run a blocking database call on a worker thread, one at a time.
+
+        asyncio.to_thread copies the context variables, so the call sees this task's Flask app
+        context and therefore the same SQLAlchemy session; the lock keeps that session to one
+        thread at a time.
+        """
+        async with self._db_lock:
+            return await asyncio.to_thread(fn, *args)
+
+    async def _get_json(self, url: str, params: Dict[str, Any], headers: Dict[str, str]) -> Dict[str, Any]:
+        """GET a Stormglass endpoint, sharing one request between identical concurrent callers in this process."""
+        key = request_key(url, params)
+        shared = self._in_flight_requests.get(key)
+        if shared is not None:
+            return await asyncio.shield(shared)
+        future = asyncio.ensure_future(self._http_get(url, params, headers))
+        self._in_flight_requests[key] = future
+        future.add_done_callback(lambda _: self._in_flight_requests.pop(key, None))
+        return await asyncio.shield(future)
+
+    async def _http_get(self, url: str, params: Dict[str, Any], headers: Dict[str, str]) -> Dict[str, Any]:
+        """Run the blocking fetch chain on the fetch pool, with this task's context variables."""
+        context = contextvars.copy_context()
+        return await self._loop.run_in_executor(self._executor, context.run, self._fetch_json, url, params, headers)
+
+    def _http_fetch(self, url: str, params: Dict[str, Any], headers: Dict[str, str]) -> Dict[str, Any]:
+        """Innermost fetcher of the chain: called on a pool thread, makes the request on the event loop."""
+        return asyncio.run_coroutine_threadsafe(self._request(url, params, headers), self._loop).result()
+
+    async def _request(self, url: str, params: Dict[str, Any], headers: Dict[str, str]) -> Dict[str, Any]:
+        query = {key: str(value) for key, value in params.items()}
+        async with self._session.get(url, params=query, headers=headers) as response:
+            response.raise_for_status()
+            return await response.json(content_type=None)
+
+    async def _tide(self, record: PendingRecord) -> Dict[str, Any]:
+        client = self.tide_client
+        cached = await asyncio.to_thread(client.cached_tide_data, record.timestamp, record.latitude, record.longitude)
+        if cached is not None:
+            return cached
+        start = arrow.get(record.timestamp).floor('day')
+        end = arrow.get(record.timestamp).shift(days=1).floor('day')
+        params = client.window_params(start, end, record.latitude, record.longitude)
+        extremes_json, sea_level_json = await asyncio.gather(
+            self._get_json(client.base_url_extremes, params, client.headers),
+            self._get_json(client.base_url_sea_level, params, client.headers))
+        extremes = extremes_json.get("data", [])
+        prev_extremes = None
+        if client.needs_previous_day(record.timestamp, extremes):
+            prev_params = client.window_params(start.shift(days=-1), start, record.latitude, record.longitude)
+            prev_extremes = (await self._get_json(client.base_url_extremes, prev_params, client.headers)).get("data", [])
+        sea_levels = sea_level_json.get("data", [])
+        client.store_series(sea_levels, record.timestamp, record.latitude, record.longitude)
+        await asyncio.to_thread(client.remember, record.timestamp, record.latitude, record.longitude,
+                                extremes, sea_levels, prev_extremes)
+        return client.compute_tide_data(record.timestamp, extremes, sea_levels, prev_extremes)
+
+    def _lookup_neighbours(self, records: List[PendingRecord]) -> List[PendingRecord]:
+        """Derive what nearby complete records allow; returns the records that still need upstream."""
+        upstream = []
+        for record in records:
+            try:
+                values = reuse_values(record.timestamp, record.latitude, record.longitude, record.id)
+            except Exception as e:
+                print(f"Neighbour lookup failed for record {record.id}: {e}")
+                db.session.rollback()
+                values = None
+            if values is None:
+                upstream.append(record)
+            else:
+                self._reused[record.id] = {"id": record.id, "timestamp": record.timestamp, "status": "complete", **values}
+        return upstream
+
+    def _lookup_grid_weather(self, records: List[PendingRecord]):
+        if self.weather_grid is None or not records:
+            return
+        results = self.weather_grid.lookup_many([record.timestamp for record in records],
+                                                [record.latitude for record in records],
+                                                [record.longitude for record in records])
+        for record, result in zip(records, results):
+            if result is not None:
+                self._grid_weather[record.id] = result
+        if not self.weather_grid.missing_params:
+            self.weather_grid.store_series([(record.timestamp, record.latitude, record.longitude)
+                                            for record, result in zip(records, results) if result is not None])
+
+    async def _weather(self, record: PendingRecord) -> Dict[str, Any]:
+        grid_data = self._grid_weather.pop(record.id, None)
+        if grid_data is not None and not self.weather_grid.missing_params:
+            return grid_data
+        client = self.weather_client
+        json_data = await self._get_json(client.base_url,
+                                         client.request_params(record.timestamp, record.latitude, record.longitude),
+                                         client.headers)
+        client.store_series(json_data, record.timestamp, record.latitude, record.longitude)
+        weather = client.extract_weather(json_data, record.timestamp)
+        # A grid lacking some parameters supplies the values it has; Stormglass the rest.
+        return self.weather_grid.merge(grid_data, weather) if grid_data is not None else weather
+
+    async def _astronomy(self, record: PendingRecord) -> Dict[str, Any]:
+        client = self.astronomy_client
+        json_data = await self._get_json(client.base_url,
+                                         client.request_params(record.timestamp, record.latitude, record.longitude),
+                                         client.headers)
+        return client.extract_astronomy(json_data, record.timestamp)
+
+    async def enrich(self, record: PendingRecord) -> Dict[str, Any]:
+        """
+        Fetch tide, weather and astronomy data for one record concurrently.
+
+        Returns:
+            dict: A bulk-update mapping (primary key including the partition key timestamp,
+                  enrichment fields and status).
+        """
+        tide_data, weather_data, astronomy_data = await asyncio.gather(
+            self._tide(record), self._weather(record), self._astronomy(record))
+        mapping = {"id": record.id, "timestamp": record.timestamp, "status": "complete",
+                   "enrichment_source": UPSTREAM_SOURCE, "source_record_id": None}
+        for fields, data in ((TIDE_FIELDS, tide_data), (WEATHER_FIELDS, weather_data),
+                             (ASTRONOMY_FIELDS, astronomy_data)):
+            if data:
+                for field in fields:
+                    mapping[field] = data.get(field)
+        return mapping
+
+    async def _process(self, record: PendingRecord):
+        try:
+            mapping = self._reused.pop(record.id, None)
+            if mapping is None:
+                mapping = await self.enrich(record)
+            else:
+                self.reused += 1
+            self.completed += 1
+        except Exception as e:
+            print(f"Async enrichment error for record {record.id}: {e}")
+            # Upstream outages defer the record for replay (see queues.admit_deferred).
+            mapping = {"id": record.id, "timestamp": record.timestamp,
+                       "status": "deferred" if is_upstream_failure(e) else "error"}
+            self.errors += 1
+        if self.on_result is not None:
+            self.on_result(mapping)
+        self._pending_writes.append(mapping)
+        if (len(self._pending_writes) >= self.batch_size
+                or time.monotonic() - self._last_flush >= self.flush_interval):
+            await self.flush()
+
+    async def flush(self):
+        """Write all finished records in one bulk UPDATE and commit."""
+        self._last_flush = time.monotonic()
+        if not self._pending_writes:
+            return
+        writes, self._pending_writes = self._pending_writes, []
+        await self._in_db(self._write, writes)
+
+    def _write(self, writes: List[Dict[str, Any]]):
+        try:
+            self._update_profiles(writes)
+            if self.tide_client.series_store is not None:
+                self.tide_client.series_store.write_pending()
+            db.session.execute(update(EnvironmentData), writes)
+            db.session.commit()
+        except Exception as e:
+            print(f"Async enrichment write error for {len(writes)} records: {e}")
+            db.session.rollback()
+
+    def _update_profiles(self, writes: List[Dict[str, Any]]):
+        """Move the written records' contributions to their users' condition profiles."""
+        columns = [EnvironmentData.id] + [getattr(EnvironmentData, column) for column in PROFILE_COLUMNS]
+        previous = {row["id"]: dict(row) for row in db.session.execute(
+            select(*columns).where(EnvironmentData.id.in_([write["id"] for write in writes]))
+            .with_for_update()).mappings()}
+        current = [{**previous[write["id"]], **write} for write in writes if write["id"] in previous]
+        update_profiles(added=current, removed=previous.values())
+
+    def _open_session(self):
+        connector = aiohttp.TCPConnector(limit=self.max_connections, ttl_dns_cache=300)
+        timeout = aiohttp.ClientTimeout(total=self.request_timeout)
+        self._session = aiohttp.ClientSession(connector=connector, timeout=timeout)
+        self._loop = asyncio.get_running_loop()
+        self._executor = ThreadPoolExecutor(max_workers=self.max_connections, thread_name_prefix="enrichment-fetch")
+
+    async def _close_session(self):
+        await self._session.close()
+        self._executor.shutdown(wait=False)
+
+    async def run(self, records: Iterable[PendingRecord]) -> Dict[str, int]:
+        """
+        Enrich a finite collection of records, keeping up to max_records in flight.
+
+        Returns:
+            dict: Counts of completed (of which reused from neighbours) and errored records.
+        """
+        records = list(records)
+        self._lookup_grid_weather(await self._in_db(self._lookup_neighbours, records))
+        self._open_session()
+        in_flight = set()
+        try:
+            for record in records:
+                if len(in_flight) >= self.max_records:
+                    _, in_flight = await asyncio.wait(in_flight, return_when=asyncio.FIRST_COMPLETED)
+                in_flight.add(asyncio.create_task(self._process(record)))
+            if in_flight:
+                await asyncio.wait(in_flight)
+        finally:
+            await self.flush()
+            await self._close_session()
+        return {"completed": self.completed, "reused": self.reused, "errors": self.errors}
+
+    def claim_pending(self, limit: int) -> List[PendingRecord]:
+        """Mark up to `limit` pending records as processing and return them."""
+        rows = db.session.execute(CLAIM_PENDING_SQL, {"limit": limit}).fetchall()
+        db.session.commit()
+        return [PendingRecord(*row) for row in rows]
+
+    async def serve(self, poll_interval: float = 1.0, stop_after: Optional[float] = None):
+        """
+        Continuously claim and enrich pending records until cancelled (or for stop_after seconds).
+
+        Args:
+            poll_interval (float, optional): Seconds to wait when there is no pending work.
+            stop_after (float, optional): Stop claiming new work after this many seconds.
+        """
+        self._open_session()
+        in_flight = set()
+        deadline = time.monotonic() + stop_after if stop_after else None
+        try:
+            while deadline is None or time.monotonic() < deadline:
+                free = self.max_records - len(in_flight)
+                claimed = await self._in_db(self.claim_pending, free) if free > 0 else []
+                self._lookup_grid_weather(await self._in_db(self._lookup_neighbours, claimed))
+                for record in claimed:
+                    in_flight.add(asyncio.create_task(self._process(record)))
+                if in_flight:
+                    _, in_flight = await asyncio.wait(in_flight, timeout=poll_interval,
+                                                      return_when=asyncio.FIRST_COMPLETED)
+                else:
+                    await asyncio.sleep(poll_interval)
+                if time.monotonic() - self._last_flush >= self.flush_interval:
+                    await self.flush()
+            if in_flight:
+                await asyncio.wait(in_flight)
+        finally:
+            await self.flush()
+            await self._close_session()
+
+
+def load_records(record_ids: List[Any]) -> List[PendingRecord]:
+    """Load the columns needed for enrichment for the given record ids."""
+    record_ids = [uuid.UUID(str(record_id)) for record_id in record_ids]
+    rows = db.session.query(EnvironmentData.id, EnvironmentData.timestamp,
+                            EnvironmentData.latitude, EnvironmentData.longitude) \
+        .filter(EnvironmentData.id.in_(record_ids)).all()
+    return [PendingRecord(*row) for row in rows]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the asyncio enrichment worker")
+    parser.add_argument("--max-records", type=int, default=200, help="Records in flight at once")
+    parser.add_argument("--max-connections", type=int, default=100, help="Concurrent HTTP requests")
+    parser.add_argument("--batch-size", type=int, default=50, help="Records written per DB round-trip")
+    parser.add_argument("--flush-interval", type=float, default=1.0)
+    parser.add_argument("--poll-interval", type=float, default=1.0)
+    parser.add_argument("--reset-stale", action="store_true",
+                        help="Return records left in 'processing' by a crashed worker to 'pending' before starting")
+    parser.add_argument("--stale-after", type=float, default=30.0,
+                        help="Minutes after which a claim counts as stale for --reset-stale")
+    args = parser.parse_args()
+
+    from celery_app import get_flask_app
+    with get_flask_app().app_context():
+        if args.reset_stale:
+            # Claims older than the cutoff (or made before claimed_at existed); other workers'
+            # live claims are left alone.
+            cutoff = arrow.utcnow().shift(minutes=-args.stale_after).naive
+            reset = EnvironmentData.query.filter(
+                EnvironmentData.status == "processing",
+                or_(EnvironmentData.claimed_at.is_(None), EnvironmentData.claimed_at < cutoff),
+            ).update({"status": "pending", "claimed_at": None}, synchronize_session=False)
+            db.session.commit()
+            print(f"Reset {reset} stale records to pending.")
+        engine = AsyncEnrichmentEngine(args.max_records, args.max_connections, args.batch_size,
+                                       args.flush_interval)
+        print(f"Async enrichment worker started (max {args.max_records} records in flight).")
+        try:
+            asyncio.run(engine.serve(args.poll_interval))
+        except KeyboardInterrupt:
+            pass
+        print(f"Stopped: {engine.completed} completed ({engine.reused} from neighbours), {engine.errors} errors.")
+
+
+if __name__ == "__main__":
+    main()
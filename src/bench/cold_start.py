@@ -0,0 +1,83 @@
+"""
+Cold-start benchmark.
+
+Measures how long a fresh interpreter takes to import the web app, the Celery app and the
+worker's task module, i.e. the fixed cost every web process, worker fork and one-off script
+pays before doing any work. Run from the src directory:
+
+    python -m bench.cold_start --runs 10
+    python -m bench.cold_start --importtime app   # top modules by cumulative import time
+"""
+import argparse
+import json
+import os
+import re
+import subprocess
+import sys
+import time
+from typing import List
+
+from bench.stats import format_summary, percentile
+
+TARGETS = {
+    "app": "import app",
+    "celery_app": "import celery_app",
+    "tasks": "import tasks",
+}
+
+
+def time_import(statement: str, runs: int) -> List[float]:
+    """Run `statement` in `runs` fresh interpreters and return the wall times in seconds."""
+    env = dict(os.environ)
+    env.setdefault("STORMGLASS_API_KEY", "benchmark-key")
+    timings = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        subprocess.run([sys.executable, "-c", statement], check=True, env=env,
+                       cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+        timings.append(time.perf_counter() - started)
+    return timings
+
+
+def top_imports(statement: str, limit: int) -> List[str]:
+    """Return the `limit` slowest imports made directly by `statement`, as reported by `python -X importtime`."""
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", statement],
+                            capture_output=True, text=True, check=True,
+                            cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    rows = []
+    for line in result.stderr.splitlines():
+        match = re.match(r"import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)", line)
+        if match and len(match.group(3)) == 3:
+            rows.append((int(match.group(2)), match.group(4)))
+    rows.sort(reverse=True)
+    return [f"{cumulative / 1000:9.1f} ms  {name}" for cumulative, name in rows[:limit]]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure cold-start import time of the web app and workers")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--targets", default=",".join(TARGETS), help="Comma-separated subset of " + ",".join(TARGETS))
+    parser.add_argument("--importtime", metavar="TARGET", default=None,
+                        help="Also print the slowest imports for one target")
+    parser.add_argument("--json", action="store_true", help="Print results as JSON lines")
+    args = parser.parse_args()
+
+    for target in args.targets.split(","):
+        timings = time_import(TARGETS[target], args.runs)
+        result = {
+            "target": target,
+            "runs": args.runs,
+            "p50_ms": percentile(timings, 50) * 1000.0,
+            "min_ms": min(timings) * 1000.0,
+            "max_ms": max(timings) * 1000.0,
+        }
+        print(json.dumps(result) if args.json else format_summary(result))
+
+    if args.importtime:
+        print(f"\nSlowest imports for {args.importtime}:")
+        for line in top_imports(TARGETS[args.importtime], 15):
+            print(line)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,219 @@
+"""
+Enrichment throughput benchmark.
+
+Starts a FakeStormglassServer, points the tide, weather and astronomy clients at it through
+STORMGLASS_BASE_URL, pushes a fixed, seeded workload of EnvironmentData records through
+fetch_env_data and reports records/sec plus p50/p95/p99 submit-to-complete latency.
+
+Run from the src directory (the database from celery_app.create_app must be reachable):
+
+    python -m bench.enrichment --records 200 --concurrency 8 --latency-ms 150 --jitter-ms 50
+
+With --mode async the whole workload goes through the asyncio engine (async_enrichment.py)
+in this process, with --concurrency records in flight.
+
+With --mode celery the records are queued with apply_async and a running worker does the work.
+The worker must share the stand-in server, so start it with a fixed --port and the same
+STORMGLASS_BASE_URL, e.g.
+
+    STORMGLASS_BASE_URL=http://127.0.0.1:8099/v2 celery -A celery_app:celery worker --pool=solo
+    python -m bench.enrichment --mode celery --port 8099
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from typing import Dict, List
+
+from bench.fake_stormglass import FakeStormglassServer
+from bench.stats import format_summary, summarize_latencies
+
+# A handful of real marks so the workload has a realistic spread of tide phases.
+MARKS = [
+    (50.220564, -4.801677),
+    (50.3763, -4.1438),
+    (50.1506, -5.0664),
+    (50.6139, -2.4574),
+    (51.5010, -3.1670),
+    (55.9500, -3.1800),
+    (53.4084, -4.3540),
+    (60.9360, 5.1140),
+]
+
+
+def build_workload(records: int, locations: int, days: int, seed: int) -> List[Dict]:
+    """Return a deterministic list of {timestamp, latitude, longitude} dicts."""
+    rng = random.Random(seed)
+    base_day = datetime(2024, 6, 1)
+    marks = [MARKS[i % len(MARKS)] for i in range(locations)]
+    workload = []
+    for _ in range(records):
+        lat, lon = rng.choice(marks)
+        timestamp = base_day + timedelta(days=rng.randrange(days), seconds=rng.randrange(86400))
+        workload.append({"timestamp": timestamp, "latitude": lat, "longitude": lon})
+    return workload
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark fetch_env_data against a local Stormglass stand-in")
+    parser.add_argument("--records", type=int, default=200)
+    parser.add_argument("--locations", type=int, default=4, help="Distinct marks in the workload")
+    parser.add_argument("--days", type=int, default=7, help="Distinct capture days in the workload")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--mode", choices=["inline", "async", "celery"], default="inline",
+                        help="inline: run fetch_env_data in a local thread pool; async: use the asyncio engine; "
+                             "celery: enqueue to workers")
+    parser.add_argument("--concurrency", type=int, default=1,
+                        help="Threads (inline mode) or records in flight (async mode)")
+    parser.add_argument("--poll-interval", type=float, default=0.05, help="Status poll interval in celery mode")
+    parser.add_argument("--timeout", type=float, default=600.0, help="Give up waiting after this many seconds")
+    parser.add_argument("--port", type=int, default=0, help="Stand-in server port (0 picks a free one)")
+    parser.add_argument("--latency-ms", type=float, default=0.0)
+    parser.add_argument("--jitter-ms", type=float, default=0.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--fixtures", default=None, help="Directory of recorded JSON responses")
+    parser.add_argument("--with-cache", action="store_true",
+                        help="Keep the Redis response cache, tide timelines, neighbour reuse, single-flight and circuit "
+                             "breaker enabled (off by default so every run measures the same upstream work)")
+    parser.add_argument("--json", action="store_true", help="Print the result as a JSON line")
+    parser.add_argument("--keep", action="store_true", help="Keep the benchmark user and records")
+    args = parser.parse_args()
+
+    server = FakeStormglassServer(port=args.port, latency_ms=args.latency_ms, jitter_ms=args.jitter_ms,
+                                  error_rate=args.error_rate, fixtures_dir=args.fixtures, seed=args.seed)
+    server.start()
+    os.environ["STORMGLASS_BASE_URL"] = server.base_url
+    os.environ.setdefault("STORMGLASS_API_KEY", "benchmark-key")
+    if not args.with_cache:
+        os.environ["RESPONSE_CACHE_TTL"] = "0"
+        os.environ["SINGLE_FLIGHT_ENABLED"] = "false"
+        os.environ["CIRCUIT_BREAKER_ENABLED"] = "false"
+        os.environ["TIDE_TIMELINE_ENABLED"] = "false"
+        os.environ["NEIGHBOUR_REUSE_ENABLED"] = "false"
+
+    # Imported late so create_app() picks up the stand-in URL.
+    from celery_app import celery, get_flask_app
+    from models import db, User, EnvironmentData
+    from schema import create_schema, upgrade_schema
+    from tasks import fetch_env_data
+
+    flask_app = get_flask_app()
+
+    workload = build_workload(args.records, args.locations, args.days, args.seed)
+
+    with flask_app.app_context():
+        create_schema()
+        # On PostgreSQL this also creates the monthly partitions; without them every insert fails.
+        upgrade_schema(flask_app.config['PARTITION_MONTHS_AHEAD'])
+        user = User(username=f"bench_{uuid.uuid4().hex[:8]}", is_admin=False)
+        user.set_password(uuid.uuid4().hex)
+        db.session.add(user)
+        db.session.commit()
+        user_id = user.id
+
+        records = [EnvironmentData(status="pending", user_id=user_id, **item) for item in workload]
+        db.session.add_all(records)
+        db.session.commit()
+        record_ids = [record.id for record in records]
+
+    submitted: Dict = {}
+    completed: Dict = {}
+    # Records whose run raised (inline mode) instead of ending in a stored status.
+    failures = 0
+
+    def run_inline(record_id):
+        fetch_env_data(record_id)
+        completed[record_id] = time.perf_counter()
+
+    print(f"Running {len(record_ids)} records in {args.mode} mode against {server.base_url}")
+    started = time.perf_counter()
+    if args.mode == "async":
+        import asyncio
+        from async_enrichment import AsyncEnrichmentEngine, load_records
+
+        def on_result(mapping):
+            completed[mapping["id"]] = time.perf_counter()
+
+        with flask_app.app_context():
+            records = load_records(record_ids)
+            engine = AsyncEnrichmentEngine(max_records=args.concurrency,
+                                           max_connections=max(args.concurrency, 10), on_result=on_result)
+            for record_id in record_ids:
+                submitted[record_id] = time.perf_counter()
+            asyncio.run(engine.run(records))
+    elif args.mode == "inline":
+        # Resolve the lazily created tasks now: concurrent first calls on an unfinalized task
+        # proxy race in Task.push_request.
+        celery.finalize()
+        futures = []
+        with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+            for record_id in record_ids:
+                submitted[record_id] = time.perf_counter()
+                futures.append((record_id, pool.submit(run_inline, record_id)))
+        for record_id, future in futures:
+            try:
+                future.result()
+            except Exception as e:
+                failures += 1
+                print(f"Record {record_id} failed: {type(e).__name__}: {e}", file=sys.stderr)
+    else:
+        for record_id in record_ids:
+            submitted[record_id] = time.perf_counter()
+            fetch_env_data.apply_async(args=[record_id])
+        pending = set(record_ids)
+        deadline = started + args.timeout
+        with flask_app.app_context():
+            while pending and time.perf_counter() < deadline:
+                time.sleep(args.poll_interval)
+                done = db.session.query(EnvironmentData.id).filter(
+                    EnvironmentData.id.in_(list(pending)),
+                    EnvironmentData.status != "pending").all()
+                now = time.perf_counter()
+                for (record_id,) in done:
+                    completed[record_id] = now
+                    pending.discard(record_id)
+                db.session.rollback()
+        if pending:
+            print(f"Timed out with {len(pending)} records still pending.", file=sys.stderr)
+    elapsed = time.perf_counter() - started
+
+    with flask_app.app_context():
+        statuses = dict(db.session.query(EnvironmentData.status, db.func.count())
+                        .filter(EnvironmentData.user_id == user_id)
+                        .group_by(EnvironmentData.status).all())
+        if not args.keep:
+            EnvironmentData.query.filter_by(user_id=user_id).delete()
+            User.query.filter_by(id=user_id).delete()
+            db.session.commit()
+
+    server.stop()
+
+    latencies = [completed[rid] - submitted[rid] for rid in completed]
+    result = {
+        "mode": args.mode,
+        "records": len(record_ids),
+        "completed": statuses.get("complete", 0),
+        "errors": statuses.get("error", 0),
+        "deferred": statuses.get("deferred", 0),
+        "failures": failures,
+        "elapsed_s": elapsed,
+        "records_per_s": len(completed) / elapsed if elapsed else 0.0,
+        **summarize_latencies(latencies),
+        "upstream_requests": sum(server.request_counts.values()),
+        "upstream_errors": sum(server.error_counts.values()),
+    }
+    if args.json:
+        print(json.dumps(result))
+    else:
+        print(format_summary(result))
+    if failures:
+        sys.exit(f"{failures} records failed; see the errors above.")
+
+
+if __name__ == "__main__":
+    main()
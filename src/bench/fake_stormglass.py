@@ -0,0 +1,301 @@
+import argparse
+import json
+import math
+import os
+import random
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional
+from urllib.parse import parse_qs, urlparse
+
+# Endpoint paths (relative to STORMGLASS_BASE_URL) and the fixture file that can replace
+# the synthetic payload for each of them.
+ENDPOINT_FIXTURES = {
+    "/v2/tide/extremes/point": "tide_extremes.json",
+    "/v2/tide/sea-level/point": "tide_sea_level.json",
+    "/v2/weather/point": "weather.json",
+    "/v2/astronomy/point": "astronomy.json",
+}
+
+WEATHER_PARAMS = [
+    "airTemperature", "pressure", "cloudCover", "currentDirection", "currentSpeed",
+    "swellDirection", "swellHeight", "swellPeriod", "secondarySwellPeriod", "secondarySwellDirection",
+    "secondarySwellHeight", "waveDirection", "waveHeight", "wavePeriod",
+    "windWaveDirection", "windWaveHeight", "windWavePeriod",
+    "windDirection", "windSpeed", "gust"
+]
+
+# Mean semi-diurnal tidal period in hours.
+TIDE_PERIOD_HOURS = 12.42
+
+
+def _iso(dt: datetime) -> str:
+    return dt.astimezone(timezone.utc).strftime("%Y-%m-%dT%H:%M:%S+00:00")
+
+
+def _window(query: Dict[str, List[str]]):
+    """Return the (start, end) UTC datetimes requested through the 'start'/'end' query params."""
+    start = datetime.fromtimestamp(float(query["start"][0]), tz=timezone.utc)
+    end = datetime.fromtimestamp(float(query["end"][0]), tz=timezone.utc)
+    return start, end
+
+
+def synthetic_tide_extremes(start: datetime, end: datetime, lat: float, lon: float) -> Dict[str, Any]:
+    """Alternating high/low events every half tidal period, phase-shifted by longitude."""
+    amplitude = 1.5 + abs(math.sin(math.radians(lat))) * 1.5
+    phase = timedelta(hours=(lon % 360) / 360.0 * TIDE_PERIOD_HOURS)
+    half_period = timedelta(hours=TIDE_PERIOD_HOURS / 2)
+    epoch = datetime(2000, 1, 1, tzinfo=timezone.utc) + phase
+    n = math.floor((start - epoch) / half_period)
+    events = []
+    t = epoch + n * half_period
+    while t < end:
+        if t >= start:
+            is_high = n % 2 == 0
+            events.append({
+                "height": amplitude if is_high else -amplitude,
+                "time": _iso(t),
+                "type": "high" if is_high else "low",
+            })
+        n += 1
+        t += half_period
+    return {"data": events, "meta": {"lat": lat, "lng": lon, "datum": "MSL"}}
+
+
+def synthetic_sea_level(start: datetime, end: datetime, lat: float, lon: float) -> Dict[str, Any]:
+    """Hourly sea level following the same cosine as synthetic_tide_extremes."""
+    amplitude = 1.5 + abs(math.sin(math.radians(lat))) * 1.5
+    phase = timedelta(hours=(lon % 360) / 360.0 * TIDE_PERIOD_HOURS)
+    epoch = datetime(2000, 1, 1, tzinfo=timezone.utc) + phase
+    points = []
+    t = start
+    while t < end:
+        hours = (t - epoch).total_seconds() / 3600.0
+        points.append({
+            "sg": round(amplitude * math.cos(2 * math.pi * hours / TIDE_PERIOD_HOURS), 3),
+            "time": _iso(t),
+        })
+        t += timedelta(hours=1)
+    return {"data": points, "meta": {"lat": lat, "lng": lon, "datum": "MSL"}}
+
+
+def synthetic_weather(start: datetime, end: datetime, lat: float, lon: float, params: List[str]) -> Dict[str, Any]:
+    """Hourly entries carrying every requested parameter from two providers."""
+    rng = random.Random(f"{lat:.3f},{lon:.3f},{start.date()}")
+    base = {param: rng.uniform(0.5, 20.0) for param in params}
+    hours = []
+    t = start
+    while t <= end:
+        entry = {"time": _iso(t)}
+        for param in params:
+            value = round(base[param] + rng.uniform(-0.5, 0.5), 2)
+            entry[param] = {"noaa": value, "sg": value}
+        hours.append(entry)
+        t += timedelta(hours=1)
+    return {"hours": hours, "meta": {"lat": lat, "lng": lon, "params": params}}
+
+
+def synthetic_astronomy(start: datetime, end: datetime, lat: float, lon: float) -> Dict[str, Any]:
+    """One entry per day with fixed twilight offsets around 06:00/18:00 UTC."""
+    data = []
+    day = start.replace(hour=0, minute=0, second=0, microsecond=0)
+    while day < end:
+        sunrise = day + timedelta(hours=6)
+        sunset = day + timedelta(hours=18)
+        data.append({
+            "astronomicalDawn": _iso(sunrise - timedelta(minutes=90)),
+            "nauticalDawn": _iso(sunrise - timedelta(minutes=60)),
+            "civilDawn": _iso(sunrise - timedelta(minutes=30)),
+            "sunrise": _iso(sunrise),
+            "sunset": _iso(sunset),
+            "civilDusk": _iso(sunset + timedelta(minutes=30)),
+            "nauticalDusk": _iso(sunset + timedelta(minutes=60)),
+            "astronomicalDusk": _iso(sunset + timedelta(minutes=90)),
+            "moonrise": _iso(day + timedelta(hours=20)),
+            "moonset": _iso(day + timedelta(hours=8)),
+            "moonFraction": 0.5,
+            "moonPhase": {"current": {"text": "First quarter", "value": 0.25, "time": _iso(day)}},
+            "time": _iso(day),
+        })
+        day += timedelta(days=1)
+    return {"data": data, "meta": {"lat": lat, "lng": lon}}
+
+
+class FakeStormglassServer:
+    """
+    A local stand-in for the Stormglass API used by the benchmarks.
+
+    Serves the tide extremes, tide sea-level, weather and astronomy point endpoints under /v2,
+    either from recorded JSON fixtures or from synthetic payloads generated for the requested
+    window. Every response is delayed by `latency_ms` ± `jitter_ms`, and a fraction
+    `error_rate` of requests fails with HTTP 503 so retry and error paths can be exercised.
+
+    Use it as a context manager, or call start()/stop() explicitly:
+
+        with FakeStormglassServer(latency_ms=150, jitter_ms=50) as server:
+            os.environ["STORMGLASS_BASE_URL"] = server.base_url
+    """
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, latency_ms: float = 0.0,
+                 jitter_ms: float = 0.0, error_rate: float = 0.0, fixtures_dir: Optional[str] = None,
+                 seed: Optional[int] = None):
+        """
+        Initialize the server (it does not listen until start() is called).
+
+        Args:
+            host (str, optional): Interface to bind. Defaults to 127.0.0.1.
+            port (int, optional): Port to bind; 0 picks a free port.
+            latency_ms (float, optional): Mean added latency per response, in milliseconds.
+            jitter_ms (float, optional): Uniform jitter applied around latency_ms, in milliseconds.
+            error_rate (float, optional): Fraction (0-1) of requests answered with HTTP 503.
+            fixtures_dir (str, optional): Directory holding recorded responses named as in
+                                          ENDPOINT_FIXTURES. Missing files fall back to synthetic data.
+            seed (int, optional): Seed for the latency/error random generator.
+        """
+        self.host = host
+        self.port = port
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self.fixtures = self._load_fixtures(fixtures_dir) if fixtures_dir else {}
+        self._rng = random.Random(seed)
+        self._rng_lock = threading.Lock()
+        self._counts_lock = threading.Lock()
+        self.request_counts: Dict[str, int] = {}
+        self.error_counts: Dict[str, int] = {}
+        self._httpd = None
+        self._thread = None
+
+    @staticmethod
+    def _load_fixtures(fixtures_dir: str) -> Dict[str, Any]:
+        fixtures = {}
+        for path, filename in ENDPOINT_FIXTURES.items():
+            full_path = os.path.join(fixtures_dir, filename)
+            if os.path.exists(full_path):
+                with open(full_path) as f:
+                    fixtures[path] = json.load(f)
+        return fixtures
+
+    @property
+    def base_url(self) -> str:
+        """The value to use for STORMGLASS_BASE_URL."""
+        return f"http://{self.host}:{self.port}/v2"
+
+    def _delay_and_fail(self):
+        """Return (delay in seconds, whether this request should fail)."""
+        with self._rng_lock:
+            delay_ms = self.latency_ms + self._rng.uniform(-self.jitter_ms, self.jitter_ms)
+            fail = self._rng.random() < self.error_rate
+        return max(0.0, delay_ms) / 1000.0, fail
+
+    def _count(self, path: str, failed: bool):
+        with self._counts_lock:
+            self.request_counts[path] = self.request_counts.get(path, 0) + 1
+            if failed:
+                self.error_counts[path] = self.error_counts.get(path, 0) + 1
+
+    def payload_for(self, path: str, query: Dict[str, List[str]]) -> Optional[Dict[str, Any]]:
+        """Build the response body for an endpoint path, or None if the path is unknown."""
+        if path not in ENDPOINT_FIXTURES:
+            return None
+        if path in self.fixtures:
+            return self.fixtures[path]
+        start, end = _window(query)
+        lat = float(query["lat"][0])
+        lon = float(query["lng"][0])
+        if path == "/v2/tide/extremes/point":
+            return synthetic_tide_extremes(start, end, lat, lon)
+        if path == "/v2/tide/sea-level/point":
+            return synthetic_sea_level(start, end, lat, lon)
+        if path == "/v2/weather/point":
+            params = query.get("params", [",".join(WEATHER_PARAMS)])[0].split(",")
+            return synthetic_weather(start, end, lat, lon, params)
+        return synthetic_astronomy(start, end, lat, lon)
+
+    def _make_handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_GET(self):
+                parsed = urlparse(self.path)
+                delay, fail = server._delay_and_fail()
+                if delay:
+                    time.sleep(delay)
+                try:
+                    body = None if fail else server.payload_for(parsed.path, parse_qs(parsed.query))
+                except (KeyError, ValueError):
+                    self._send(400, {"errors": {"query": "invalid or missing parameters"}})
+                    server._count(parsed.path, True)
+                    return
+                if fail:
+                    self._send(503, {"errors": {"key": "Service temporarily unavailable"}})
+                elif body is None:
+                    self._send(404, {"errors": {"path": "not found"}})
+                else:
+                    self._send(200, body)
+                server._count(parsed.path, fail or body is None)
+
+            def _send(self, status: int, body: Dict[str, Any]):
+                data = json.dumps(body).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+    def start(self) -> "FakeStormglassServer":
+        """Bind the socket and serve requests on a background thread."""
+        self._httpd = ThreadingHTTPServer((self.host, self.port), self._make_handler())
+        self._httpd.daemon_threads = True
+        self.port = self._httpd.server_address[1]
+        self._thread = threading.Thread(target=self._httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        """Stop serving and release the socket."""
+        if self._httpd is not None:
+            self._httpd.shutdown()
+            self._httpd.server_close()
+            self._httpd = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc, tb):
+        self.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run a local Stormglass stand-in server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8099)
+    parser.add_argument("--latency-ms", type=float, default=0.0, help="Mean added latency per response")
+    parser.add_argument("--jitter-ms", type=float, default=0.0, help="Uniform jitter around the latency")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of requests answered with 503")
+    parser.add_argument("--fixtures", default=None, help="Directory of recorded JSON responses")
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args()
+
+    server = FakeStormglassServer(args.host, args.port, args.latency_ms, args.jitter_ms,
+                                  args.error_rate, args.fixtures, args.seed)
+    server.start()
+    print(f"Fake Stormglass serving on {server.base_url} (set STORMGLASS_BASE_URL to this)")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.stop()
+
+
+if __name__ == "__main__":
+    main()
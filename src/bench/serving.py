@@ -0,0 +1,163 @@
+"""
+Serving benchmark: the Flask development server versus serve.py (uvicorn).
+
+Starts the chosen server as a subprocess, opens --connections concurrent keep-alive client
+connections (aiohttp) that poll /my_data and submit catches to /submit_timestamp for
+--duration seconds, then stops the server with SIGTERM and reports requests/sec, latency
+percentiles, failures and how long the graceful shutdown took. Run from the src directory
+against the configured database:
+
+    python -m bench.serving --server dev --connections 500
+    python -m bench.serving --server asgi --connections 2000 --workers 4 --threads 32
+
+Submissions are left pending (ENRICHMENT_BACKEND=async) and rate limiting and admission
+control are switched off in the server, so only the serving stack is measured.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import signal
+import socket
+import subprocess
+import sys
+import time
+import uuid
+from collections import Counter
+from typing import Dict, List
+
+from bench.stats import format_summary, summarize_latencies
+
+try:
+    import aiohttp
+except ImportError:  # pragma: no cover - optional dependency
+    aiohttp = None
+
+SRC_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_server(kind: str, port: int, workers: int, threads: int) -> subprocess.Popen:
+    """Start the development server ("dev") or serve.py ("asgi") on 127.0.0.1:port."""
+    env = dict(os.environ, ENRICHMENT_BACKEND="async", RATE_LIMIT_SUBMIT="", ADMISSION_MAX_QUEUE_DEPTH="0")
+    if kind == "dev":
+        command = [sys.executable, "-c",
+                   f"from app import app; app.run(host='127.0.0.1', port={port}, threaded=True)"]
+    else:
+        command = [sys.executable, "serve.py", "--host", "127.0.0.1", "--port", str(port),
+                   "--workers", str(workers), "--threads", str(threads)]
+    return subprocess.Popen(command, cwd=SRC_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+
+def wait_until_listening(port: int, timeout: float):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            with socket.create_connection(("127.0.0.1", port), timeout=0.5):
+                return
+        except OSError:
+            time.sleep(0.1)
+    raise RuntimeError(f"Server did not start listening on port {port} within {timeout:.0f}s.")
+
+
+async def get_token(session, base_url: str) -> str:
+    """Register a throwaway user and return its JWT."""
+    credentials = {"username": f"bench_{uuid.uuid4().hex[:8]}", "password": "benchmark"}
+    async with session.post(f"{base_url}/register", json=credentials) as response:
+        response.raise_for_status()
+    async with session.post(f"{base_url}/login", json=credentials) as response:
+        response.raise_for_status()
+        return (await response.json())["token"]
+
+
+async def client(session, base_url: str, token: str, submit_ratio: float, stop_at: float,
+                 latencies: List[float], statuses: Counter, rng: random.Random):
+    """One connection: poll or submit in a loop until stop_at."""
+    headers = {"Authorization": f"Bearer {token}"}
+    while time.monotonic() < stop_at:
+        started = time.perf_counter()
+        try:
+            if rng.random() < submit_ratio:
+                payload = {"timestamp": "2024-06-01T10:00:00", "lat": 50.22, "lng": -4.80}
+                request = session.post(f"{base_url}/submit_timestamp", json=payload, headers=headers)
+            else:
+                request = session.get(f"{base_url}/my_data", headers=headers)
+            async with request as response:
+                await response.read()
+                statuses[response.status] += 1
+        except Exception as e:
+            statuses[type(e).__name__] += 1
+            continue
+        latencies.append(time.perf_counter() - started)
+
+
+async def run_load(base_url: str, connections: int, duration: float, submit_ratio: float,
+                   seed: int) -> Dict:
+    connector = aiohttp.TCPConnector(limit=connections)
+    timeout = aiohttp.ClientTimeout(total=60)
+    async with aiohttp.ClientSession(connector=connector, timeout=timeout) as session:
+        token = await get_token(session, base_url)
+        latencies: List[float] = []
+        statuses: Counter = Counter()
+        started = time.monotonic()
+        stop_at = started + duration
+        await asyncio.gather(*(client(session, base_url, token, submit_ratio, stop_at, latencies, statuses,
+                                      random.Random(seed + i)) for i in range(connections)))
+        elapsed = time.monotonic() - started
+    ok = sum(count for status, count in statuses.items() if isinstance(status, int) and status < 400)
+    return {
+        "requests": sum(statuses.values()),
+        "ok": ok,
+        "failed": sum(statuses.values()) - ok,
+        "requests_per_s": ok / elapsed if elapsed else 0.0,
+        **summarize_latencies(latencies),
+        "statuses": dict((str(status), count) for status, count in statuses.items()),
+    }
+
+
+def main():
+    if aiohttp is None:
+        raise SystemExit("The serving benchmark requires aiohttp (pip install aiohttp).")
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--server", choices=["dev", "asgi"], default="asgi")
+    parser.add_argument("--port", type=int, default=0, help="Server port (0 picks a free one)")
+    parser.add_argument("--workers", type=int, default=2, help="serve.py worker processes")
+    parser.add_argument("--threads", type=int, default=16, help="serve.py request threads per worker")
+    parser.add_argument("--connections", type=int, default=500, help="Concurrent client connections")
+    parser.add_argument("--duration", type=float, default=20.0)
+    parser.add_argument("--submit-ratio", type=float, default=0.1, help="Share of requests that are submissions")
+    parser.add_argument("--startup-timeout", type=float, default=30.0)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", action="store_true", help="Print the result as a JSON line")
+    args = parser.parse_args()
+
+    port = args.port or free_port()
+    server = start_server(args.server, port, args.workers, args.threads)
+    try:
+        wait_until_listening(port, args.startup_timeout)
+        result = {"server": args.server, "connections": args.connections}
+        result.update(asyncio.run(run_load(f"http://127.0.0.1:{port}", args.connections, args.duration,
+                                           args.submit_ratio, args.seed)))
+    finally:
+        stopping = time.perf_counter()
+        server.send_signal(signal.SIGTERM)
+        try:
+            server.wait(timeout=60)
+        except subprocess.TimeoutExpired:
+            server.kill()
+    result["shutdown_s"] = time.perf_counter() - stopping
+    if args.json:
+        print(json.dumps(result))
+    else:
+        statuses = result.pop("statuses")
+        print(format_summary(result), " statuses=" + ",".join(f"{k}:{v}" for k, v in sorted(statuses.items())))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,40 @@
+import math
+from typing import Dict, List, Sequence
+
+
+def percentile(values: Sequence[float], pct: float) -> float:
+    """
+    Return the pct-th percentile of values using linear interpolation between closest ranks.
+
+    Args:
+        values (Sequence[float]): Samples (need not be sorted).
+        pct (float): Percentile in the range 0-100.
+
+    Returns:
+        float: The percentile, or NaN when values is empty.
+    """
+    if not values:
+        return math.nan
+    ordered = sorted(values)
+    rank = (len(ordered) - 1) * pct / 100.0
+    low = math.floor(rank)
+    high = math.ceil(rank)
+    if low == high:
+        return ordered[int(rank)]
+    return ordered[low] + (ordered[high] - ordered[low]) * (rank - low)
+
+
+def summarize_latencies(latencies: List[float]) -> Dict[str, float]:
+    """Summarize latencies given in seconds as p50/p95/p99/max in milliseconds."""
+    return {
+        "p50_ms": percentile(latencies, 50) * 1000.0,
+        "p95_ms": percentile(latencies, 95) * 1000.0,
+        "p99_ms": percentile(latencies, 99) * 1000.0,
+        "max_ms": (max(latencies) if latencies else math.nan) * 1000.0,
+    }
+
+
+def format_summary(summary: Dict[str, float]) -> str:
+    """Render a summary dict as a single 'key=value' line."""
+    return "  ".join(f"{key}={value:.1f}" if isinstance(value, float) else f"{key}={value}"
+                     for key, value in summary.items())
@@ -1,37 +1,135 @@
+import importlib
+
 from celery import Celery
+from celery.schedules import crontab
+from kombu import Queue
 from flask import Flask
+from flask.cli import AppGroup
+from config import load_config
 from models import db
 
-def create_app():
+# Modules whose init_app registers `flask` CLI commands. They pull in the API clients and the
+# upstream stack, so they are imported only when a command is looked up (see _LazyCommands).
+CLI_MODULES = ('schema', 'queues', 'prefetch', 'partitions', 'profiles', 'importer')
+
+class _LazyCommands(AppGroup):
+    """The app's `flask` command group, registering the CLI_MODULES commands on first use."""
+
+    def __init__(self, app):
+        super().__init__()
+        self._app = app
+        self._loaded = False
+
+    def _load(self):
+        if not self._loaded:
+            self._loaded = True
+            for name in CLI_MODULES:
+                importlib.import_module(name).init_app(self._app)
+
+    def get_command(self, ctx, name):
+        self._load()
+        return super().get_command(ctx, name)
+
+    def list_commands(self, ctx):
+        self._load()
+        return super().list_commands(ctx)
+
+def create_app(config=None):
+    """
+    Application factory.
+
+    Builds and configures the Flask app without connecting to the database; the schema is
+    managed explicitly with `flask --app app init-db` (see schema.py).
+
+    Args:
+        config (dict, optional): Settings that override those read from the environment.
+
+    Returns:
+        Flask: The configured application.
+    """
     app = Flask(__name__)
-    app.config['SQLALCHEMY_DATABASE_URI'] = 'postgresql://postgres@localhost:5432/postgres'
-    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
-    app.config['CELERY_BROKER_URL'] = 'redis://localhost:6379/0'
-    app.config['CELERY_RESULT_BACKEND'] = 'redis://localhost:6379/0'
+    app.config.update(load_config())
+    if config:
+        app.config.update(config)
 
     db.init_app(app)
-    with app.app_context():
-        db.create_all()
+
+    import db_routing
+    db_routing.init_app(app)
+
+    app.cli = _LazyCommands(app)
 
     return app
 
-flask_app = create_app()
+_flask_app = None
 
+def get_flask_app():
+    """Return the process-wide Flask app, creating it on first use."""
+    global _flask_app
+    if _flask_app is None:
+        _flask_app = create_app()
+    return _flask_app
+
+_settings = load_config()
+
+# Tasks are imported by the worker on startup through `include`, so web processes that only
+# enqueue work by name never import the API clients.
 celery = Celery(
-    flask_app.import_name,
-    broker=flask_app.config['CELERY_BROKER_URL'],
-    backend=flask_app.config['CELERY_RESULT_BACKEND'],
-    include=['tasks']  # 👈 Ensure tasks are auto-discovered
+    'fishcaptures',
+    broker=_settings['CELERY_BROKER_URL'],
+    backend=_settings['CELERY_RESULT_BACKEND'],
+    include=['tasks', 'prefetch', 'purge', 'partitions', 'queues', 'georouting', 'importer']
 )
 
-celery.conf.update(flask_app.config)
+# Two queues: 'live' for catches just submitted and 'bulk' for backfill/batch work. Each is
+# consumed by its own worker pool (see instructions.txt), so the bulk backlog never delays
+# live submissions. Prefetch of 1 with late acks keeps a busy worker from hoarding tasks.
+celery.conf.update(
+    task_queues=(Queue('live'), Queue('bulk')),
+    task_default_queue='bulk',
+    task_routes={
+        'fetch_env_data': {'queue': 'live'},
+        'fetch_env_data_batch': {'queue': 'bulk'},
+        'prefetch_hot_marks': {'queue': 'bulk'},
+        'purge_user': {'queue': 'bulk'},
+        'purge_records': {'queue': 'bulk'},
+        'maintain_partitions': {'queue': 'bulk'},
+        'admit_deferred': {'queue': 'bulk'},
+        'reap_geo_queues': {'queue': 'bulk'},
+        'import_catches': {'queue': 'bulk'},
+    },
+    worker_prefetch_multiplier=_settings['CELERY_PREFETCH_MULTIPLIER'],
+    task_acks_late=True,
+)
 
 class ContextTask(celery.Task):
     def __call__(self, *args, **kwargs):
-        with flask_app.app_context():
+        with get_flask_app().app_context():
             return super().__call__(*args, **kwargs)
 
 celery.Task = ContextTask
 
-# Explicitly import tasks to register with Celery
-import tasks  # 👈 Add this line
+# Periodic jobs, run by `celery -A celery_app:celery beat`.
+celery.conf.beat_schedule = {
+    'prefetch-hot-marks': {
+        'task': 'prefetch_hot_marks',
+        'schedule': crontab(hour=_settings['PREFETCH_HOUR_UTC'], minute=0),
+    },
+    'admit-deferred': {
+        'task': 'admit_deferred',
+        'schedule': 60.0,
+    },
+    'maintain-partitions': {
+        'task': 'maintain_partitions',
+        'schedule': crontab(hour=1, minute=30),
+    },
+    'reap-geo-queues': {
+        'task': 'reap_geo_queues',
+        'schedule': 30.0,
+    },
+}
+celery.conf.timezone = 'UTC'
+
+# Worker signal handlers for geography-aware routing; imported here so they are connected
+# before the worker sets up its queues.
+import georouting  # noqa: E402,F401
@@ -0,0 +1,187 @@
+import asyncio
+from typing import Any, Callable, Dict, Optional
+from urllib.parse import urlparse
+
+import requests
+
+from api_calls.stormglass import FetchJSON
+from redis_store import get_redis
+from singleflight import SingleFlightLeaderError
+
+
+class CircuitOpenError(RuntimeError):
+    """Raised instead of calling an upstream endpoint whose circuit is open."""
+
+
+def is_upstream_failure(error: BaseException) -> bool:
+    """
+    Return True if `error` means the upstream service is unavailable rather than the request
+    being wrong: connection errors, timeouts, 5xx and 429 responses, an open circuit, or a
+    single-flight leader that hit one of those (judged by the leader's classification, else its
+    status and error type).
+
+    Works for both the requests exceptions raised by get_json and aiohttp's.
+    """
+    if isinstance(error, SingleFlightLeaderError) and error.upstream_failure is not None:
+        return error.upstream_failure
+    if isinstance(error, (CircuitOpenError, requests.ConnectionError, requests.Timeout, asyncio.TimeoutError,
+                          TimeoutError, ConnectionError)):
+        return True
+    response = getattr(error, "response", None)
+    status = getattr(response, "status_code", None) or getattr(error, "status", None)
+    if isinstance(status, int):
+        return status >= 500 or status == 429
+    # aiohttp.ClientConnectionError and friends, without importing aiohttp here.
+    name = getattr(error, "error_type", None) or type(error).__name__
+    return name in ("ConnectionError", "Timeout", "ConnectTimeout", "ReadTimeout", "TimeoutError",
+                    "CircuitOpenError", "ClientConnectionError", "ClientConnectorError",
+                    "ServerDisconnectedError", "ServerTimeoutError", "ClientOSError")
+
+
+def endpoint_name(url: str) -> str:
+    """Name of the circuit for a URL: its path, e.g. "v2/tide/extremes/point"."""
+    return urlparse(url).path.strip("/")
+
+
+class CircuitBreaker:
+    """
+    Per-endpoint circuit breaker shared by every worker through Redis.
+
+    Closed: calls go through and upstream failures are counted. After `failure_threshold`
+    failures within `failure_window` seconds the circuit opens and calls fail immediately with
+    CircuitOpenError for `open_seconds`. Then it is half-open: a single probe call is let
+    through; success closes the circuit, failure opens it again. If Redis is unreachable calls
+    go straight through.
+    """
+
+    def __init__(self, redis_client=None, prefix: str = "circuit", failure_threshold: int = 5,
+                 failure_window: float = 60.0, open_seconds: float = 30.0):
+        """
+        Initialize the breaker.
+
+        Args:
+            redis_client (redis.Redis, optional): Client to use. Defaults to redis_store.get_redis().
+            prefix (str, optional): Prefix for the Redis keys.
+            failure_threshold (int, optional): Failures that open the circuit.
+            failure_window (float, optional): Seconds over which failures are counted.
+            open_seconds (float, optional): Seconds the circuit stays open before a probe.
+        """
+        self._redis = redis_client
+        self.prefix = prefix
+        self.failure_threshold = failure_threshold
+        self.failure_window = failure_window
+        self.open_seconds = open_seconds
+
+    @property
+    def redis(self):
+        return self._redis or get_redis()
+
+    def _key(self, name: str, part: str) -> str:
+        return f"{self.prefix}:{name}:{part}"
+
+    def allow(self, name: str) -> bool:
+        """
+        Check the circuit before calling endpoint `name`.
+
+        Returns:
+            bool: True if this call is the half-open probe.
+
+        Raises:
+            CircuitOpenError: If the circuit is open (or another worker is already probing).
+        """
+        try:
+            is_open, tripped = self.redis.mget(self._key(name, "open"), self._key(name, "tripped"))
+            if is_open is not None:
+                raise CircuitOpenError(f"Circuit for {name} is open.")
+            if tripped is None:
+                return False
+            # Half-open: only the worker that wins the probe slot calls upstream.
+            if self.redis.set(self._key(name, "probe"), 1, nx=True, px=int(self.open_seconds * 1000)):
+                return True
+        except CircuitOpenError:
+            raise
+        except Exception as e:
+            print(f"Circuit breaker unavailable: {e}")
+            return False
+        raise CircuitOpenError(f"Circuit for {name} is half-open and already being probed.")
+
+    def succeeded(self, name: str, probe: bool):
+        """Record a successful call; a successful probe closes the circuit."""
+        if not probe:
+            return
+        try:
+            self.redis.delete(self._key(name, "tripped"), self._key(name, "probe"), self._key(name, "failures"))
+            print(f"Circuit for {name} closed.")
+        except Exception as e:
+            print(f"Circuit breaker unavailable: {e}")
+
+    def failed(self, name: str, probe: bool):
+        """Record an upstream failure, opening the circuit at the threshold or after a failed probe."""
+        try:
+            failures_key = self._key(name, "failures")
+            failures = self.redis.incr(failures_key)
+            if failures == 1:
+                self.redis.pexpire(failures_key, int(self.failure_window * 1000))
+            if probe or failures >= self.failure_threshold:
+                self.trip(name)
+        except Exception as e:
+            print(f"Circuit breaker unavailable: {e}")
+
+    def trip(self, name: str):
+        """Open the circuit for `name`."""
+        open_ms = int(self.open_seconds * 1000)
+        pipe = self.redis.pipeline()
+        pipe.set(self._key(name, "open"), 1, px=open_ms)
+        # Remembered well past the open period so the first call afterwards is a probe.
+        pipe.set(self._key(name, "tripped"), 1, px=open_ms * 20)
+        pipe.delete(self._key(name, "probe"), self._key(name, "failures"))
+        pipe.execute()
+        print(f"Circuit for {name} opened for {self.open_seconds:g}s.")
+
+    def call(self, name: str, fn: Callable[[], Any]) -> Any:
+        """Run fn() through the circuit for endpoint `name`."""
+        probe = self.allow(name)
+        try:
+            result = fn()
+        except Exception as e:
+            upstream_failure = is_upstream_failure(e)
+            # A waiter sharing a failed single-flight call is not counted again, unless it is
+            # the probe: the outage it shared must reopen the circuit.
+            if upstream_failure and (probe or not isinstance(e, (CircuitOpenError, SingleFlightLeaderError))):
+                self.failed(name, probe)
+            elif probe and not upstream_failure:
+                # Not an outage (e.g. a 4xx): upstream is answering, so the circuit closes.
+                self.succeeded(name, probe)
+            raise
+        self.succeeded(name, probe)
+        return result
+
+    def tripped_circuits(self) -> Dict[str, bool]:
+        """Return the circuits that are open (True) or half-open awaiting a probe (False)."""
+        try:
+            circuits = {}
+            for key in self.redis.scan_iter(match=f"{self.prefix}:*:tripped"):
+                name = key.decode() if isinstance(key, bytes) else key
+                name = name[len(self.prefix) + 1:-len(":tripped")]
+                circuits[name] = bool(self.redis.exists(self._key(name, "open")))
+            return circuits
+        except Exception as e:
+            print(f"Circuit breaker unavailable: {e}")
+            return {}
+
+
+def breaking_fetcher(fetch_json: FetchJSON, breaker: CircuitBreaker) -> FetchJSON:
+    """Wrap a fetcher so each endpoint's calls go through its circuit in `breaker`."""
+    def fetch(url: str, params: Dict[str, Any], headers: Dict[str, str]) -> Dict[str, Any]:
+        return breaker.call(endpoint_name(url), lambda: fetch_json(url, params, headers))
+
+    return fetch
+
+
+def build_circuit_breaker(config) -> Optional[CircuitBreaker]:
+    """The CircuitBreaker configured by the CIRCUIT_* settings, or None when disabled."""
+    if not config['CIRCUIT_BREAKER_ENABLED']:
+        return None
+    return CircuitBreaker(failure_threshold=config['CIRCUIT_FAILURE_THRESHOLD'],
+                          failure_window=config['CIRCUIT_FAILURE_WINDOW'],
+                          open_seconds=config['CIRCUIT_OPEN_SECONDS'])
@@ -0,0 +1,161 @@
+import os
+
+_dotenv_loaded = False
+
+def load_environment():
+    """
+    Load .env files into the process environment (once per process).
+
+    Both a .env in the working directory and src/api_calls/.env (where the Stormglass key
+    lives) are read. Values already present in the environment win.
+    """
+    global _dotenv_loaded
+    if _dotenv_loaded:
+        return
+    from dotenv import load_dotenv
+    load_dotenv(os.path.join(os.getcwd(), ".env"))
+    load_dotenv(os.path.join(os.path.dirname(os.path.abspath(__file__)), "api_calls", ".env"))
+    _dotenv_loaded = True
+
+def _engine_options(url, pool_size, max_overflow):
+    """Connection pool settings for one database role (SQLite keeps SQLAlchemy's defaults)."""
+    if url.startswith('sqlite'):
+        return {}
+    return {
+        'pool_size': pool_size,
+        'max_overflow': max_overflow,
+        'pool_pre_ping': True,
+        'pool_recycle': int(os.getenv('DB_POOL_RECYCLE', '1800')),
+    }
+
+def load_config():
+    """
+    Build the application settings from the environment.
+
+    Reading settings never touches the database or the broker, so it is safe to call at
+    import time in web processes, workers and scripts.
+
+    Returns:
+        dict: Flask/Celery settings keyed by their config names.
+    """
+    load_environment()
+    broker_url = os.getenv('CELERY_BROKER_URL', 'redis://localhost:6379/0')
+    database_url = os.getenv('DATABASE_URL', 'postgresql://postgres@localhost:5432/postgres')
+    # Comma-separated read replica URLs; read-only endpoints are routed to them (see db_routing.py).
+    replica_urls = [url.strip() for url in os.getenv('DATABASE_REPLICA_URLS', '').split(',') if url.strip()]
+    replica_pool_size = int(os.getenv('REPLICA_POOL_SIZE', '10'))
+    replica_max_overflow = int(os.getenv('REPLICA_MAX_OVERFLOW', '20'))
+    return {
+        'SECRET_KEY': os.getenv('SECRET_KEY', 'your-secret-key'),  # Change for production!
+        'SQLALCHEMY_DATABASE_URI': database_url,
+        'SQLALCHEMY_ENGINE_OPTIONS': _engine_options(database_url, int(os.getenv('DB_POOL_SIZE', '5')),
+                                                     int(os.getenv('DB_MAX_OVERFLOW', '10'))),
+        'SQLALCHEMY_REPLICA_URIS': replica_urls,
+        'SQLALCHEMY_BINDS': {
+            f'replica{i}': {'url': url, **_engine_options(url, replica_pool_size, replica_max_overflow)}
+            for i, url in enumerate(replica_urls)
+        },
+        # Seconds a user's reads stay on the primary after they write.
+        'REPLICA_STICKY_SECONDS': float(os.getenv('REPLICA_STICKY_SECONDS', '10')),
+        'SQLALCHEMY_TRACK_MODIFICATIONS': False,
+        'CELERY_BROKER_URL': broker_url,
+        'CELERY_RESULT_BACKEND': os.getenv('CELERY_RESULT_BACKEND', broker_url),
+        'CELERY_PREFETCH_MULTIPLIER': int(os.getenv('CELERY_PREFETCH_MULTIPLIER', '1')),
+        # Root of the Stormglass API; override to point the clients at a stand-in server.
+        'STORMGLASS_BASE_URL': os.getenv('STORMGLASS_BASE_URL', 'https://api.stormglass.io/v2'),
+        # 'celery' queues one fetch_env_data task per submission; 'async' leaves new records
+        # pending for async_enrichment.py workers to claim in bulk.
+        'ENRICHMENT_BACKEND': os.getenv('ENRICHMENT_BACKEND', 'celery'),
+        'ASYNC_MAX_RECORDS': int(os.getenv('ASYNC_MAX_RECORDS', '200')),
+        'ASYNC_MAX_CONNECTIONS': int(os.getenv('ASYNC_MAX_CONNECTIONS', '100')),
+        'ASYNC_BATCH_SIZE': int(os.getenv('ASYNC_BATCH_SIZE', '50')),
+        # Coordinates are snapped to this many decimal places (about 1 km at 2) before calling
+        # Stormglass, so nearby catches share cached and prefetched responses.
+        'STORMGLASS_COORD_DECIMALS': int(os.getenv('STORMGLASS_COORD_DECIMALS', '2')),
+        # Seconds a Stormglass response is kept in the Redis response cache (0 disables it).
+        'RESPONSE_CACHE_TTL': float(os.getenv('RESPONSE_CACHE_TTL', str(36 * 3600))),
+        # Predictive prefetch of users' frequent marks (see prefetch.py).
+        'PREFETCH_HOUR_UTC': int(os.getenv('PREFETCH_HOUR_UTC', '2')),
+        'PREFETCH_DAILY_QUOTA': int(os.getenv('PREFETCH_DAILY_QUOTA', '500')),
+        'PREFETCH_LOOKBACK_DAYS': int(os.getenv('PREFETCH_LOOKBACK_DAYS', '90')),
+        'PREFETCH_MIN_CATCHES': int(os.getenv('PREFETCH_MIN_CATCHES', '3')),
+        'PREFETCH_MARKS_PER_USER': int(os.getenv('PREFETCH_MARKS_PER_USER', '5')),
+        # Production server (see serve.py): worker processes, request threads per worker and
+        # connection handling. SERVER_LIMIT_CONCURRENCY of 0 means no per-worker connection cap.
+        'SERVER_HOST': os.getenv('SERVER_HOST', '0.0.0.0'),
+        'SERVER_PORT': int(os.getenv('SERVER_PORT', '5001')),
+        'SERVER_WORKERS': int(os.getenv('SERVER_WORKERS', str(os.cpu_count() or 1))),
+        'SERVER_THREADS': int(os.getenv('SERVER_THREADS', '16')),
+        'SERVER_LIMIT_CONCURRENCY': int(os.getenv('SERVER_LIMIT_CONCURRENCY', '0')),
+        'SERVER_BACKLOG': int(os.getenv('SERVER_BACKLOG', '4096')),
+        'SERVER_KEEP_ALIVE': int(os.getenv('SERVER_KEEP_ALIVE', '30')),
+        'SERVER_GRACEFUL_TIMEOUT': int(os.getenv('SERVER_GRACEFUL_TIMEOUT', '30')),
+        # Per-endpoint upstream circuit breaker (see circuitbreaker.py): this many failures within
+        # the window open the circuit for CIRCUIT_OPEN_SECONDS, and records are deferred meanwhile.
+        'CIRCUIT_BREAKER_ENABLED': os.getenv('CIRCUIT_BREAKER_ENABLED', 'true').lower() in ('1', 'true', 'yes'),
+        'CIRCUIT_FAILURE_THRESHOLD': int(os.getenv('CIRCUIT_FAILURE_THRESHOLD', '5')),
+        'CIRCUIT_FAILURE_WINDOW': float(os.getenv('CIRCUIT_FAILURE_WINDOW', '60')),
+        'CIRCUIT_OPEN_SECONDS': float(os.getenv('CIRCUIT_OPEN_SECONDS', '30')),
+        # Deferred records re-queued per minute by admit_deferred once every circuit is closed.
+        'DEFERRED_REPLAY_BATCH': int(os.getenv('DEFERRED_REPLAY_BATCH', '200')),
+        # Per-user token buckets on submission endpoints (see ratelimit.py), as
+        # "<requests>/<second|minute|hour|day>"; an empty value disables the limit.
+        'RATE_LIMIT_SUBMIT': os.getenv('RATE_LIMIT_SUBMIT', '60/minute'),
+        'RATE_LIMIT_SUBMIT_BURST': int(os.getenv('RATE_LIMIT_SUBMIT_BURST', '20')),
+        # Catch log uploads: each one can queue thousands of records for enrichment.
+        'RATE_LIMIT_IMPORT': os.getenv('RATE_LIMIT_IMPORT', '10/hour'),
+        'RATE_LIMIT_IMPORT_BURST': int(os.getenv('RATE_LIMIT_IMPORT_BURST', '3')),
+        # Admission control (see queues.admission_decision): above this many queued live
+        # enrichments (0 disables), submissions are shed with 503 or stored as 'deferred'.
+        'ADMISSION_MAX_QUEUE_DEPTH': int(os.getenv('ADMISSION_MAX_QUEUE_DEPTH', '5000')),
+        'ADMISSION_MODE': os.getenv('ADMISSION_MODE', 'defer'),
+        'ADMISSION_CHECK_INTERVAL': float(os.getenv('ADMISSION_CHECK_INTERVAL', '1')),
+        'ADMISSION_RETRY_AFTER': int(os.getenv('ADMISSION_RETRY_AFTER', '30')),
+        # Hourly weather and sea-level series kept per location-day from enrichment responses
+        # (see hourly_series.py) and served by /record_context/<id> up to CONTEXT_MAX_HOURS
+        # hours either side of a catch.
+        'HOURLY_SERIES_ENABLED': os.getenv('HOURLY_SERIES_ENABLED', 'true').lower() in ('1', 'true', 'yes'),
+        'CONTEXT_MAX_HOURS': int(os.getenv('CONTEXT_MAX_HOURS', '24')),
+        # Geography-aware routing (see georouting.py): live enrichment tasks go to the worker
+        # owning the geohash cell (GEO_ROUTING_PRECISION characters) of the catch on a
+        # consistent-hash ring of registered workers, re-read every GEO_ROUTING_REFRESH seconds.
+        # Workers renew their registration every GEO_ROUTING_HEARTBEAT seconds.
+        'GEO_ROUTING_ENABLED': os.getenv('GEO_ROUTING_ENABLED', 'true').lower() in ('1', 'true', 'yes'),
+        'GEO_ROUTING_PRECISION': int(os.getenv('GEO_ROUTING_PRECISION', '4')),
+        'GEO_ROUTING_VNODES': int(os.getenv('GEO_ROUTING_VNODES', '64')),
+        'GEO_ROUTING_REFRESH': float(os.getenv('GEO_ROUTING_REFRESH', '5')),
+        'GEO_ROUTING_HEARTBEAT': float(os.getenv('GEO_ROUTING_HEARTBEAT', '10')),
+        # Per-location tide timelines in Redis (see api_calls/tide_timeline.py): each fetched day
+        # of extremes and sea levels is kept for TIDE_TIMELINE_TTL_DAYS and reused for later catches.
+        'TIDE_TIMELINE_ENABLED': os.getenv('TIDE_TIMELINE_ENABLED', 'true').lower() in ('1', 'true', 'yes'),
+        'TIDE_TIMELINE_TTL_DAYS': int(os.getenv('TIDE_TIMELINE_TTL_DAYS', '400')),
+        # Local gridded weather store (see api_calls/weather_grid.py). When set, weather inside
+        # the grid is looked up from the memory-mapped store instead of calling Stormglass.
+        'WEATHER_GRID_DIR': os.getenv('WEATHER_GRID_DIR', ''),
+        'WEATHER_GRID_METHOD': os.getenv('WEATHER_GRID_METHOD', 'linear'),
+        # Monthly partitions of environment_data (see partitions.py): partitions are created this
+        # many months ahead, and months older than ARCHIVE_AFTER_MONTHS (0 disables archival) are
+        # moved to compressed files in ARCHIVE_DIR.
+        'PARTITION_MONTHS_AHEAD': int(os.getenv('PARTITION_MONTHS_AHEAD', '2')),
+        'ARCHIVE_AFTER_MONTHS': int(os.getenv('ARCHIVE_AFTER_MONTHS', '0')),
+        'ARCHIVE_DIR': os.getenv('ARCHIVE_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'archive')),
+        # Enrichment reuse (see neighbours.py): a record with complete, upstream-enriched records
+        # within NEIGHBOUR_MAX_DISTANCE_M metres and NEIGHBOUR_MAX_MINUTES minutes on the same UTC
+        # day copies or interpolates their values instead of calling Stormglass.
+        'NEIGHBOUR_REUSE_ENABLED': os.getenv('NEIGHBOUR_REUSE_ENABLED', 'true').lower() in ('1', 'true', 'yes'),
+        'NEIGHBOUR_MAX_DISTANCE_M': float(os.getenv('NEIGHBOUR_MAX_DISTANCE_M', '500')),
+        'NEIGHBOUR_MAX_MINUTES': float(os.getenv('NEIGHBOUR_MAX_MINUTES', '30')),
+        # Catch log imports (see importer.py): rows validated and loaded per transaction, records
+        # per bulk enrichment task, and where uploads wait for the import job (web and bulk
+        # workers must share this directory).
+        'IMPORT_CHUNK_SIZE': int(os.getenv('IMPORT_CHUNK_SIZE', '5000')),
+        'IMPORT_BATCH_SIZE': int(os.getenv('IMPORT_BATCH_SIZE', '200')),
+        'IMPORT_DIR': os.getenv('IMPORT_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'imports')),
+        # Cross-worker coalescing of identical in-flight Stormglass requests (see singleflight.py).
+        # The lock TTL must exceed the request timeout (5s connect + 30s read) so a slow leader
+        # keeps its lock, and waiters wait a little longer than that.
+        'SINGLE_FLIGHT_ENABLED': os.getenv('SINGLE_FLIGHT_ENABLED', 'true').lower() in ('1', 'true', 'yes'),
+        'SINGLE_FLIGHT_LOCK_TTL': float(os.getenv('SINGLE_FLIGHT_LOCK_TTL', '45')),
+        'SINGLE_FLIGHT_RESULT_TTL': float(os.getenv('SINGLE_FLIGHT_RESULT_TTL', '10')),
+        'SINGLE_FLIGHT_WAIT_TIMEOUT': float(os.getenv('SINGLE_FLIGHT_WAIT_TIMEOUT', '50')),
+    }
@@ -0,0 +1,84 @@
+import random
+from functools import wraps
+
+from flask import current_app, g, has_app_context, has_request_context
+from flask_sqlalchemy.session import Session
+from sqlalchemy import event
+
+from redis_store import get_redis
+
+# Bind keys of the read replicas are REPLICA_BIND_PREFIX + index (see config.py).
+REPLICA_BIND_PREFIX = 'replica'
+STICKY_KEY = 'db:sticky:{user_id}'
+
+
+class RoutingSession(Session):
+    """
+    Session that sends reads to a read replica while a request is marked read-only.
+
+    Everything else (writes, flushes, Celery tasks, requests without @read_only, and reads by
+    a user who wrote within the last REPLICA_STICKY_SECONDS) uses the primary.
+    """
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and not self._flushing:
+            replica = _request_replica(self._db.engines)
+            if replica is not None:
+                return replica
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+def _request_replica(engines):
+    """Return the replica engine chosen for the current read-only request, or None."""
+    if not has_app_context() or g.get('db_role') != 'replica':
+        return None
+    if 'db_replica' not in g:
+        replicas = [key for key in engines if isinstance(key, str) and key.startswith(REPLICA_BIND_PREFIX)]
+        g.db_replica = engines[random.choice(replicas)] if replicas else None
+    return g.db_replica
+
+
+def recently_wrote(user_id) -> bool:
+    """Return True if the user committed a write recently enough that replicas may lag behind it."""
+    try:
+        return bool(get_redis().exists(STICKY_KEY.format(user_id=user_id)))
+    except Exception:
+        # Without Redis we cannot tell, so stay on the primary.
+        return True
+
+
+def mark_recent_write(user_id, seconds: float):
+    """Pin the user's reads to the primary for `seconds`."""
+    try:
+        get_redis().set(STICKY_KEY.format(user_id=user_id), 1, px=int(seconds * 1000))
+    except Exception as e:
+        print(f"Could not record recent write for {user_id}: {e}")
+
+
+def read_only(f):
+    """
+    Route the endpoint's queries to a read replica.
+
+    Apply below @token_required. Users who wrote recently are served from the primary so they
+    always see their own writes.
+    """
+    @wraps(f)
+    def decorated(*args, **kwargs):
+        if current_app.config['SQLALCHEMY_REPLICA_URIS']:
+            current_user = g.get('current_user')
+            if current_user is None or not recently_wrote(current_user.id):
+                g.db_role = 'replica'
+        return f(*args, **kwargs)
+    return decorated
+
+
+def init_app(app):
+    """Make commits made during an authenticated request pin that user's reads to the primary."""
+    if not app.config['SQLALCHEMY_REPLICA_URIS']:
+        return
+    sticky_seconds = app.config['REPLICA_STICKY_SECONDS']
+
+    @event.listens_for(RoutingSession, 'after_commit')
+    def _pin_writer_to_primary(session):
+        if has_request_context() and g.get('current_user') is not None:
+            mark_recent_write(g.current_user.id, sticky_seconds)
@@ -0,0 +1,218 @@
+"""
+Geography-aware routing of fetch_env_data tasks.
+
+Each live worker consumes, besides the shared 'live' queue, a queue of its own
+("live.geo.<worker name>") and registers it in Redis while it runs. Submissions are routed
+by the geohash cell of their coordinates to one of those queues through a consistent-hash
+ring, so all enrichment for a stretch of coastline lands on the same worker and its
+in-process caches (tide timelines, connection pools, single-flight leaders) see all of it.
+When a worker joins or leaves, only the cells on its share of the ring move; tasks left on
+the queue of a worker that has gone are moved back to the shared live queue by
+reap_geo_queues.
+"""
+import hashlib
+import threading
+import time
+from bisect import bisect
+from typing import Dict, Iterable, List, Optional
+
+from celery.signals import celeryd_after_setup, worker_ready, worker_shutdown
+from flask import current_app
+
+from celery_app import celery, get_flask_app
+from redis_store import get_redis
+
+GEO_QUEUE_PREFIX = 'live.geo.'
+# Sorted set of live worker queues, scored by the time their registration expires.
+MEMBERS_KEY = 'georoute:members'
+# Hash of every worker queue ever registered -> when it was last seen, for the reaper.
+KNOWN_QUEUES_KEY = 'georoute:queues'
+
+_BASE32 = '0123456789bcdefghjkmnpqrstuvwxyz'
+
+def geohash(lat: float, lon: float, precision: int = 4) -> str:
+    """
+    Encode a position as a geohash of `precision` characters.
+
+    Nearby positions share a prefix; 4 characters is a cell of about 39 x 20 km, 5 about
+    5 x 5 km.
+    """
+    lat_range, lon_range = [-90.0, 90.0], [-180.0, 180.0]
+    chars = []
+    bits, bit_count, even = 0, 0, True
+    while len(chars) < precision:
+        interval, value = (lon_range, lon) if even else (lat_range, lat)
+        middle = (interval[0] + interval[1]) / 2
+        if value >= middle:
+            bits = (bits << 1) | 1
+            interval[0] = middle
+        else:
+            bits <<= 1
+            interval[1] = middle
+        even = not even
+        bit_count += 1
+        if bit_count == 5:
+            chars.append(_BASE32[bits])
+            bits, bit_count = 0, 0
+    return ''.join(chars)
+
+def _hash(value: str) -> int:
+    # Stable across processes, unlike hash().
+    return int.from_bytes(hashlib.md5(value.encode()).digest()[:8], 'big')
+
+class HashRing:
+    """
+    Consistent-hash ring over a set of nodes, each placed at `vnodes` points.
+
+    Adding or removing a node only reassigns the keys on the arcs it owns (about 1/N of
+    them); every other key keeps its node.
+    """
+
+    def __init__(self, nodes: Iterable[str], vnodes: int = 64):
+        self.nodes = frozenset(nodes)
+        points = sorted((_hash(f'{node}#{i}'), node) for node in self.nodes for i in range(vnodes))
+        self._hashes = [point for point, _ in points]
+        self._nodes = [node for _, node in points]
+
+    def node_for(self, key: str) -> Optional[str]:
+        """Return the node owning `key`, or None for an empty ring."""
+        if not self._hashes:
+            return None
+        return self._nodes[bisect(self._hashes, _hash(key)) % len(self._hashes)]
+
+def live_members(redis_client=None) -> List[str]:
+    """Return the worker queues whose registration has not expired."""
+    return [member.decode() if isinstance(member, bytes) else member
+            for member in (redis_client or get_redis()).zrangebyscore(MEMBERS_KEY, time.time(), '+inf')]
+
+_ring = {'checked': 0.0, 'ring': HashRing(())}
+
+def current_ring() -> HashRing:
+    """
+    The ring of live worker queues, re-read from Redis at most every GEO_ROUTING_REFRESH
+    seconds per process and rebuilt only when membership changed.
+    """
+    now = time.monotonic()
+    if now - _ring['checked'] >= current_app.config['GEO_ROUTING_REFRESH']:
+        _ring['checked'] = now
+        try:
+            members = frozenset(live_members())
+        except Exception as e:
+            print(f"Could not read geo routing members: {e}")
+            members = frozenset()
+        if members != _ring['ring'].nodes:
+            _ring['ring'] = HashRing(members, current_app.config['GEO_ROUTING_VNODES'])
+    return _ring['ring']
+
+def queue_for_location(lat: float, lon: float) -> Optional[str]:
+    """Return the worker queue for a position, or None when geo routing is off or no worker is registered."""
+    if not current_app.config['GEO_ROUTING_ENABLED'] or lat is None or lon is None:
+        return None
+    return current_ring().node_for(geohash(lat, lon, current_app.config['GEO_ROUTING_PRECISION']))
+
+def drain_queue(queue: str, target: str = 'live') -> int:
+    """
+    Move every task waiting on a worker queue to `target` in the broker; returns how many moved.
+
+    The broker's consumers pop from the right, so moving newest-first onto the right end keeps
+    the tasks in order and ahead of the ones already waiting on `target`.
+    """
+    from queues import _broker
+    broker = _broker()
+    moved = 0
+    while broker.lmove(queue, target, 'LEFT', 'RIGHT') is not None:
+        moved += 1
+    return moved
+
+@celery.task(name='reap_geo_queues')
+def reap_geo_queues(forget_after: float = 86400.0) -> Dict[str, int]:
+    """
+    Scheduled job: move tasks stranded on the queues of workers that left (or stopped
+    renewing their registration) back to the shared live queue.
+
+    Returns:
+        dict: Tasks moved per queue.
+    """
+    redis_client = get_redis()
+    now = time.time()
+    redis_client.zremrangebyscore(MEMBERS_KEY, '-inf', now)
+    alive = set(live_members(redis_client))
+    moved = {}
+    for queue, last_seen in redis_client.hgetall(KNOWN_QUEUES_KEY).items():
+        queue = queue.decode() if isinstance(queue, bytes) else queue
+        if queue in alive:
+            continue
+        count = drain_queue(queue)
+        if count:
+            moved[queue] = count
+        # Late acks can still return unacknowledged tasks to the queue for a while, so it is
+        # only forgotten once the worker has been gone for a day.
+        if now - float(last_seen) > forget_after:
+            redis_client.hdel(KNOWN_QUEUES_KEY, queue)
+    if moved:
+        print(f"Moved stranded geo-routed tasks back to the live queue: {moved}")
+    return moved
+
+class _Membership:
+    """Keeps this worker's queue registered in Redis while the worker runs."""
+
+    def __init__(self):
+        self.queue = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    def register(self):
+        config = get_flask_app().config
+        now = time.time()
+        redis_client = get_redis()
+        pipe = redis_client.pipeline()
+        pipe.zadd(MEMBERS_KEY, {self.queue: now + 3 * config['GEO_ROUTING_HEARTBEAT']})
+        pipe.hset(KNOWN_QUEUES_KEY, self.queue, now)
+        pipe.execute()
+
+    def start(self):
+        interval = get_flask_app().config['GEO_ROUTING_HEARTBEAT']
+
+        def heartbeat():
+            while not self._stop.is_set():
+                try:
+                    self.register()
+                except Exception as e:
+                    print(f"Could not renew geo routing membership: {e}")
+                self._stop.wait(interval)
+
+        self._thread = threading.Thread(target=heartbeat, name='geo-routing-heartbeat', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        try:
+            get_redis().zrem(MEMBERS_KEY, self.queue)
+            # Tasks routed here before the ring noticed are picked up by the remaining workers.
+            drain_queue(self.queue)
+        except Exception as e:
+            print(f"Could not leave geo routing: {e}")
+
+_membership = _Membership()
+
+@celeryd_after_setup.connect
+def _add_geo_queue(sender, instance, **kwargs):
+    """Give every worker that consumes the live queue a queue of its own."""
+    if not get_flask_app().config['GEO_ROUTING_ENABLED']:
+        return
+    consume_from = instance.app.amqp.queues.consume_from
+    if consume_from and 'live' not in consume_from:
+        return
+    _membership.queue = f'{GEO_QUEUE_PREFIX}{sender}'
+    instance.app.amqp.queues.select_add(_membership.queue)
+
+@worker_ready.connect
+def _join_ring(**kwargs):
+    if _membership.queue is not None:
+        _membership.start()
+        print(f"Joined geo routing as {_membership.queue}.")
+
+@worker_shutdown.connect
+def _leave_ring(**kwargs):
+    if _membership.queue is not None:
+        _membership.stop()
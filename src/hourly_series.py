@@ -0,0 +1,170 @@
+"""
+Hourly condition series stored per location-day.
+
+Every weather and sea-level response used for enrichment already covers the whole day. The
+hourly values are kept in hourly_series as packed little-endian float32 arrays (one row per
+parameter, one column per hour of the day, NaN where upstream had no value), about 2 KB per
+location-day, so the conditions around any catch can be served without calling Stormglass.
+"""
+import math
+import struct
+import sys
+import threading
+from array import array
+from collections import OrderedDict
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from sqlalchemy import event, select
+from sqlalchemy.orm import Session
+
+from api_calls.locations import location_key
+from models import db, HourlySeries, WEATHER_FIELDS
+
+HOURS_PER_DAY = 24
+SERIES_FORMAT_VERSION = 1
+# version, number of parameters, hours per parameter
+_HEADER = struct.Struct('<BBB')
+
+# Parameters in each column, in packed row order. WEATHER_FIELDS lists the Stormglass weather
+# parameters in the order of api_calls.weather.WEATHER_PARAMS; that module (and arrow) is not
+# imported here because app.py loads this module at web startup.
+WEATHER_SERIES = tuple(WEATHER_FIELDS)
+SEA_LEVEL_SERIES = ("seaLevel",)
+SERIES_COLUMNS = {"weather": WEATHER_SERIES, "seaLevel": SEA_LEVEL_SERIES}
+
+# Session.info key of the (store, keys) upserted in the session's open transaction.
+_UNCOMMITTED_KEY = "hourly_series_uncommitted"
+
+def pack_series(rows: Sequence[Sequence[Optional[float]]]) -> bytes:
+    """Pack equal-length rows of values (None for missing) into the stored binary format."""
+    n_hours = len(rows[0]) if rows else 0
+    values = array('f', (math.nan if value is None else value for row in rows for value in row))
+    if sys.byteorder != 'little':
+        values.byteswap()
+    return _HEADER.pack(SERIES_FORMAT_VERSION, len(rows), n_hours) + values.tobytes()
+
+def unpack_series(blob: bytes) -> List[List[Optional[float]]]:
+    """Inverse of pack_series: rows of values, with None for missing hours."""
+    version, n_rows, n_hours = _HEADER.unpack_from(blob)
+    if version != SERIES_FORMAT_VERSION:
+        raise ValueError(f"Unsupported hourly series format version {version}.")
+    values = array('f')
+    values.frombytes(blob[_HEADER.size:_HEADER.size + 4 * n_rows * n_hours])
+    if sys.byteorder != 'little':
+        values.byteswap()
+    return [[None if math.isnan(value) else value for value in values[i * n_hours:(i + 1) * n_hours]]
+            for i in range(n_rows)]
+
+class HourlySeriesStore:
+    """
+    Collects hourly series from API responses and writes them to hourly_series.
+
+    save() only buffers, so clients can call it mid-request; write_pending() upserts all
+    buffered location-days in the caller's transaction just before it commits, keeping row
+    locks short. Location-days written recently by this process are skipped; they count as
+    written only once that transaction commits.
+    """
+
+    def __init__(self, decimals: int = 2, remember: int = 4096):
+        self.decimals = decimals
+        self.remember = remember
+        self._pending: Dict[Tuple[str, Any], Dict[str, bytes]] = {}
+        self._written: "OrderedDict[Tuple[str, Any, str], None]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def save(self, lat: float, lon: float, timestamp, column: str, values: Dict[str, List[Optional[float]]]):
+        """
+        Buffer one day of hourly values for the location and day of a catch.
+
+        Args:
+            lat (float): Latitude.
+            lon (float): Longitude.
+            timestamp: Any time on the day the values cover.
+            column (str): "weather" or "seaLevel".
+            values (dict): Parameter -> HOURS_PER_DAY values (see SERIES_COLUMNS for the parameters).
+        """
+        if not any(value is not None for series in values.values() for value in series):
+            return
+        import arrow
+        location = location_key(lat, lon, self.decimals)
+        day = arrow.get(timestamp).floor('day').date()
+        with self._lock:
+            if (location, day, column) in self._written:
+                self._written.move_to_end((location, day, column))
+                return
+            blob = pack_series([values.get(name, [None] * HOURS_PER_DAY) for name in SERIES_COLUMNS[column]])
+            self._pending.setdefault((location, day), {})[column] = blob
+
+    def write_pending(self):
+        """Upsert the buffered location-days in the current session (the caller commits)."""
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        if not pending:
+            return
+        if db.engine.dialect.name == 'postgresql':
+            from sqlalchemy.dialects.postgresql import insert
+        else:
+            from sqlalchemy.dialects.sqlite import insert
+        rows = [{"location": location, "day": day, "weather": columns.get("weather"),
+                 "seaLevel": columns.get("seaLevel")} for (location, day), columns in sorted(pending.items())]
+        statement = insert(HourlySeries).values(rows)
+        table = HourlySeries.__table__
+        # A column missing from this batch keeps what another worker stored.
+        db.session.execute(statement.on_conflict_do_update(
+            index_elements=['location', 'day'],
+            set_={name: db.func.coalesce(statement.excluded[name], table.c[name]) for name in SERIES_COLUMNS}))
+        keys = [(location, day, column) for (location, day), columns in pending.items() for column in columns]
+        db.session.info.setdefault(_UNCOMMITTED_KEY, []).append((self, keys))
+
+    def _mark_written(self, keys: List[Tuple[str, Any, str]]):
+        with self._lock:
+            for key in keys:
+                self._written[key] = None
+            while len(self._written) > self.remember:
+                self._written.popitem(last=False)
+
+@event.listens_for(Session, 'after_commit')
+def _mark_committed_series(session):
+    for store, keys in session.info.pop(_UNCOMMITTED_KEY, ()):
+        store._mark_written(keys)
+
+@event.listens_for(Session, 'after_rollback')
+def _forget_rolled_back_series(session):
+    # Not marked written, so the next save() of these location-days buffers them again.
+    session.info.pop(_UNCOMMITTED_KEY, None)
+
+def context_window(timestamp: datetime, lat: float, lon: float, hours: int, decimals: int = 2) -> Dict[str, Any]:
+    """
+    Read the stored hourly values from `hours` hours before to `hours` hours after the hour
+    closest to `timestamp`.
+
+    Returns:
+        dict: "times" (ISO hours) and "series" (parameter -> values, None where nothing is stored).
+    """
+    import arrow
+    center = arrow.get(timestamp).shift(minutes=30).floor('hour')
+    first = center.shift(hours=-hours)
+    times = [first.shift(hours=i) for i in range(2 * hours + 1)]
+    days = sorted({t.floor('day').date() for t in times})
+    stored = {row.day: row for row in db.session.execute(
+        select(HourlySeries).where(HourlySeries.location == location_key(lat, lon, decimals),
+                                   HourlySeries.day.in_(days))).scalars()}
+    unpacked = {}
+    for day, row in stored.items():
+        for column, names in SERIES_COLUMNS.items():
+            blob = getattr(row, column)
+            if blob:
+                for name, values in zip(names, unpack_series(blob)):
+                    unpacked[(day, name)] = values
+    series = {}
+    for names in SERIES_COLUMNS.values():
+        for name in names:
+            series[name] = [_stored_value(unpacked.get((t.floor('day').date(), name)), t.hour) for t in times]
+    return {"times": [t.isoformat() for t in times], "series": series}
+
+def _stored_value(values: Optional[List[Optional[float]]], hour: int) -> Optional[float]:
+    if values is None or hour >= len(values) or values[hour] is None:
+        return None
+    # float32 keeps about 7 significant digits; drop the binary noise beyond them.
+    return float(f"{values[hour]:.7g}")
@@ -0,0 +1,287 @@
+"""
+Bulk import of historical catches from CSV or GPX files.
+
+Files are streamed: rows are parsed and validated in chunks of IMPORT_CHUNK_SIZE, each chunk
+is loaded with one COPY (a multi-row INSERT on other databases) in its own transaction, and
+nothing but the current chunk is held in memory, however large the file. Once loaded, the
+records are queued for enrichment on the bulk queue in batches ordered by location cell and
+day, so each batch's tide, weather and astronomy windows are shared by its records.
+
+CSV files need a header with a timestamp column (timestamp, time, datetime or date) and
+latitude (lat, latitude) and longitude (lng, lon, long, longitude) columns. GPX files
+contribute every waypoint and track point that has a <time>.
+"""
+import csv
+import io
+import os
+import uuid
+import xml.etree.ElementTree as ET
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+import click
+from flask import current_app
+from sqlalchemy import Numeric, cast, func, insert, select, update
+
+from celery_app import celery
+from models import db, User, EnvironmentData
+from queues import BULK_BATCH_SIZE, enqueue_bulk_enrichment
+import partitions
+
+# Loaded but not yet queued, and queued for enrichment on the bulk queue. Neither is
+# 'pending', so imports never count against admission control or get claimed by async workers
+# ahead of live submissions.
+IMPORTED_STATUS = 'imported'
+QUEUED_STATUS = 'queued'
+IMPORT_FORMATS = ('csv', 'gpx')
+# Rejected rows reported back (with their error) per import; the rest are only counted.
+MAX_REPORTED_ERRORS = 20
+
+_TIMESTAMP_COLUMNS = ('timestamp', 'time', 'datetime', 'date')
+_LAT_COLUMNS = ('lat', 'latitude')
+_LON_COLUMNS = ('lng', 'lon', 'long', 'longitude')
+
+class ImportFormatError(ValueError):
+    """Raised when a file cannot be imported at all (unknown format or missing columns)."""
+
+def detect_format(filename: str) -> str:
+    """Return 'csv' or 'gpx' from a file name's extension."""
+    extension = os.path.splitext(filename or '')[1].lower().lstrip('.')
+    if extension not in IMPORT_FORMATS:
+        raise ImportFormatError(f"Cannot tell the format of {filename!r}; expected a .csv or .gpx file.")
+    return extension
+
+def _column(fieldnames: List[str], candidates: Tuple[str, ...]) -> str:
+    by_name = {name.strip().lower(): name for name in fieldnames}
+    for candidate in candidates:
+        if candidate in by_name:
+            return by_name[candidate]
+    raise ImportFormatError(f"CSV header has none of the columns {', '.join(candidates)}.")
+
+def iter_csv_rows(stream) -> Iterator[Tuple[int, Any, Any, Any]]:
+    """Yield (line, timestamp, latitude, longitude) raw values from a binary CSV stream."""
+    text = io.TextIOWrapper(stream, encoding='utf-8-sig', newline='')
+    try:
+        reader = csv.DictReader(text)
+        if not reader.fieldnames:
+            raise ImportFormatError("The CSV file is empty.")
+        timestamp_column = _column(reader.fieldnames, _TIMESTAMP_COLUMNS)
+        lat_column = _column(reader.fieldnames, _LAT_COLUMNS)
+        lon_column = _column(reader.fieldnames, _LON_COLUMNS)
+        for row in reader:
+            yield reader.line_num, row.get(timestamp_column), row.get(lat_column), row.get(lon_column)
+    finally:
+        # Leave the caller's stream open (the wrapper would close it when collected).
+        text.detach()
+
+def iter_gpx_rows(stream) -> Iterator[Tuple[int, Any, Any, Any]]:
+    """Yield (point number, time, lat, lon) raw values for each timed waypoint and track point of a GPX stream."""
+    number = 0
+    parents = []
+    for event, element in ET.iterparse(stream, events=('start', 'end')):
+        if event == 'start':
+            parents.append(element)
+            continue
+        parents.pop()
+        tag = element.tag.rsplit('}', 1)[-1]
+        if tag not in ('wpt', 'trkpt', 'rtept'):
+            continue
+        number += 1
+        time_element = next((child for child in element if child.tag.rsplit('}', 1)[-1] == 'time'), None)
+        if time_element is not None:
+            yield number, time_element.text, element.get('lat'), element.get('lon')
+        # Detach parsed points so memory stays flat on large tracks.
+        if parents:
+            parents[-1].remove(element)
+
+def parse_row(timestamp_value, lat_value, lon_value) -> Tuple[datetime, float, float]:
+    """
+    Validate one row's values.
+
+    Returns:
+        tuple: (timestamp as naive UTC, latitude, longitude).
+
+    Raises:
+        ValueError: If a value is missing or out of range.
+    """
+    if not timestamp_value:
+        raise ValueError("missing timestamp")
+    timestamp = datetime.fromisoformat(timestamp_value.strip())
+    if timestamp.tzinfo is not None:
+        timestamp = timestamp.astimezone(timezone.utc).replace(tzinfo=None)
+    if lat_value in (None, '') or lon_value in (None, ''):
+        raise ValueError("missing latitude or longitude")
+    lat, lon = float(lat_value), float(lon_value)
+    if not -90 <= lat <= 90 or not -180 <= lon <= 180:
+        raise ValueError(f"position {lat}, {lon} out of range")
+    return timestamp, lat, lon
+
+def _copy_chunk(user_id, chunk: List[Tuple[datetime, float, float]], partitioned_months: Optional[set]):
+    """
+    Load one validated chunk in the current transaction.
+
+    `partitioned_months` is the set of months whose partitions this import has made sure of,
+    or None if environment_data is not partitioned.
+    """
+    if db.engine.dialect.name != 'postgresql':
+        db.session.execute(insert(EnvironmentData), [
+            {'id': uuid.uuid4(), 'timestamp': timestamp, 'latitude': lat, 'longitude': lon,
+             'status': IMPORTED_STATUS, 'user_id': user_id} for timestamp, lat, lon in chunk])
+        return
+    connection = db.session.connection()
+    # Historical months get their own partitions instead of piling up in the default one.
+    if partitioned_months is not None:
+        for month in {partitions.month_start(timestamp) for timestamp, _, _ in chunk} - partitioned_months:
+            partitions.create_partition(connection, month)
+            partitioned_months.add(month)
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for timestamp, lat, lon in chunk:
+        writer.writerow((uuid.uuid4(), timestamp.isoformat(), repr(lat), repr(lon), IMPORTED_STATUS, user_id))
+    buffer.seek(0)
+    partitions.copy_from_file(
+        connection, 'COPY environment_data (id, "timestamp", latitude, longitude, status, user_id) '
+                    'FROM STDIN WITH (FORMAT csv)', buffer)
+
+def load_rows(user_id, rows: Iterable[Tuple[int, Any, Any, Any]], chunk_size: int = 5000,
+              progress: Optional[Callable[[Dict[str, Any]], None]] = None) -> Dict[str, Any]:
+    """
+    Validate and load raw rows for a user, one chunk per transaction.
+
+    Args:
+        user_id: Owner of the imported records.
+        rows (iterable): (line, timestamp, latitude, longitude) raw values, e.g. from iter_csv_rows.
+        chunk_size (int, optional): Rows validated and loaded per transaction.
+        progress (callable, optional): Called with the running counts after each chunk.
+
+    Returns:
+        dict: Counts of rows read, imported and rejected, and the first rejected rows' errors.
+    """
+    stats = {'rows': 0, 'imported': 0, 'rejected': 0, 'errors': []}
+    partitioned_months = None
+    if db.engine.dialect.name == 'postgresql' and partitions.is_partitioned(db.session.connection()):
+        partitioned_months = set()
+    chunk = []
+
+    def flush():
+        if chunk:
+            _copy_chunk(user_id, chunk, partitioned_months)
+            db.session.commit()
+            stats['imported'] += len(chunk)
+            chunk.clear()
+        if progress is not None:
+            progress(stats)
+
+    for line, timestamp_value, lat_value, lon_value in rows:
+        stats['rows'] += 1
+        try:
+            chunk.append(parse_row(timestamp_value, lat_value, lon_value))
+        except ValueError as e:
+            stats['rejected'] += 1
+            if len(stats['errors']) < MAX_REPORTED_ERRORS:
+                stats['errors'].append({'line': line, 'error': str(e)})
+        if len(chunk) >= chunk_size:
+            flush()
+    flush()
+    return stats
+
+def schedule_imported(user_id, batch_size: int = BULK_BATCH_SIZE, decimals: int = 2,
+                      batches_per_page: int = 50) -> int:
+    """
+    Queue enrichment of a user's imported records on the bulk queue.
+
+    Records are taken in order of location cell (coordinates rounded to `decimals` places)
+    and day, and cut into fetch_env_data_batch tasks of `batch_size`, so records sharing
+    upstream windows are enriched together. Each batch is marked 'queued' before its task is
+    sent, so a later import by the same user does not queue it again; ids are read a page of
+    `batches_per_page` batches at a time, so memory does not grow with the import.
+
+    Returns:
+        int: Number of records queued.
+    """
+    query = select(EnvironmentData.id) \
+        .where(EnvironmentData.user_id == user_id, EnvironmentData.status == IMPORTED_STATUS) \
+        .order_by(func.round(cast(EnvironmentData.latitude, Numeric), decimals),
+                  func.round(cast(EnvironmentData.longitude, Numeric), decimals),
+                  func.date(EnvironmentData.timestamp)) \
+        .limit(batch_size * batches_per_page)
+    queued = 0
+    while True:
+        page = db.session.execute(query).scalars().all()
+        if not page:
+            return queued
+        for start in range(0, len(page), batch_size):
+            batch = page[start:start + batch_size]
+            db.session.execute(update(EnvironmentData).where(EnvironmentData.id.in_(batch))
+                               .values(status=QUEUED_STATUS), execution_options={'synchronize_session': False})
+            db.session.commit()
+            enqueue_bulk_enrichment(batch, batch_size)
+            queued += len(batch)
+
+def import_file(user_id, path: str, file_format: str,
+                progress: Optional[Callable[[Dict[str, Any]], None]] = None) -> Dict[str, Any]:
+    """
+    Import a CSV or GPX file for a user and queue the imported records for enrichment.
+
+    Must be called inside an application context.
+
+    Returns:
+        dict: load_rows counts plus 'queued' and the file size in 'bytes'.
+    """
+    config = current_app.config
+    size = os.path.getsize(path)
+    with open(path, 'rb') as stream:
+        rows = iter_csv_rows(stream) if file_format == 'csv' else iter_gpx_rows(stream)
+
+        def report(stats):
+            if progress is not None:
+                progress({**stats, 'bytes_read': stream.tell(), 'bytes': size})
+
+        stats = load_rows(user_id, rows, config['IMPORT_CHUNK_SIZE'], report)
+    stats['bytes'] = size
+    stats['queued'] = schedule_imported(user_id, config['IMPORT_BATCH_SIZE'], config['STORMGLASS_COORD_DECIMALS'])
+    return stats
+
+@celery.task(bind=True, name='import_catches')
+def import_catches(self, user_id, path, file_format, remove=True):
+    """
+    Background import of an uploaded catch log (see import_file), reporting progress through
+    the task state. The uploaded file is deleted afterwards unless `remove` is False.
+    """
+    user_uuid = uuid.UUID(str(user_id))
+
+    def progress(stats):
+        self.update_state(state='PROGRESS', meta={'user_id': str(user_id), **stats})
+
+    try:
+        stats = import_file(user_uuid, path, file_format, progress)
+    finally:
+        if remove and os.path.exists(path):
+            os.remove(path)
+    print(f"Imported {stats['imported']} of {stats['rows']} rows for user {user_id}; "
+          f"{stats['queued']} queued for enrichment.")
+    return {'user_id': str(user_id), **stats}
+
+def init_app(app):
+    """Register the import CLI command on the Flask app."""
+
+    @app.cli.command('import-catches')
+    @click.argument('path', type=click.Path(exists=True, dir_okay=False))
+    @click.option('--user', 'username', required=True, help='Username that owns the imported catches.')
+    @click.option('--format', 'file_format', type=click.Choice(IMPORT_FORMATS), default=None,
+                  help='File format (default: from the extension).')
+    def import_command(path, username, file_format):
+        """Import a CSV or GPX catch log and queue it for enrichment."""
+        user = User.query.filter_by(username=username).first()
+        if user is None:
+            raise click.ClickException(f'No user named {username}.')
+
+        def progress(stats):
+            click.echo(f"\r{stats['bytes_read'] * 100 // max(stats['bytes'], 1):3d}%  "
+                       f"{stats['imported']} imported, {stats['rejected']} rejected", nl=False)
+
+        stats = import_file(user.id, path, file_format or detect_format(path), progress)
+        click.echo()
+        for error in stats['errors']:
+            click.echo(f"  line {error['line']}: {error['error']}")
+        click.echo(f"Imported {stats['imported']} of {stats['rows']} rows; {stats['queued']} queued for enrichment.")
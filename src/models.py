@@ -2,8 +2,25 @@ import uuid
 from flask_sqlalchemy import SQLAlchemy
 from sqlalchemy.dialects.postgresql import UUID  # Use this if you're on PostgreSQL
 from werkzeug.security import generate_password_hash, check_password_hash
+from db_routing import RoutingSession
 
-db = SQLAlchemy()
+# Read-only endpoints are routed to replicas by the session (see db_routing.py).
+db = SQLAlchemy(session_options={'class_': RoutingSession})
+
+# EnvironmentData columns filled in by each API client during enrichment.
+TIDE_FIELDS = ("currentTideHeight", "tideHour", "maxHighTide", "minLowTide")
+WEATHER_FIELDS = (
+    "airTemperature", "pressure", "cloudCover", "currentDirection", "currentSpeed",
+    "swellDirection", "swellHeight", "swellPeriod", "secondarySwellPeriod", "secondarySwellDirection",
+    "secondarySwellHeight", "waveDirection", "waveHeight", "wavePeriod",
+    "windWaveDirection", "windWaveHeight", "windWavePeriod",
+    "windDirection", "windSpeed", "gust"
+)
+ASTRONOMY_FIELDS = (
+    "sunrise", "sunset", "moonrise", "moonset", "moonFraction",
+    "currentMoonPhaseText", "currentMoonPhaseValue", "lightLevel"
+)
+ENRICHMENT_FIELDS = TIDE_FIELDS + WEATHER_FIELDS + ASTRONOMY_FIELDS
 
 class User(db.Model):
     __tablename__ = 'users'
@@ -31,10 +48,14 @@ class User(db.Model):
 
 class EnvironmentData(db.Model):
     __tablename__ = 'environment_data'
+    # On PostgreSQL the table is partitioned by capture month (see partitions.py).
+    __table_args__ = {'postgresql_partition_by': 'RANGE (timestamp)'}
     
-    # Primary key as UUID.
+    # Primary key as UUID. The partition key has to be part of the table's primary key, so
+    # the database key is (id, timestamp) while the ORM identifies records by id alone.
     id = db.Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
-    timestamp = db.Column(db.DateTime, nullable=False)
+    timestamp = db.Column(db.DateTime, primary_key=True, nullable=False, index=True)
+    __mapper_args__ = {'primary_key': [id]}
     latitude = db.Column(db.Float, nullable=False)
     longitude = db.Column(db.Float, nullable=False)
     status = db.Column(db.String(20), default='pending')
@@ -77,9 +98,20 @@ class EnvironmentData(db.Model):
     currentMoonPhaseValue = db.Column(db.Float, nullable=True)
     lightLevel = db.Column(db.String, nullable=True)
     
-    # Foreign key to User.
-    user_id = db.Column(UUID(as_uuid=True), db.ForeignKey('users.id'), nullable=False)
-    user = db.relationship('User', backref=db.backref('environment_data', lazy=True))
+    # Provenance of the enrichment fields (see neighbours.py): 'upstream' when fetched,
+    # 'neighbour' or 'interpolated' when derived from nearby records, in which case
+    # source_record_id is the closest of them. Not a foreign key: the database key is
+    # (id, timestamp), and the source may be deleted or archived independently.
+    enrichment_source = db.Column(db.String(20), nullable=True)
+    source_record_id = db.Column(UUID(as_uuid=True), nullable=True)
+
+    # When an async enrichment worker claimed the record (UTC); see async_enrichment.py.
+    claimed_at = db.Column(db.DateTime, nullable=True)
+    
+    # Foreign key to User. Deleting a user deletes their records in the database
+    # (ON DELETE CASCADE) rather than loading them through the ORM first.
+    user_id = db.Column(UUID(as_uuid=True), db.ForeignKey('users.id', ondelete='CASCADE'), nullable=False, index=True)
+    user = db.relationship('User', backref=db.backref('environment_data', lazy=True, passive_deletes=True))
     
     def to_dict(self):
         return {
@@ -123,5 +155,49 @@ class EnvironmentData(db.Model):
             "currentMoonPhaseText": self.currentMoonPhaseText,
             "currentMoonPhaseValue": self.currentMoonPhaseValue,
             "lightLevel": self.lightLevel,
+            "enrichment_source": self.enrichment_source,
             "user_id": str(self.user_id)
         }
+
+class ConditionProfile(db.Model):
+    """
+    Running summary of the conditions of one user's complete catches (see profiles.py).
+
+    Each metric keeps Welford's online statistics (count, mean and M2, the sum of squared
+    deviations), so a catch can be added or removed without reading the user's history.
+    """
+    __tablename__ = 'condition_profiles'
+
+    user_id = db.Column(UUID(as_uuid=True), db.ForeignKey('users.id', ondelete='CASCADE'), primary_key=True)
+    catches = db.Column(db.Integer, nullable=False, default=0)
+
+    swellHeightCount = db.Column(db.Integer, nullable=False, default=0)
+    swellHeightMean = db.Column(db.Float, nullable=False, default=0.0)
+    swellHeightM2 = db.Column(db.Float, nullable=False, default=0.0)
+    windSpeedCount = db.Column(db.Integer, nullable=False, default=0)
+    windSpeedMean = db.Column(db.Float, nullable=False, default=0.0)
+    windSpeedM2 = db.Column(db.Float, nullable=False, default=0.0)
+    pressureCount = db.Column(db.Integer, nullable=False, default=0)
+    pressureMean = db.Column(db.Float, nullable=False, default=0.0)
+    pressureM2 = db.Column(db.Float, nullable=False, default=0.0)
+    tideHourCount = db.Column(db.Integer, nullable=False, default=0)
+    tideHourMean = db.Column(db.Float, nullable=False, default=0.0)
+    tideHourM2 = db.Column(db.Float, nullable=False, default=0.0)
+
+    # Catches per value of currentMoonPhaseText and lightLevel.
+    moonPhaseCounts = db.Column(db.JSON, nullable=False, default=dict)
+    lightLevelCounts = db.Column(db.JSON, nullable=False, default=dict)
+
+class HourlySeries(db.Model):
+    """
+    Hourly weather and sea-level values for one location cell and UTC day (see hourly_series.py).
+
+    Each column holds packed float32 rows, one per parameter, indexed by hour of the day.
+    """
+    __tablename__ = 'hourly_series'
+
+    # Location cell as produced by api_calls.stormglass.location_key, e.g. "50.22,-4.80".
+    location = db.Column(db.String(32), primary_key=True)
+    day = db.Column(db.Date, primary_key=True)
+    weather = db.Column(db.LargeBinary, nullable=True)
+    seaLevel = db.Column(db.LargeBinary, nullable=True)
@@ -0,0 +1,163 @@
+"""
+Enrichment reuse from nearby complete records.
+
+Catches logged within a few hundred metres and minutes of one another (often from the same
+boat) get near-identical tide, weather and astronomy values. Before calling Stormglass, a
+record looks for complete records within NEIGHBOUR_MAX_DISTANCE_M metres and
+NEIGHBOUR_MAX_MINUTES minutes on the same UTC day, using the partial index
+ix_environment_data_complete_spacetime:
+
+  - with neighbours on both sides in time, the time-varying values (sea level and weather)
+    are interpolated between the closest earlier and later one, directions around the circle;
+  - otherwise the closest neighbour's values are copied.
+
+Day-level values (the day's tide extremes and astronomy) are copied, tideHour is shifted by
+the time difference, and lightLevel is copied only when no sunrise or sunset lies between
+the two catches. Only values that came from upstream are reused (enrichment_source
+'upstream', or unset on records enriched before provenance was kept), so copies are never
+copied again. Records with no usable neighbour are enriched upstream as before.
+"""
+import math
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional
+
+import arrow
+from flask import current_app
+from sqlalchemy import or_, select
+
+from models import db, EnvironmentData, TIDE_FIELDS, WEATHER_FIELDS, ASTRONOMY_FIELDS
+
+# Values of EnvironmentData.enrichment_source.
+UPSTREAM_SOURCE = 'upstream'
+NEIGHBOUR_SOURCE = 'neighbour'
+INTERPOLATED_SOURCE = 'interpolated'
+
+# Values that change through the day; the other fields are per UTC day and copied as they are.
+TIME_VARYING_FIELDS = ("currentTideHeight",) + WEATHER_FIELDS
+DIRECTION_FIELDS = tuple(field for field in WEATHER_FIELDS if field.endswith("Direction"))
+
+METRES_PER_DEGREE = 111320.0
+# Candidates read on each side in time per lookup.
+MAX_CANDIDATES = 50
+
+def _distance_m(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
+    """Equirectangular distance in metres, accurate to well under 1% at these ranges."""
+    x = math.radians(lon2 - lon1) * math.cos(math.radians((lat1 + lat2) / 2))
+    y = math.radians(lat2 - lat1)
+    return math.hypot(x, y) * 6371000.0
+
+def find_neighbours(timestamp: datetime, lat: float, lon: float, max_distance_m: float,
+                    max_minutes: float, exclude_id=None) -> List[Dict[str, Any]]:
+    """
+    Return the complete, upstream-enriched records within `max_distance_m` metres and
+    `max_minutes` minutes of a position and time, on the same UTC day, closest in time first.
+
+    Each result is a row mapping of id, timestamp, latitude, longitude and the enrichment
+    fields, plus "distance" (metres) and "offset" (seconds from `timestamp`, negative for
+    earlier records).
+    """
+    day_start = arrow.get(timestamp).floor('day').naive
+    earliest = max(timestamp - timedelta(minutes=max_minutes), day_start)
+    latest = min(timestamp + timedelta(minutes=max_minutes), day_start + timedelta(days=1) - timedelta(microseconds=1))
+    lat_margin = max_distance_m / METRES_PER_DEGREE
+    lon_margin = max_distance_m / (METRES_PER_DEGREE * max(math.cos(math.radians(lat)), 0.01))
+    columns = [EnvironmentData.id, EnvironmentData.timestamp, EnvironmentData.latitude, EnvironmentData.longitude] \
+        + [getattr(EnvironmentData, field) for field in TIDE_FIELDS + WEATHER_FIELDS + ASTRONOMY_FIELDS]
+    query = select(*columns).where(
+        EnvironmentData.status == 'complete',
+        or_(EnvironmentData.enrichment_source.is_(None), EnvironmentData.enrichment_source == UPSTREAM_SOURCE),
+        EnvironmentData.latitude.between(lat - lat_margin, lat + lat_margin),
+        EnvironmentData.longitude.between(lon - lon_margin, lon + lon_margin),
+    )
+    if exclude_id is not None:
+        query = query.where(EnvironmentData.id != exclude_id)
+    # The closest records on each side in time, read in index order so each scan stops early.
+    earlier = query.where(EnvironmentData.timestamp.between(earliest, timestamp)) \
+        .order_by(EnvironmentData.timestamp.desc()).limit(MAX_CANDIDATES)
+    later = query.where(EnvironmentData.timestamp > timestamp, EnvironmentData.timestamp <= latest) \
+        .order_by(EnvironmentData.timestamp).limit(MAX_CANDIDATES)
+    rows = list(db.session.execute(earlier).mappings()) + list(db.session.execute(later).mappings())
+    neighbours = []
+    for row in rows:
+        distance = _distance_m(lat, lon, row["latitude"], row["longitude"])
+        if distance <= max_distance_m:
+            neighbours.append({**row, "distance": distance, "offset": (row["timestamp"] - timestamp).total_seconds()})
+    neighbours.sort(key=lambda neighbour: (abs(neighbour["offset"]), neighbour["distance"]))
+    return neighbours
+
+def _shifted_tide_hour(neighbour: Dict[str, Any], offset: float):
+    """
+    The neighbour's tideHour moved to a time `offset` seconds from it, or False if a high
+    tide may lie between the two (so the value cannot be derived).
+    """
+    tide_hour = neighbour["tideHour"]
+    if tide_hour is None:
+        return None
+    shifted = tide_hour + offset / 3600.0
+    if tide_hour >= 12:
+        # Already capped: only later times are known to stay capped.
+        return 12 if offset >= 0 else False
+    if shifted < 0:
+        return False
+    return min(shifted, 12)
+
+def _same_light(neighbour: Dict[str, Any], timestamp: datetime) -> bool:
+    """True if no stored sunrise or sunset lies between the neighbour's time and `timestamp`."""
+    low, high = sorted((arrow.get(neighbour["timestamp"]), arrow.get(timestamp)))
+    for key in ("sunrise", "sunset"):
+        if neighbour[key]:
+            try:
+                boundary = arrow.get(neighbour[key])
+            except Exception:
+                return False
+            if low < boundary <= high:
+                return False
+    return True
+
+def _interpolate(field: str, before: Optional[float], after: Optional[float], weight: float) -> Optional[float]:
+    if before is None or after is None:
+        return before if weight < 0.5 else after
+    if field in DIRECTION_FIELDS:
+        # Shortest way around the circle, so 350 and 10 meet at 0, not 180.
+        delta = (after - before + 180.0) % 360.0 - 180.0
+        return (before + weight * delta) % 360.0
+    return before + weight * (after - before)
+
+def reuse_values(timestamp: datetime, lat: float, lon: float, record_id=None) -> Optional[Dict[str, Any]]:
+    """
+    Derive a record's enrichment from its neighbours (see the module docstring).
+
+    Must be called inside an application context. Returns None when NEIGHBOUR_REUSE_ENABLED
+    is off or no neighbour is usable.
+
+    Returns:
+        dict: Values for every enrichment field plus enrichment_source and source_record_id
+              (the neighbour closest in time).
+    """
+    config = current_app.config
+    if not config['NEIGHBOUR_REUSE_ENABLED']:
+        return None
+    neighbours = find_neighbours(timestamp, lat, lon, config['NEIGHBOUR_MAX_DISTANCE_M'],
+                                 config['NEIGHBOUR_MAX_MINUTES'], exclude_id=record_id)
+    # A neighbour is usable if tideHour and lightLevel carry over to this record's time.
+    usable = []
+    for neighbour in neighbours:
+        tide_hour = _shifted_tide_hour(neighbour, -neighbour["offset"])
+        if tide_hour is not False and _same_light(neighbour, timestamp):
+            usable.append((neighbour, tide_hour))
+    if not usable:
+        return None
+    nearest, tide_hour = usable[0]
+    values = {field: nearest[field] for field in TIDE_FIELDS + WEATHER_FIELDS + ASTRONOMY_FIELDS}
+    values["tideHour"] = tide_hour
+    values["enrichment_source"] = NEIGHBOUR_SOURCE
+    values["source_record_id"] = nearest["id"]
+
+    before = next((neighbour for neighbour, _ in usable if neighbour["offset"] <= 0), None)
+    after = next((neighbour for neighbour, _ in usable if neighbour["offset"] > 0), None)
+    if nearest["offset"] != 0 and before is not None and after is not None:
+        weight = -before["offset"] / (after["offset"] - before["offset"])
+        for field in TIME_VARYING_FIELDS:
+            values[field] = _interpolate(field, before[field], after[field], weight)
+        values["enrichment_source"] = INTERPOLATED_SOURCE
+    return values
@@ -0,0 +1,326 @@
+import csv
+import gzip
+import os
+import re
+import uuid
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+import click
+from flask import current_app
+from sqlalchemy import text
+
+from celery_app import celery
+from models import db
+
+# environment_data is range-partitioned on timestamp, one partition per capture month, named
+# environment_data_yYYYYmMM. Rows outside every monthly partition land in the default partition
+# until maintenance moves them into their month.
+PARENT_TABLE = 'environment_data'
+DEFAULT_PARTITION = 'environment_data_default'
+
+def month_start(value: datetime) -> datetime:
+    """Return midnight on the first day of `value`'s month."""
+    return datetime(value.year, value.month, 1)
+
+def add_months(month: datetime, months: int) -> datetime:
+    """Return the first day of the month `months` months after `month` (negative goes back)."""
+    index = month.year * 12 + month.month - 1 + months
+    return datetime(index // 12, index % 12 + 1, 1)
+
+def parse_month(value: str) -> datetime:
+    """Parse a 'YYYY-MM' month."""
+    return datetime.strptime(value, '%Y-%m')
+
+def partition_name(month: datetime) -> str:
+    return f"{PARENT_TABLE}_y{month:%Y}m{month:%m}"
+
+def _table_exists(connection, name: str) -> bool:
+    return connection.execute(text("SELECT to_regclass(:name) IS NOT NULL"), {'name': name}).scalar()
+
+def is_partitioned(connection) -> bool:
+    """Return True if environment_data is already a partitioned table."""
+    return connection.execute(text(
+        "SELECT EXISTS (SELECT 1 FROM pg_partitioned_table pt JOIN pg_class c ON c.oid = pt.partrelid "
+        "WHERE c.relname = :name)"), {'name': PARENT_TABLE}).scalar()
+
+def convert_to_partitioned(connection):
+    """
+    Rebuild an unpartitioned environment_data table (from earlier versions) as a partitioned one.
+
+    All rows are copied into the default partition, which ensure_partitions() then splits into
+    monthly partitions. The table is locked for the duration, so run it in a maintenance window.
+    The user foreign key and indexes are recreated by schema.POSTGRES_UPGRADES afterwards.
+    """
+    staging = f'{PARENT_TABLE}_partitioned'
+    connection.execute(text(
+        f'CREATE TABLE {staging} (LIKE {PARENT_TABLE} INCLUDING DEFAULTS) PARTITION BY RANGE ("timestamp")'))
+    connection.execute(text(f'ALTER TABLE {staging} ADD CONSTRAINT {staging}_pkey PRIMARY KEY (id, "timestamp")'))
+    connection.execute(text(f'CREATE TABLE {DEFAULT_PARTITION} PARTITION OF {staging} DEFAULT'))
+    connection.execute(text(f'INSERT INTO {staging} SELECT * FROM {PARENT_TABLE}'))
+    connection.execute(text(f'DROP TABLE {PARENT_TABLE}'))
+    connection.execute(text(f'ALTER TABLE {staging} RENAME TO {PARENT_TABLE}'))
+    connection.execute(text(f'ALTER TABLE {PARENT_TABLE} RENAME CONSTRAINT {staging}_pkey TO {PARENT_TABLE}_pkey'))
+
+def create_partition(connection, month: datetime) -> bool:
+    """
+    Create the partition for `month`, moving any of its rows out of the default partition.
+
+    Returns:
+        bool: False if the partition already existed.
+    """
+    name = partition_name(month)
+    if _table_exists(connection, name):
+        return False
+    lower, upper = month, add_months(month, 1)
+    bounds = {'lower': lower, 'upper': upper}
+    # Attaching a partition fails while the default partition still holds rows in its range,
+    # so the table is filled from the default partition before it is attached.
+    connection.execute(text(f'CREATE TABLE {name} (LIKE {PARENT_TABLE} INCLUDING DEFAULTS INCLUDING CONSTRAINTS)'))
+    connection.execute(text(
+        f'INSERT INTO {name} SELECT * FROM {DEFAULT_PARTITION} '
+        f'WHERE "timestamp" >= :lower AND "timestamp" < :upper'), bounds)
+    connection.execute(text(
+        f'DELETE FROM {DEFAULT_PARTITION} WHERE "timestamp" >= :lower AND "timestamp" < :upper'), bounds)
+    connection.execute(text(
+        f"ALTER TABLE {PARENT_TABLE} ATTACH PARTITION {name} "
+        f"FOR VALUES FROM ('{lower:%Y-%m-%d}') TO ('{upper:%Y-%m-%d}')"))
+    return True
+
+def ensure_partitions(connection, months_ahead: int) -> List[str]:
+    """
+    Create the default partition, the partitions for the current month and `months_ahead`
+    months after it, and a partition for every month that has rows in the default partition.
+
+    Returns:
+        list: Names of the partitions created.
+    """
+    connection.execute(text(f'CREATE TABLE IF NOT EXISTS {DEFAULT_PARTITION} PARTITION OF {PARENT_TABLE} DEFAULT'))
+    current = month_start(datetime.utcnow())
+    months = {add_months(current, offset) for offset in range(months_ahead + 1)}
+    stray = connection.execute(text(
+        f'SELECT DISTINCT date_trunc(\'month\', "timestamp") FROM {DEFAULT_PARTITION}')).scalars()
+    months.update(month_start(month) for month in stray)
+    return [partition_name(month) for month in sorted(months) if create_partition(connection, month)]
+
+def list_partitions(connection) -> List[Dict[str, Any]]:
+    """Return the attached partitions of environment_data with their bounds and approximate row counts."""
+    rows = connection.execute(text(
+        "SELECT c.relname, pg_get_expr(c.relpartbound, c.oid), c.reltuples::bigint "
+        "FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid JOIN pg_class p ON p.oid = i.inhparent "
+        "WHERE p.relname = :name ORDER BY c.relname"), {'name': PARENT_TABLE})
+    return [{'name': name, 'bounds': bounds, 'rows': max(count, 0)} for name, bounds, count in rows]
+
+def copy_to_file(connection, statement: str, stream):
+    """
+    Run a `COPY ... TO STDOUT` statement on a SQLAlchemy connection, writing the output to
+    the binary `stream`. Works with both psycopg2 and psycopg (3) drivers.
+    """
+    cursor = connection.connection.cursor()
+    if connection.dialect.driver == 'psycopg2':
+        cursor.copy_expert(statement, stream)
+        return
+    with cursor.copy(statement) as copy:
+        for data in copy:
+            stream.write(data)
+
+def copy_from_file(connection, statement: str, stream, chunk_size: int = 1 << 16):
+    """
+    Run a `COPY ... FROM STDIN` statement on a SQLAlchemy connection, reading the input from
+    `stream`. Works with both psycopg2 and psycopg (3) drivers.
+    """
+    cursor = connection.connection.cursor()
+    if connection.dialect.driver == 'psycopg2':
+        cursor.copy_expert(statement, stream)
+        return
+    with cursor.copy(statement) as copy:
+        while True:
+            data = stream.read(chunk_size)
+            if not data:
+                break
+            copy.write(data)
+
+def archive_path(archive_dir: str, month: datetime, part: int = 1) -> str:
+    """Path of one archive file of `month`; later parts get a _<n> suffix."""
+    suffix = '' if part == 1 else f'_{part}'
+    return os.path.join(archive_dir, f"{partition_name(month)}{suffix}.csv.gz")
+
+def archive_paths(archive_dir: str, month: datetime) -> List[str]:
+    """
+    Return the archive files of `month`, oldest first.
+
+    A month is archived more than once when rows for it arrive after it was archived (e.g.
+    historical imports re-create its partition); each archival adds a part.
+    """
+    pattern = re.compile(rf"{re.escape(partition_name(month))}(?:_(\d+))?\.csv\.gz")
+    parts = []
+    if os.path.isdir(archive_dir):
+        for entry in os.listdir(archive_dir):
+            match = pattern.fullmatch(entry)
+            if match:
+                parts.append((int(match.group(1) or 1), os.path.join(archive_dir, entry)))
+    return [path for _, path in sorted(parts)]
+
+def archive_partition(connection, month: datetime, archive_dir: str) -> str:
+    """
+    Detach the partition for `month`, write it to a gzipped CSV in `archive_dir` and drop it.
+
+    The file is written before the transaction commits, so a failed export leaves the partition
+    attached. Existing archives of the month are never overwritten: the rows are written as a
+    new part. Restore it with restore_partition().
+
+    Returns:
+        str: Path of the archive file.
+    """
+    name = partition_name(month)
+    os.makedirs(archive_dir, exist_ok=True)
+    temporary = os.path.join(archive_dir, f"{name}.{uuid.uuid4().hex}.tmp")
+    connection.execute(text(f'ALTER TABLE {PARENT_TABLE} DETACH PARTITION {name}'))
+    try:
+        with gzip.open(temporary, 'wb') as archive:
+            copy_to_file(connection, f'COPY {name} TO STDOUT WITH (FORMAT csv, HEADER true)', archive)
+        part = len(archive_paths(archive_dir, month)) + 1
+        while True:
+            path = archive_path(archive_dir, month, part)
+            try:
+                # Unlike a rename, a link fails if the target exists, so no part is ever replaced.
+                os.link(temporary, path)
+                break
+            except FileExistsError:
+                part += 1
+    finally:
+        if os.path.exists(temporary):
+            os.remove(temporary)
+    connection.execute(text(f'DROP TABLE {name}'))
+    return path
+
+def archive_month(month: datetime, archive_dir: str) -> str:
+    """
+    Archive `month` in its own transaction (see archive_partition), removing the new archive
+    file again if the transaction fails, so the month is not archived twice.
+    """
+    path = None
+    try:
+        with db.engine.begin() as connection:
+            path = archive_partition(connection, month, archive_dir)
+    except Exception:
+        if path is not None and os.path.exists(path):
+            os.remove(path)
+        raise
+    return path
+
+def restore_partition(connection, month: datetime, archive_dir: str, table: Optional[str] = None) -> str:
+    """
+    Load an archived month (every part of it) back into the database.
+
+    By default the rows are copied back into environment_data (re-creating the month's
+    partition); call retire_archives() once the transaction has committed, so a later
+    archival of the month does not write the same rows again. With `table`, they are loaded
+    into a standalone table of that name instead, so the archive can be queried on demand
+    without touching the live table.
+
+    Returns:
+        str: Name of the table the rows were loaded into.
+    """
+    paths = archive_paths(archive_dir, month)
+    if not paths:
+        raise FileNotFoundError(f"No archive of {month:%Y-%m} in {archive_dir}.")
+    if table is None:
+        connection.execute(text(f'CREATE TABLE IF NOT EXISTS {DEFAULT_PARTITION} PARTITION OF {PARENT_TABLE} DEFAULT'))
+        create_partition(connection, month)
+        target = PARENT_TABLE
+    else:
+        connection.execute(text(f'CREATE TABLE {table} (LIKE {PARENT_TABLE} INCLUDING DEFAULTS)'))
+        target = table
+    for path in paths:
+        with gzip.open(path, 'rt', newline='') as archive:
+            # Load by the archive's own header, so months archived before columns were added
+            # still restore (the new columns are left empty).
+            columns = ', '.join(f'"{column}"' for column in next(csv.reader([archive.readline()])))
+            copy_from_file(connection, f'COPY {target} ({columns}) FROM STDIN WITH (FORMAT csv)', archive)
+    return target
+
+def retire_archives(archive_dir: str, month: datetime) -> List[str]:
+    """
+    Rename the archive files of a month restored into environment_data to *.restored.
+
+    They are kept, but no longer count as archives of the month. Returns the new paths.
+    """
+    retired = []
+    for path in archive_paths(archive_dir, month):
+        os.replace(path, path + '.restored')
+        retired.append(path + '.restored')
+    return retired
+
+def archivable_months(connection, archive_after_months: int) -> List[datetime]:
+    """Return the months whose partitions are older than `archive_after_months` months."""
+    cutoff = add_months(month_start(datetime.utcnow()), -archive_after_months)
+    months = []
+    for partition in list_partitions(connection):
+        try:
+            month = datetime.strptime(partition['name'], f"{PARENT_TABLE}_y%Ym%m")
+        except ValueError:
+            continue
+        if month < cutoff:
+            months.append(month)
+    return months
+
+def _is_postgres() -> bool:
+    return db.engine.dialect.name == 'postgresql'
+
+@celery.task(name='maintain_partitions')
+def maintain_partitions():
+    """
+    Scheduled job: create upcoming monthly partitions, move stray rows out of the default
+    partition and, when ARCHIVE_AFTER_MONTHS is set, archive partitions older than that.
+    """
+    if not _is_postgres():
+        return {'created': [], 'archived': []}
+    config = current_app.config
+    with db.engine.begin() as connection:
+        created = ensure_partitions(connection, config['PARTITION_MONTHS_AHEAD'])
+    archived = []
+    if config['ARCHIVE_AFTER_MONTHS'] > 0:
+        with db.engine.connect() as connection:
+            months = archivable_months(connection, config['ARCHIVE_AFTER_MONTHS'])
+        for month in months:
+            # One transaction per month, so a failure keeps the months archived so far.
+            archived.append(archive_month(month, config['ARCHIVE_DIR']))
+    print(f"Partition maintenance: created {created}, archived {archived}")
+    return {'created': created, 'archived': archived}
+
+def init_app(app):
+    """Register the partition management CLI commands on the Flask app."""
+
+    @app.cli.group('partitions')
+    def partitions_group():
+        """Manage the monthly partitions of environment_data (PostgreSQL only)."""
+
+    @partitions_group.command('list')
+    def list_command():
+        """List partitions with their bounds and approximate row counts."""
+        with db.engine.connect() as connection:
+            for partition in list_partitions(connection):
+                click.echo(f"{partition['name']:<32} {partition['rows']:>10}  {partition['bounds']}")
+
+    @partitions_group.command('maintain')
+    def maintain_command():
+        """Create upcoming partitions and archive old ones now."""
+        click.echo(maintain_partitions())
+
+    @partitions_group.command('archive')
+    @click.argument('month', type=parse_month)
+    def archive_command(month):
+        """Archive the partition for MONTH (YYYY-MM) to ARCHIVE_DIR and drop it."""
+        click.echo(f"Archived to {archive_month(month, app.config['ARCHIVE_DIR'])}")
+
+    @partitions_group.command('restore')
+    @click.argument('month', type=parse_month)
+    @click.option('--into-table', default=None, help='Load into this standalone table instead of environment_data.')
+    def restore_command(month, into_table):
+        """Restore the archived partition for MONTH (YYYY-MM)."""
+        with db.engine.begin() as connection:
+            target = restore_partition(connection, month, app.config['ARCHIVE_DIR'], into_table)
+        if into_table is None:
+            retire_archives(app.config['ARCHIVE_DIR'], month)
+        click.echo(f"Restored into {target}")
@@ -0,0 +1,129 @@
+from datetime import datetime, timedelta
+from typing import Any, Dict, List
+
+import click
+from flask import current_app
+from sqlalchemy import Numeric, cast, func
+
+from api_calls.stormglass import get_json, location_key
+from celery_app import celery
+from models import db, EnvironmentData
+from redis_store import get_redis
+from upstream import build_fetch_json
+
+# Worst-case upstream requests to prefetch one mark-day: tide extremes (day and previous day),
+# sea level, weather and astronomy.
+REQUESTS_PER_MARK_DAY = 5
+
+def find_hot_marks(lookback_days: int, min_catches: int, marks_per_user: int, decimals: int) -> List[Dict[str, Any]]:
+    """
+    Mine EnvironmentData history for each user's most frequent fishing marks.
+
+    Catches are grouped per user into location cells of `decimals` decimal places (the same
+    grid the upstream requests are snapped to). Each user's top `marks_per_user` cells with at
+    least `min_catches` catches in the last `lookback_days` days are kept, then cells are merged
+    across users.
+
+    Returns:
+        list: Marks as {"lat", "lon", "catches", "users"}, busiest first.
+    """
+    since = datetime.utcnow() - timedelta(days=lookback_days)
+    lat_cell = func.round(cast(EnvironmentData.latitude, Numeric), decimals)
+    lon_cell = func.round(cast(EnvironmentData.longitude, Numeric), decimals)
+    catches = func.count(EnvironmentData.id)
+    rows = db.session.query(EnvironmentData.user_id, lat_cell, lon_cell, catches) \
+        .filter(EnvironmentData.timestamp >= since) \
+        .group_by(EnvironmentData.user_id, lat_cell, lon_cell) \
+        .having(catches >= min_catches) \
+        .all()
+
+    per_user: Dict[Any, List] = {}
+    for user_id, lat, lon, count in rows:
+        per_user.setdefault(user_id, []).append((count, float(lat), float(lon)))
+
+    marks: Dict[str, Dict[str, Any]] = {}
+    for user_marks in per_user.values():
+        for count, lat, lon in sorted(user_marks, reverse=True)[:marks_per_user]:
+            key = location_key(lat, lon, decimals)
+            mark = marks.setdefault(key, {"lat": lat, "lon": lon, "catches": 0, "users": 0})
+            mark["catches"] += count
+            mark["users"] += 1
+    return sorted(marks.values(), key=lambda mark: (mark["users"], mark["catches"]), reverse=True)
+
+def _quota_key(day) -> str:
+    return f"prefetch:quota:{day:%Y-%m-%d}"
+
+def prefetch_marks(marks: List[Dict[str, Any]], day: datetime, quota: int) -> Dict[str, int]:
+    """
+    Fetch the tide, weather and astronomy windows for `day` at each mark through the normal
+    cached fetch chain, stopping before the day's upstream request quota would be exceeded.
+
+    Returns:
+        dict: Counts of marks prefetched and skipped, and upstream requests made.
+    """
+    from tasks import build_api_clients
+
+    upstream_calls = {"count": 0}
+
+    def counting_get_json(url, params, headers):
+        upstream_calls["count"] += 1
+        return get_json(url, params, headers)
+
+    tide_client, weather_client, astronomy_client = build_api_clients(
+        build_fetch_json(current_app.config, http_fetch=counting_get_json))
+    redis_client = get_redis()
+    quota_key = _quota_key(datetime.utcnow())
+    used = int(redis_client.get(quota_key) or 0)
+    # Midnight makes the tide client also fetch the previous day's extremes, so every
+    # request a submission later that day can make is warmed.
+    target = datetime(day.year, day.month, day.day)
+    prefetched = skipped = 0
+    for mark in marks:
+        if used + upstream_calls["count"] + REQUESTS_PER_MARK_DAY > quota:
+            skipped += 1
+            continue
+        try:
+            tide_client.get_tide_data(target, mark["lat"], mark["lon"])
+            weather_client.get_weather_data(target, mark["lat"], mark["lon"])
+            astronomy_client.get_astronomy_data(target, mark["lat"], mark["lon"])
+            prefetched += 1
+        except Exception as e:
+            print(f"Prefetch failed for mark {mark['lat']},{mark['lon']}: {e}")
+    redis_client.incrby(quota_key, upstream_calls["count"])
+    redis_client.expire(quota_key, 2 * 86400)
+    return {"marks": len(marks), "prefetched": prefetched, "skipped": skipped,
+            "upstream_requests": upstream_calls["count"]}
+
+@celery.task(name='prefetch_hot_marks')
+def prefetch_hot_marks(days_ahead=0):
+    """
+    Scheduled off-peak job: warm the response cache for users' frequent marks.
+
+    Runs at PREFETCH_HOUR_UTC (see celery_app beat schedule) and prefetches the UTC day
+    `days_ahead` days from now, so submissions at those marks complete from cached data.
+    """
+    config = current_app.config
+    marks = find_hot_marks(config['PREFETCH_LOOKBACK_DAYS'], config['PREFETCH_MIN_CATCHES'],
+                           config['PREFETCH_MARKS_PER_USER'], config['STORMGLASS_COORD_DECIMALS'])
+    day = datetime.utcnow() + timedelta(days=days_ahead)
+    result = prefetch_marks(marks, day, config['PREFETCH_DAILY_QUOTA'])
+    print(f"Prefetch for {day:%Y-%m-%d}: {result}")
+    return result
+
+def init_app(app):
+    """Register the prefetch CLI command on the Flask app."""
+
+    @app.cli.command('prefetch')
+    @click.option('--days-ahead', type=int, default=0, help='Prefetch the UTC day this many days from today.')
+    @click.option('--dry-run', is_flag=True, help='Only list the marks that would be prefetched.')
+    def prefetch_command(days_ahead, dry_run):
+        """Prefetch environmental data for users' frequent marks."""
+        if dry_run:
+            config = app.config
+            marks = find_hot_marks(config['PREFETCH_LOOKBACK_DAYS'], config['PREFETCH_MIN_CATCHES'],
+                                   config['PREFETCH_MARKS_PER_USER'], config['STORMGLASS_COORD_DECIMALS'])
+            for mark in marks:
+                click.echo(f"{mark['lat']:.4f},{mark['lon']:.4f}  catches={mark['catches']}  users={mark['users']}")
+            click.echo(f'{len(marks)} marks.')
+        else:
+            click.echo(prefetch_hot_marks(days_ahead))
@@ -0,0 +1,180 @@
+import math
+from collections import defaultdict
+from typing import Any, Dict, Iterable, Optional
+
+import click
+from sqlalchemy import delete, select
+
+from models import db, ConditionProfile, EnvironmentData
+
+# Numeric conditions summarised as mean and variance, and the categorical ones counted.
+PROFILE_METRICS = ("swellHeight", "windSpeed", "pressure", "tideHour")
+PROFILE_CATEGORIES = {"currentMoonPhaseText": "moonPhaseCounts", "lightLevel": "lightLevelCounts"}
+
+# EnvironmentData columns needed to add a record to (or remove it from) a profile.
+PROFILE_COLUMNS = ("user_id", "status") + PROFILE_METRICS + tuple(PROFILE_CATEGORIES)
+
+def profile_values(source) -> Dict[str, Any]:
+    """Pick the PROFILE_COLUMNS from an EnvironmentData object, a row mapping or a dict."""
+    if isinstance(source, dict) or hasattr(source, "keys"):
+        return {column: source.get(column) for column in PROFILE_COLUMNS}
+    return {column: getattr(source, column) for column in PROFILE_COLUMNS}
+
+def _new_profile(user_id) -> ConditionProfile:
+    profile = ConditionProfile(user_id=user_id, catches=0, moonPhaseCounts={}, lightLevelCounts={})
+    for metric in PROFILE_METRICS:
+        setattr(profile, f"{metric}Count", 0)
+        setattr(profile, f"{metric}Mean", 0.0)
+        setattr(profile, f"{metric}M2", 0.0)
+    return profile
+
+def apply_record(profile: ConditionProfile, values: Dict[str, Any], sign: int = 1):
+    """
+    Add (sign=1) or remove (sign=-1) one complete record's values with Welford's update.
+
+    Removal is the exact inverse of addition, so deleting a catch restores the statistics
+    the profile would have had without it (up to rounding).
+    """
+    profile.catches = max(0, profile.catches + sign)
+    for metric in PROFILE_METRICS:
+        value = values.get(metric)
+        if value is None:
+            continue
+        value = float(value)
+        count = getattr(profile, f"{metric}Count")
+        mean = getattr(profile, f"{metric}Mean")
+        m2 = getattr(profile, f"{metric}M2")
+        if sign > 0:
+            count += 1
+            delta = value - mean
+            mean += delta / count
+            m2 += delta * (value - mean)
+        elif count <= 1:
+            count, mean, m2 = 0, 0.0, 0.0
+        else:
+            count -= 1
+            old_mean = mean
+            mean = (old_mean * (count + 1) - value) / count
+            m2 = max(0.0, m2 - (value - old_mean) * (value - mean))
+        setattr(profile, f"{metric}Count", count)
+        setattr(profile, f"{metric}Mean", mean)
+        setattr(profile, f"{metric}M2", m2)
+    for field, column in PROFILE_CATEGORIES.items():
+        value = values.get(field)
+        if value is None:
+            continue
+        # JSON columns only notice reassignment, so update a copy.
+        counts = dict(getattr(profile, column) or {})
+        counts[value] = counts.get(value, 0) + sign
+        if counts[value] <= 0:
+            del counts[value]
+        setattr(profile, column, counts)
+
+def _lock_profiles(user_ids) -> Dict[Any, ConditionProfile]:
+    """Return the profiles of `user_ids` locked FOR UPDATE, creating missing ones."""
+    user_ids = sorted(set(user_ids), key=str)
+    profiles = {profile.user_id: profile for profile in db.session.execute(
+        select(ConditionProfile).where(ConditionProfile.user_id.in_(user_ids))
+        .order_by(ConditionProfile.user_id).with_for_update()).scalars()}
+    missing = [user_id for user_id in user_ids if user_id not in profiles]
+    if missing:
+        dialect = db.engine.dialect.name
+        if dialect == 'postgresql':
+            from sqlalchemy.dialects.postgresql import insert
+        else:
+            from sqlalchemy.dialects.sqlite import insert
+        # Two workers can create the same profile at once; the loser re-reads the winner's row.
+        db.session.execute(insert(ConditionProfile).values([
+            {column.name: getattr(_new_profile(user_id), column.key) for column in ConditionProfile.__table__.columns}
+            for user_id in missing]).on_conflict_do_nothing(index_elements=['user_id']))
+        profiles.update({profile.user_id: profile for profile in db.session.execute(
+            select(ConditionProfile).where(ConditionProfile.user_id.in_(missing))
+            .order_by(ConditionProfile.user_id).with_for_update()).scalars()})
+    return profiles
+
+def update_profiles(added: Iterable[Dict[str, Any]] = (), removed: Iterable[Dict[str, Any]] = ()):
+    """
+    Apply records that became complete (`added`) and complete records that were deleted or
+    re-enriched (`removed`) to their users' profiles.
+
+    Takes profile_values() dicts; records whose status is not 'complete' are ignored. Runs in
+    the caller's transaction (the profile rows stay locked until it commits), so the profile
+    changes commit or roll back together with the record changes.
+    """
+    changes = defaultdict(list)
+    for sign, records in ((-1, removed), (1, added)):
+        for values in records:
+            if values.get("status") == "complete" and values.get("user_id") is not None:
+                changes[values["user_id"]].append((sign, values))
+    if not changes:
+        return
+    profiles = _lock_profiles(changes)
+    for user_id, user_changes in changes.items():
+        for sign, values in user_changes:
+            apply_record(profiles[user_id], values, sign)
+
+def profile_summary(profile: Optional[ConditionProfile]) -> Dict[str, Any]:
+    """Format a profile (or None, for a user with no complete catches) for the API."""
+    if profile is None:
+        profile = _new_profile(None)
+    metrics = {}
+    for metric in PROFILE_METRICS:
+        count = getattr(profile, f"{metric}Count")
+        variance = getattr(profile, f"{metric}M2") / (count - 1) if count > 1 else None
+        metrics[metric] = {
+            "count": count,
+            "mean": getattr(profile, f"{metric}Mean") if count else None,
+            "variance": variance,
+            "stddev": math.sqrt(variance) if variance is not None else None,
+        }
+    return {
+        "catches": profile.catches,
+        "metrics": metrics,
+        "moonPhases": dict(profile.moonPhaseCounts or {}),
+        "lightLevels": dict(profile.lightLevelCounts or {}),
+    }
+
+def rebuild_profiles(user_id=None, batch_size: int = 5000) -> int:
+    """
+    Recompute profiles from the complete EnvironmentData records, for one user or everyone.
+
+    For databases that predate profiles, or to clear accumulated rounding. Records are
+    streamed in user order, so memory holds one profile at a time. Run it while enrichment is
+    quiet: records completing during the rebuild may be missed. Returns the number of
+    profiles written.
+    """
+    query = select(*(getattr(EnvironmentData, column) for column in PROFILE_COLUMNS)) \
+        .where(EnvironmentData.status == 'complete').order_by(EnvironmentData.user_id)
+    clear = delete(ConditionProfile)
+    if user_id is not None:
+        query = query.where(EnvironmentData.user_id == user_id)
+        clear = clear.where(ConditionProfile.user_id == user_id)
+    db.session.execute(clear)
+    written = 0
+    profile = None
+    for row in db.session.execute(query.execution_options(yield_per=batch_size)).mappings():
+        if profile is None or profile.user_id != row["user_id"]:
+            if profile is not None:
+                db.session.flush()
+                db.session.expunge(profile)
+            profile = _new_profile(row["user_id"])
+            db.session.add(profile)
+            written += 1
+        apply_record(profile, row)
+    db.session.commit()
+    return written
+
+def init_app(app):
+    """Register the `flask profiles` commands on the Flask app."""
+
+    @app.cli.group('profiles')
+    def profiles_group():
+        """Per-user condition profiles."""
+
+    @profiles_group.command('rebuild')
+    @click.option('--user-id', default=None, help='Rebuild only this user')
+    def rebuild_command(user_id):
+        """Recompute condition profiles from complete records."""
+        import uuid
+        written = rebuild_profiles(uuid.UUID(user_id) if user_id else None)
+        click.echo(f'Rebuilt {written} profiles.')
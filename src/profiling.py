@@ -0,0 +1,242 @@
+import cProfile
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional
+
+from redis_store import get_redis
+
+# Redis keys holding the runtime switch and threshold, so every web process and worker
+# picks up a change without a restart.
+ENABLED_KEY = "profiling:enabled"
+THRESHOLD_KEY = "profiling:threshold_ms"
+
+DEFAULT_THRESHOLD_MS = float(os.getenv("PROFILE_THRESHOLD_MS", "1000"))
+PROFILE_DIR = os.getenv("PROFILE_DIR", os.path.join(tempfile.gettempdir(), "fishcaptures-profiles"))
+SAMPLE_INTERVAL = float(os.getenv("PROFILE_SAMPLE_INTERVAL_MS", "5")) / 1000.0
+
+# How long a process trusts its cached copy of the Redis switch.
+SETTINGS_TTL = 5.0
+
+_settings = {"enabled": False, "threshold_ms": DEFAULT_THRESHOLD_MS, "checked_at": 0.0}
+_settings_lock = threading.Lock()
+_local = threading.local()
+
+
+def _read_settings() -> Dict[str, Any]:
+    """Return the cached profiling settings, refreshing them from Redis every SETTINGS_TTL seconds."""
+    now = time.monotonic()
+    if now - _settings["checked_at"] < SETTINGS_TTL:
+        return _settings
+    with _settings_lock:
+        if now - _settings["checked_at"] < SETTINGS_TTL:
+            return _settings
+        enabled = os.getenv("PROFILING_ENABLED", "").lower() in ("1", "true", "yes")
+        threshold_ms = DEFAULT_THRESHOLD_MS
+        try:
+            client = get_redis()
+            flag, threshold = client.mget(ENABLED_KEY, THRESHOLD_KEY)
+            if flag is not None:
+                enabled = flag == b"1"
+            if threshold is not None:
+                threshold_ms = float(threshold)
+        except Exception as e:
+            print(f"Profiling settings unavailable, using environment defaults: {e}")
+        _settings.update(enabled=enabled, threshold_ms=threshold_ms, checked_at=now)
+    return _settings
+
+
+def set_profiling(enabled: bool, threshold_ms: Optional[float] = None):
+    """
+    Switch profiling on or off for every process sharing the Redis instance.
+
+    Args:
+        enabled (bool): Whether slow tasks and requests should be captured.
+        threshold_ms (float, optional): Latency above which a profile is kept.
+    """
+    client = get_redis()
+    client.set(ENABLED_KEY, "1" if enabled else "0")
+    if threshold_ms is not None:
+        client.set(THRESHOLD_KEY, threshold_ms)
+    _settings["checked_at"] = 0.0
+
+
+def profiling_status() -> Dict[str, Any]:
+    """Return the current switch state and threshold."""
+    _settings["checked_at"] = 0.0
+    settings = _read_settings()
+    return {"enabled": settings["enabled"], "threshold_ms": settings["threshold_ms"], "profile_dir": PROFILE_DIR}
+
+
+class _StackSampler(threading.Thread):
+    """Periodically samples one thread's Python stack and counts collapsed stacks."""
+
+    def __init__(self, thread_id: int, interval: float):
+        super().__init__(daemon=True)
+        self.thread_id = thread_id
+        self.interval = interval
+        self.counts: Dict[str, int] = {}
+        self._stop_event = threading.Event()
+
+    def run(self):
+        while not self._stop_event.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                continue
+            names = []
+            while frame is not None:
+                code = frame.f_code
+                names.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+                frame = frame.f_back
+            stack = ";".join(reversed(names))
+            self.counts[stack] = self.counts.get(stack, 0) + 1
+
+    def stop(self):
+        self._stop_event.set()
+        self.join()
+
+    def collapsed(self) -> str:
+        """Stacks in the 'frame;frame;frame count' format read by flamegraph.pl and speedscope."""
+        return "".join(f"{stack} {count}\n" for stack, count in sorted(self.counts.items()))
+
+
+class Profile:
+    """
+    One profiled unit of work (a task run or a request).
+
+    Collects a cProfile trace, a sampled collapsed-stack trace and per-stage wall-clock timers.
+    On stop() the profile is written to PROFILE_DIR only if the total duration exceeded the
+    threshold in force when it started.
+    """
+
+    def __init__(self, name: str, threshold_ms: float, metadata: Optional[Dict[str, Any]] = None):
+        self.name = name
+        self.threshold_ms = threshold_ms
+        self.metadata = metadata or {}
+        self.stages: List[Dict[str, Any]] = []
+        self._profiler = None
+        self._sampler = None
+        self._started = None
+
+    def start(self):
+        self._started = time.perf_counter()
+        self._profiler = cProfile.Profile()
+        try:
+            self._profiler.enable()
+        except ValueError:
+            # Another profiler is already active on this thread; keep timers and samples only.
+            self._profiler = None
+        self._sampler = _StackSampler(threading.get_ident(), SAMPLE_INTERVAL)
+        self._sampler.start()
+
+    def record_stage(self, stage: str, seconds: float):
+        self.stages.append({"stage": stage, "ms": seconds * 1000.0})
+
+    def stop(self) -> Optional[str]:
+        """Stop collecting and persist the profile if it was slow. Returns the file prefix written, if any."""
+        duration_ms = (time.perf_counter() - self._started) * 1000.0
+        if self._profiler is not None:
+            self._profiler.disable()
+        self._sampler.stop()
+        if duration_ms < self.threshold_ms:
+            return None
+        return self._save(duration_ms)
+
+    def _save(self, duration_ms: float) -> str:
+        os.makedirs(PROFILE_DIR, exist_ok=True)
+        captured_at = datetime.now(timezone.utc)
+        safe_name = "".join(c if c.isalnum() or c in "-_" else "_" for c in self.name)
+        prefix = os.path.join(PROFILE_DIR, f"{captured_at:%Y%m%dT%H%M%S}_{safe_name}_{uuid.uuid4().hex[:6]}")
+        if self._profiler is not None:
+            self._profiler.dump_stats(prefix + ".pstats")
+        with open(prefix + ".collapsed", "w") as f:
+            f.write(self._sampler.collapsed())
+        summary = {
+            "name": self.name,
+            "captured_at": captured_at.isoformat(),
+            "duration_ms": duration_ms,
+            "threshold_ms": self.threshold_ms,
+            "stages": self.stages,
+            "metadata": self.metadata,
+            "pstats": os.path.basename(prefix + ".pstats") if self._profiler is not None else None,
+            "collapsed": os.path.basename(prefix + ".collapsed"),
+        }
+        with open(prefix + ".json", "w") as f:
+            json.dump(summary, f, indent=2, default=str)
+        print(f"Captured slow profile for {self.name} ({duration_ms:.0f} ms): {prefix}.json")
+        return prefix
+
+
+def start_profile(name: str, **metadata) -> Optional[Profile]:
+    """Start profiling the current thread if profiling is switched on. Returns the Profile or None."""
+    settings = _read_settings()
+    if not settings["enabled"]:
+        return None
+    profile = Profile(name, settings["threshold_ms"], metadata)
+    profile.start()
+    _local.current = profile
+    return profile
+
+
+def stop_profile(profile: Optional[Profile]) -> Optional[str]:
+    """Stop a profile returned by start_profile (None is accepted and ignored)."""
+    if profile is None:
+        return None
+    if getattr(_local, "current", None) is profile:
+        _local.current = None
+    return profile.stop()
+
+
+@contextmanager
+def profiled(name: str, **metadata):
+    """Profile the enclosed block when profiling is on; a cheap no-op otherwise."""
+    profile = start_profile(name, **metadata)
+    try:
+        yield profile
+    finally:
+        stop_profile(profile)
+
+
+@contextmanager
+def stage(name: str):
+    """Time the enclosed block as a named stage of the current profile, if there is one."""
+    profile = getattr(_local, "current", None)
+    if profile is None:
+        yield
+        return
+    begin = time.perf_counter()
+    try:
+        yield
+    finally:
+        profile.record_stage(name, time.perf_counter() - begin)
+
+
+def list_profiles(limit: int = 50) -> List[Dict[str, Any]]:
+    """Return the summaries of the most recently captured profiles, newest first."""
+    if not os.path.isdir(PROFILE_DIR):
+        return []
+    names = sorted((n for n in os.listdir(PROFILE_DIR) if n.endswith(".json")), reverse=True)[:limit]
+    summaries = []
+    for name in names:
+        with open(os.path.join(PROFILE_DIR, name)) as f:
+            summaries.append(json.load(f))
+    return summaries
+
+
+def init_app(app):
+    """Register request hooks that profile every request while profiling is switched on."""
+    from flask import g, request
+
+    @app.before_request
+    def _start_request_profile():
+        g.profile = start_profile(f"request:{request.endpoint}", method=request.method, path=request.path)
+
+    @app.teardown_request
+    def _stop_request_profile(exc):
+        stop_profile(g.pop("profile", None))
@@ -0,0 +1,114 @@
+import uuid
+from datetime import datetime
+from typing import Any, Dict
+
+from sqlalchemy import delete, func, select
+
+from celery_app import celery
+from models import db, User, EnvironmentData
+from profiles import PROFILE_COLUMNS, update_profiles
+
+# Rows removed per DELETE statement; each batch is its own short transaction so a large purge
+# never holds long locks or bloats a single transaction.
+PURGE_BATCH_SIZE = 5000
+
+class InvalidFilterError(ValueError):
+    """Raised when a bulk delete request has no usable filter."""
+
+def record_filter_conditions(filters: Dict[str, Any]):
+    """
+    Translate bulk delete filters into SQLAlchemy conditions on EnvironmentData.
+
+    Supported filters: ids (list of record ids), user_id, status, before and after
+    (ISO timestamps bounding the capture time). At least one is required.
+
+    Raises:
+        InvalidFilterError: If no filter is given or a value cannot be parsed.
+    """
+    conditions = []
+    try:
+        if filters.get('ids'):
+            conditions.append(EnvironmentData.id.in_([uuid.UUID(str(i)) for i in filters['ids']]))
+        if filters.get('user_id'):
+            conditions.append(EnvironmentData.user_id == uuid.UUID(str(filters['user_id'])))
+        if filters.get('status'):
+            conditions.append(EnvironmentData.status == filters['status'])
+        if filters.get('before'):
+            conditions.append(EnvironmentData.timestamp < datetime.fromisoformat(filters['before']))
+        if filters.get('after'):
+            conditions.append(EnvironmentData.timestamp >= datetime.fromisoformat(filters['after']))
+    except ValueError as e:
+        raise InvalidFilterError(f'Invalid filter value: {e}')
+    if not conditions:
+        raise InvalidFilterError("Provide at least one of 'ids', 'user_id', 'status', 'before' or 'after'.")
+    return conditions
+
+def delete_in_batches(conditions, batch_size: int = PURGE_BATCH_SIZE, progress=None) -> int:
+    """
+    Delete the EnvironmentData rows matching `conditions` with set-based batched DELETEs.
+
+    Args:
+        conditions (list): SQLAlchemy conditions combined with AND.
+        batch_size (int, optional): Rows deleted per statement/transaction.
+        progress (callable, optional): Called as progress(deleted, total) after each batch.
+
+    Returns:
+        int: Number of rows deleted.
+    """
+    total = db.session.execute(select(func.count()).select_from(EnvironmentData).where(*conditions)).scalar()
+    deleted = 0
+    while True:
+        batch = select(EnvironmentData.id).where(*conditions).limit(batch_size).scalar_subquery()
+        rows = delete_records_returning(EnvironmentData.id.in_(batch))
+        db.session.commit()
+        if not rows:
+            break
+        deleted += len(rows)
+        if progress is not None:
+            progress(deleted, max(total, deleted))
+        if len(rows) < batch_size:
+            break
+    return deleted
+
+def delete_records_returning(*conditions):
+    """
+    Delete the EnvironmentData rows matching `conditions` and take complete ones out of their
+    users' condition profiles, in the caller's transaction.
+
+    Returns:
+        list: The deleted rows' profile_values() mappings.
+    """
+    result = db.session.execute(
+        delete(EnvironmentData).where(*conditions)
+        .returning(*(getattr(EnvironmentData, column) for column in PROFILE_COLUMNS)),
+        execution_options={'synchronize_session': False})
+    rows = list(result.mappings())
+    update_profiles(removed=rows)
+    return rows
+
+def _reporter(task):
+    def report(deleted, total):
+        task.update_state(state='PROGRESS', meta={'deleted': deleted, 'total': total})
+    return report
+
+@celery.task(bind=True, name='purge_user')
+def purge_user(self, user_id, batch_size=PURGE_BATCH_SIZE):
+    """
+    Background purge of a user and all of their EnvironmentData records.
+
+    Records are removed in batches (reporting progress through the task state) before the
+    user row itself; ON DELETE CASCADE covers any record added meanwhile.
+    """
+    user_uuid = uuid.UUID(str(user_id))
+    deleted = delete_in_batches([EnvironmentData.user_id == user_uuid], batch_size, _reporter(self))
+    db.session.execute(delete(User).where(User.id == user_uuid))
+    db.session.commit()
+    print(f"Purged user {user_id} and {deleted} records.")
+    return {'user_id': str(user_id), 'deleted': deleted}
+
+@celery.task(bind=True, name='purge_records')
+def purge_records(self, filters, batch_size=PURGE_BATCH_SIZE):
+    """Background bulk delete of the EnvironmentData records matching `filters` (see record_filter_conditions)."""
+    deleted = delete_in_batches(record_filter_conditions(filters), batch_size, _reporter(self))
+    print(f"Purged {deleted} records matching {filters}.")
+    return {'deleted': deleted}
@@ -0,0 +1,172 @@
+import time
+
+import click
+import redis
+from flask import current_app
+
+from celery_app import celery
+from georouting import live_members, queue_for_location
+
+# Live submissions (a catch just logged on the water) go to a queue served by their own
+# workers, so a backlog of bulk/backfill work can never delay them.
+LIVE_QUEUE = 'live'
+BULK_QUEUE = 'bulk'
+
+# Records per fetch_env_data_batch task for bulk work.
+BULK_BATCH_SIZE = 200
+
+def enqueue_enrichment(record_id, priority='live', location=None):
+    """
+    Queue fetch_env_data for one record.
+
+    Args:
+        record_id: The EnvironmentData id.
+        priority (str, optional): 'live' for fresh submissions, 'bulk' for backfill and re-enrichment.
+        location (tuple, optional): The record's (latitude, longitude). Live tasks with a location
+                                    go to the worker owning its geographic cell (see georouting.py).
+
+    Returns:
+        celery.result.AsyncResult: The queued task.
+    """
+    queue = LIVE_QUEUE if priority == 'live' else BULK_QUEUE
+    if priority == 'live' and location is not None:
+        queue = queue_for_location(*location) or queue
+    return celery.send_task('fetch_env_data', args=[record_id], queue=queue)
+
+def enqueue_bulk_enrichment(record_ids, batch_size=BULK_BATCH_SIZE):
+    """
+    Queue many records on the bulk queue as fetch_env_data_batch tasks of batch_size records.
+
+    Returns:
+        list: The queued tasks.
+    """
+    record_ids = [str(record_id) for record_id in record_ids]
+    return [celery.send_task('fetch_env_data_batch', args=[record_ids[i:i + batch_size]], queue=BULK_QUEUE)
+            for i in range(0, len(record_ids), batch_size)]
+
+_broker_client = None
+_backlog_cache = {'checked': 0.0, 'depth': 0}
+
+def _broker():
+    global _broker_client
+    if _broker_client is None:
+        _broker_client = redis.Redis.from_url(celery.conf.broker_url)
+    return _broker_client
+
+def enrichment_backlog(cap: int) -> int:
+    """
+    Return how much live enrichment work is waiting, counting at most `cap`.
+
+    With the Celery backend this is the length of the live queue plus the geo-routed queues of
+    the live workers (see georouting.py) in the Redis broker; with the async backend, the
+    number of pending records not yet claimed by a worker.
+    """
+    if current_app.config['ENRICHMENT_BACKEND'] == 'celery':
+        pipe = _broker().pipeline(transaction=False)
+        for queue in [LIVE_QUEUE] + live_members():
+            pipe.llen(queue)
+        return min(sum(pipe.execute()), cap)
+    from sqlalchemy import text
+    from models import db
+    return db.session.execute(text(
+        "SELECT count(*) FROM (SELECT 1 FROM environment_data WHERE status = 'pending' LIMIT :cap) AS backlog"),
+        {'cap': cap}).scalar()
+
+def admission_decision():
+    """
+    Decide whether a new submission can be enriched right away.
+
+    The backlog is sampled at most every ADMISSION_CHECK_INTERVAL seconds per process. While
+    it is above ADMISSION_MAX_QUEUE_DEPTH (0 disables the check), submissions are refused
+    ('shed') or stored as 'deferred' for admit_deferred to queue later ('defer'), according
+    to ADMISSION_MODE.
+
+    Returns:
+        str: None to admit, otherwise 'shed' or 'defer'.
+    """
+    config = current_app.config
+    max_depth = config['ADMISSION_MAX_QUEUE_DEPTH']
+    if max_depth <= 0:
+        return None
+    now = time.monotonic()
+    if now - _backlog_cache['checked'] >= config['ADMISSION_CHECK_INTERVAL']:
+        try:
+            _backlog_cache['depth'] = enrichment_backlog(max_depth + 1)
+        except Exception as e:
+            print(f"Could not read the enrichment backlog: {e}")
+            _backlog_cache['depth'] = 0
+        _backlog_cache['checked'] = now
+    if _backlog_cache['depth'] <= max_depth:
+        return None
+    return config['ADMISSION_MODE']
+
+@celery.task(name='admit_deferred')
+def admit_deferred():
+    """
+    Scheduled job: re-drive deferred records, oldest first, at a controlled rate.
+
+    Records are deferred by admission control and by upstream outages (see circuitbreaker.py).
+    Nothing is queued while any Stormglass circuit is open; while one is half-open a single
+    record is queued to serve as the probe. Otherwise up to DEFERRED_REPLAY_BATCH records are
+    queued per run, within the room left under ADMISSION_MAX_QUEUE_DEPTH.
+
+    Returns:
+        int: Number of records admitted.
+    """
+    from sqlalchemy import update
+    from circuitbreaker import build_circuit_breaker
+    from models import db, EnvironmentData
+    config = current_app.config
+    room = config['DEFERRED_REPLAY_BATCH']
+    breaker = build_circuit_breaker(config)
+    circuits = breaker.tripped_circuits() if breaker is not None else {}
+    if any(circuits.values()):
+        print(f"Not replaying deferred records; open circuits: {[name for name, is_open in circuits.items() if is_open]}")
+        return 0
+    if circuits:
+        room = 1
+    max_depth = config['ADMISSION_MAX_QUEUE_DEPTH']
+    if max_depth > 0:
+        room = min(room, max_depth - enrichment_backlog(max_depth))
+    if room <= 0:
+        return 0
+    records = db.session.query(EnvironmentData.id, EnvironmentData.latitude, EnvironmentData.longitude) \
+        .filter(EnvironmentData.status == 'deferred') \
+        .order_by(EnvironmentData.timestamp) \
+        .limit(room) \
+        .with_for_update(skip_locked=True).all()
+    record_ids = [record_id for record_id, _, _ in records]
+    if not record_ids:
+        db.session.commit()
+        return 0
+    db.session.execute(update(EnvironmentData).where(EnvironmentData.id.in_(record_ids)).values(status='pending'),
+                       execution_options={'synchronize_session': False})
+    db.session.commit()
+    if config['ENRICHMENT_BACKEND'] == 'celery':
+        for record_id, latitude, longitude in records:
+            enqueue_enrichment(str(record_id), priority='live', location=(latitude, longitude))
+    print(f"Admitted {len(record_ids)} deferred records.")
+    return len(record_ids)
+
+def init_app(app):
+    """Register the backfill CLI command on the Flask app."""
+
+    @app.cli.command('backfill')
+    # 'queued' covers imports whose bulk task was lost (see importer.py); like 'pending', a
+    # record whose task is still waiting in the queue is queued again.
+    @click.option('--status', 'statuses', multiple=True, default=('pending', 'error', 'queued'),
+                  help='Record statuses to re-enrich (repeatable).')
+    @click.option('--since', type=click.DateTime(), default=None, help='Only records captured on or after this time.')
+    @click.option('--until', type=click.DateTime(), default=None, help='Only records captured before this time.')
+    @click.option('--batch-size', type=int, default=BULK_BATCH_SIZE)
+    def backfill_command(statuses, since, until, batch_size):
+        """Queue (re-)enrichment of matching records on the low-priority bulk queue."""
+        from models import db, EnvironmentData
+        query = db.session.query(EnvironmentData.id).filter(EnvironmentData.status.in_(statuses))
+        if since:
+            query = query.filter(EnvironmentData.timestamp >= since)
+        if until:
+            query = query.filter(EnvironmentData.timestamp < until)
+        record_ids = [record_id for (record_id,) in query.order_by(EnvironmentData.timestamp)]
+        tasks = enqueue_bulk_enrichment(record_ids, batch_size)
+        click.echo(f'Queued {len(record_ids)} records in {len(tasks)} bulk tasks.')
@@ -0,0 +1,119 @@
+import math
+from functools import wraps
+from typing import Optional, Tuple
+
+from flask import current_app, g, jsonify, request
+
+from redis_store import get_redis
+
+BUCKET_PREFIX = "ratelimit"
+
+# Refill and take from a token bucket atomically. Time comes from the Redis server so every
+# web process agrees on it. Returns {allowed, seconds until enough tokens} (as a string, since
+# Lua numbers are truncated to integers on the way out).
+TOKEN_BUCKET_LUA = """
+local rate = tonumber(ARGV[1])
+local capacity = tonumber(ARGV[2])
+local cost = tonumber(ARGV[3])
+local time = redis.call('TIME')
+local now = tonumber(time[1]) + tonumber(time[2]) / 1000000
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(state[1]) or capacity
+local ts = tonumber(state[2]) or now
+tokens = math.min(capacity, tokens + math.max(0, now - ts) * rate)
+local allowed = 0
+local wait = 0
+if tokens >= cost then
+    tokens = tokens - cost
+    allowed = 1
+else
+    wait = (cost - tokens) / rate
+end
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'ts', tostring(now))
+redis.call('PEXPIRE', KEYS[1], math.ceil(capacity / rate * 1000) + 1000)
+return {allowed, tostring(wait)}
+"""
+
+_PERIODS = {"second": 1, "minute": 60, "hour": 3600, "day": 86400}
+
+def parse_rate(value: str) -> Optional[float]:
+    """
+    Parse a rate such as "60/minute" or "5/second" into requests per second.
+
+    Returns:
+        float: The rate, or None for an empty value (no limit).
+
+    Raises:
+        ValueError: If the value is not "<count>/<second|minute|hour|day>".
+    """
+    if not value:
+        return None
+    count, _, period = value.partition("/")
+    if period not in _PERIODS:
+        raise ValueError(f"Invalid rate {value!r}; expected e.g. '60/minute'.")
+    return float(count) / _PERIODS[period]
+
+class TokenBucket:
+    """
+    Redis token bucket shared by every web process.
+
+    Each key holds up to `burst` tokens and refills at `rate` tokens per second; a request
+    takes one token or is refused with the time until one is available.
+    """
+
+    def __init__(self, rate: float, burst: int, redis_client=None):
+        self.rate = rate
+        self.burst = burst
+        self.redis_client = redis_client
+        self._script = None
+
+    def take(self, key: str, cost: int = 1) -> Tuple[bool, float]:
+        """
+        Take `cost` tokens from the bucket at `key`.
+
+        Returns:
+            tuple: (allowed, retry_after) where retry_after is in seconds (0 when allowed).
+        """
+        if self._script is None:
+            self._script = (self.redis_client or get_redis()).register_script(TOKEN_BUCKET_LUA)
+        allowed, wait = self._script(keys=[f"{BUCKET_PREFIX}:{key}"], args=[self.rate, self.burst, cost])
+        return bool(int(allowed)), float(wait)
+
+_buckets = {}
+
+def _bucket(name: str) -> Optional[TokenBucket]:
+    """The configured bucket for limit `name` (RATE_LIMIT_<NAME> and RATE_LIMIT_<NAME>_BURST), or None."""
+    config = current_app.config
+    rate = parse_rate(config.get(f"RATE_LIMIT_{name.upper()}", ""))
+    if rate is None:
+        return None
+    burst = config.get(f"RATE_LIMIT_{name.upper()}_BURST") or max(1, math.ceil(rate))
+    bucket = _buckets.get(name)
+    if bucket is None or (bucket.rate, bucket.burst) != (rate, burst):
+        bucket = _buckets[name] = TokenBucket(rate, burst)
+    return bucket
+
+def rate_limited(name: str):
+    """
+    Limit how often each user may call the endpoint.
+
+    Apply below @token_required. Requests over the user's RATE_LIMIT_<NAME> bucket get 429 with
+    a Retry-After header. Each endpoint has its own bucket per user. If Redis is unavailable the
+    request is let through rather than failing submissions.
+    """
+    def decorator(f):
+        @wraps(f)
+        def decorated(*args, **kwargs):
+            bucket = _bucket(name)
+            if bucket is not None:
+                try:
+                    allowed, retry_after = bucket.take(f"{request.endpoint}:{g.current_user.id}")
+                except Exception as e:
+                    print(f"Rate limiter unavailable: {e}")
+                    allowed, retry_after = True, 0.0
+                if not allowed:
+                    return (jsonify({'message': 'Rate limit exceeded. Try again later.'}), 429,
+                            {'Retry-After': str(max(1, math.ceil(retry_after)))})
+            return f(*args, **kwargs)
+        return decorated
+    return decorator
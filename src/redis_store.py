@@ -0,0 +1,17 @@
+import os
+import redis
+
+_client = None
+
+def get_redis():
+    """
+    Return a process-wide Redis client.
+
+    The connection URL is read from REDIS_URL and defaults to the same Redis instance Celery
+    uses as its broker. The client is created lazily and reused, so importing this module
+    never opens a connection.
+    """
+    global _client
+    if _client is None:
+        _client = redis.Redis.from_url(os.getenv("REDIS_URL", "redis://localhost:6379/0"))
+    return _client
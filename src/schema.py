@@ -0,0 +1,66 @@
+import click
+from sqlalchemy import text
+from models import db
+import partitions
+
+# Idempotent upgrades for databases created by earlier versions of the models. Each entry is
+# applied in order on PostgreSQL by `flask init-db`.
+POSTGRES_UPGRADES = [
+    # Let the database cascade user deletion to environment_data.
+    """
+    ALTER TABLE environment_data
+        DROP CONSTRAINT IF EXISTS environment_data_user_id_fkey,
+        ADD CONSTRAINT environment_data_user_id_fkey
+            FOREIGN KEY (user_id) REFERENCES users (id) ON DELETE CASCADE
+    """,
+    "CREATE INDEX IF NOT EXISTS ix_environment_data_user_id ON environment_data (user_id)",
+    "CREATE INDEX IF NOT EXISTS ix_environment_data_timestamp ON environment_data (timestamp)",
+    # Small index over the records still waiting for enrichment (admission control, async claims).
+    """
+    CREATE INDEX IF NOT EXISTS ix_environment_data_waiting ON environment_data (timestamp)
+        WHERE status IN ('pending', 'deferred')
+    """,
+    # Enrichment provenance (see neighbours.py).
+    """
+    ALTER TABLE environment_data
+        ADD COLUMN IF NOT EXISTS enrichment_source VARCHAR(20),
+        ADD COLUMN IF NOT EXISTS source_record_id UUID
+    """,
+    # Space-time lookup of complete records for enrichment reuse: a narrow time range, with
+    # the position filtered inside the index.
+    """
+    CREATE INDEX IF NOT EXISTS ix_environment_data_complete_spacetime
+        ON environment_data (timestamp, latitude, longitude) WHERE status = 'complete'
+    """,
+    # Claim time of async enrichment workers, so --reset-stale spares live claims.
+    "ALTER TABLE environment_data ADD COLUMN IF NOT EXISTS claimed_at TIMESTAMP",
+]
+
+def create_schema():
+    """Create any missing tables. Must be called inside an application context."""
+    db.create_all()
+
+def upgrade_schema(months_ahead: int = 2):
+    """
+    Apply POSTGRES_UPGRADES to an existing database and make sure environment_data is
+    partitioned, with partitions up to `months_ahead` months ahead. Must be called inside an
+    application context.
+    """
+    if db.engine.dialect.name != 'postgresql':
+        return
+    with db.engine.begin() as connection:
+        if not partitions.is_partitioned(connection):
+            partitions.convert_to_partitioned(connection)
+        for statement in POSTGRES_UPGRADES:
+            connection.execute(text(statement))
+        partitions.ensure_partitions(connection, months_ahead)
+
+def init_app(app):
+    """Register the schema management CLI commands on the Flask app."""
+
+    @app.cli.command('init-db')
+    def init_db_command():
+        """Create missing tables and apply schema upgrades."""
+        create_schema()
+        upgrade_schema(app.config['PARTITION_MONTHS_AHEAD'])
+        click.echo('Database schema created.')
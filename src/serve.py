@@ -0,0 +1,103 @@
+"""
+Production server for the Flask API.
+
+Runs the WSGI app under uvicorn (an asyncio ASGI server) through a2wsgi's WSGI adapter.
+The event loop holds every open connection, so thousands of idle keep-alive or slow polling
+clients cost almost nothing; only requests being handled occupy one of SERVER_THREADS
+threads per worker process. Run from the src directory:
+
+    python serve.py                       # settings from the environment (see config.py)
+    python serve.py --workers 4 --threads 32 --port 8000
+
+On SIGTERM/SIGINT uvicorn stops accepting connections, lets in-flight requests finish for up
+to SERVER_GRACEFUL_TIMEOUT seconds, then closes the database pools. Size DB_POOL_SIZE plus
+DB_MAX_OVERFLOW to at least SERVER_THREADS so request threads never queue for a connection.
+"""
+import argparse
+import os
+
+from config import load_config
+
+try:
+    import uvicorn
+    from a2wsgi import WSGIMiddleware
+except ImportError:  # pragma: no cover - optional dependency
+    uvicorn = None
+    WSGIMiddleware = None
+
+
+class LifespanShutdown:
+    """ASGI wrapper that answers lifespan events and runs `on_shutdown` when the server stops."""
+
+    def __init__(self, app, on_shutdown):
+        self.app = app
+        self.on_shutdown = on_shutdown
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "lifespan":
+            await self.app(scope, receive, send)
+            return
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                self.on_shutdown()
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+
+def create_asgi_app():
+    """
+    Build the ASGI application served by each worker process.
+
+    Called by uvicorn in every worker (factory mode), so the supervisor process never imports
+    the Flask app.
+    """
+    from app import app
+    from models import db
+
+    wsgi = WSGIMiddleware(app, workers=app.config["SERVER_THREADS"])
+
+    def shutdown():
+        # uvicorn has already drained in-flight requests; finish the adapter's threads, then
+        # close pooled database connections instead of leaving them for the server to reap.
+        wsgi.executor.shutdown(wait=True)
+        with app.app_context():
+            for engine in db.engines.values():
+                engine.dispose()
+        print(f"Worker {os.getpid()} shut down.")
+
+    return LifespanShutdown(wsgi, shutdown)
+
+
+def main():
+    if uvicorn is None:
+        raise SystemExit("serve.py requires uvicorn and a2wsgi (pip install uvicorn a2wsgi).")
+    config = load_config()
+    parser = argparse.ArgumentParser(description="Serve the API with uvicorn.")
+    parser.add_argument("--host", default=config["SERVER_HOST"])
+    parser.add_argument("--port", type=int, default=config["SERVER_PORT"])
+    parser.add_argument("--workers", type=int, default=config["SERVER_WORKERS"], help="Worker processes")
+    parser.add_argument("--threads", type=int, default=config["SERVER_THREADS"],
+                        help="Request threads per worker process")
+    parser.add_argument("--limit-concurrency", type=int, default=config["SERVER_LIMIT_CONCURRENCY"],
+                        help="Maximum concurrent connections per worker before answering 503 (0 = no limit)")
+    parser.add_argument("--backlog", type=int, default=config["SERVER_BACKLOG"])
+    parser.add_argument("--keep-alive", type=int, default=config["SERVER_KEEP_ALIVE"],
+                        help="Seconds an idle keep-alive connection is kept open")
+    parser.add_argument("--graceful-timeout", type=int, default=config["SERVER_GRACEFUL_TIMEOUT"],
+                        help="Seconds in-flight requests get to finish on shutdown")
+    args = parser.parse_args()
+
+    # Workers build their app from the environment, so pass the thread count through it.
+    os.environ["SERVER_THREADS"] = str(args.threads)
+    uvicorn.run("serve:create_asgi_app", factory=True,
+                host=args.host, port=args.port, workers=args.workers,
+                limit_concurrency=args.limit_concurrency or None, backlog=args.backlog,
+                timeout_keep_alive=args.keep_alive, timeout_graceful_shutdown=args.graceful_timeout,
+                lifespan="on", access_log=False)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,199 @@
+import hashlib
+import json
+import time
+import uuid
+from typing import Any, Callable, Dict, Optional
+
+from redis_store import get_redis
+
+# Deletes the lock only if it is still held by the caller's token.
+_RELEASE_LOCK_LUA = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('del', KEYS[1])
+end
+return 0
+"""
+
+
+class SingleFlightLeaderError(RuntimeError):
+    """
+    Raised in a waiting worker when the worker that made the shared call failed.
+
+    Carries the leader's exception class name as `error_type`, its HTTP status (if any) as
+    `status`, and `upstream_failure` as classified by the leader (None if it was not
+    classified), so callers can tell an upstream outage from a rejected request.
+    """
+
+    def __init__(self, message: str, error_type: Optional[str] = None, status: Optional[int] = None,
+                 upstream_failure: Optional[bool] = None):
+        super().__init__(message)
+        self.error_type = error_type
+        self.status = status
+        self.upstream_failure = upstream_failure
+
+
+def _error_status(error: BaseException) -> Optional[int]:
+    """HTTP status of a requests or aiohttp error, or None."""
+    response = getattr(error, "response", None)
+    status = getattr(response, "status_code", None) or getattr(error, "status", None)
+    return status if isinstance(status, int) else None
+
+
+def request_key(url: str, params: Dict[str, Any]) -> str:
+    """Return a stable key for a GET request (URL plus sorted query parameters, no headers)."""
+    canonical = json.dumps({"url": url, "params": {k: str(v) for k, v in sorted(params.items())}},
+                           sort_keys=True)
+    return hashlib.sha1(canonical.encode("utf-8")).hexdigest()
+
+
+class SingleFlight:
+    """
+    Cross-worker coalescing of identical in-flight calls through Redis.
+
+    The first worker to ask for a key takes a Redis lock and makes the call (the leader). Any
+    other worker asking for the same key while the call is in flight waits for the leader to
+    publish its result under a short-lived hand-off key and returns that instead of calling
+    upstream itself. If the leader dies, its lock expires and a waiter takes over; if Redis is
+    unreachable the call is simply made directly.
+    """
+
+    def __init__(self, redis_client=None, prefix: str = "singleflight", lock_ttl: float = 45.0,
+                 result_ttl: float = 10.0, wait_timeout: float = 50.0, poll_interval: float = 0.05,
+                 classify_failure: Optional[Callable[[BaseException], bool]] = None):
+        """
+        Initialize the coalescer.
+
+        Args:
+            redis_client (redis.Redis, optional): Client to use. Defaults to redis_store.get_redis().
+            prefix (str, optional): Prefix for the Redis keys.
+            lock_ttl (float, optional): Seconds before an abandoned leader lock expires. Must exceed
+                the upstream request timeout, or a slow leader loses its lock mid-call.
+            result_ttl (float, optional): Seconds a published result stays available to waiters.
+            wait_timeout (float, optional): Maximum seconds a waiter waits before calling upstream itself.
+            poll_interval (float, optional): Maximum seconds between checks for the leader's result.
+            classify_failure (callable, optional): Tells whether the leader's exception is an
+                upstream outage; the answer is passed on to waiters as `upstream_failure`.
+        """
+        self._redis = redis_client
+        self.prefix = prefix
+        self.lock_ttl = lock_ttl
+        self.result_ttl = result_ttl
+        self.wait_timeout = wait_timeout
+        self.poll_interval = poll_interval
+        self.classify_failure = classify_failure
+        self.stats = {"leader": 0, "shared": 0, "direct": 0}
+
+    @property
+    def redis(self):
+        if self._redis is None:
+            self._redis = get_redis()
+        return self._redis
+
+    def do(self, key: str, fn: Callable[[], Any]) -> Any:
+        """
+        Return fn()'s result, calling fn at most once across workers for concurrent identical keys.
+
+        The result must be JSON-serializable.
+
+        Args:
+            key (str): Identifies the call (see request_key).
+            fn (callable): Zero-argument function making the upstream call.
+
+        Returns:
+            The result of fn(), possibly produced by another worker.
+
+        Raises:
+            SingleFlightLeaderError: If the leader's call failed while this worker was waiting,
+                or less than a second before this call.
+        """
+        lock_key = f"{self.prefix}:lock:{key}"
+        result_key = f"{self.prefix}:result:{key}"
+        token = uuid.uuid4().hex
+        try:
+            published, is_leader = self._wait_for_turn(lock_key, result_key, token)
+        except Exception as e:
+            # Redis problems must never block enrichment.
+            print(f"Single-flight unavailable, calling upstream directly: {e}")
+            published, is_leader = None, False
+        if published is not None:
+            self.stats["shared"] += 1
+            return self._unpack(published)
+        if not is_leader:
+            self.stats["direct"] += 1
+            return fn()
+
+        self.stats["leader"] += 1
+        try:
+            result = fn()
+        except Exception as e:
+            # Failures are kept for at most a second: long enough for every waiter's next poll,
+            # so any caller in that window gets the failure too (a brief negative cache).
+            upstream_failure = self.classify_failure(e) if self.classify_failure else None
+            self._publish(result_key, {"error": f"{type(e).__name__}: {e}", "type": type(e).__name__,
+                                       "status": _error_status(e), "upstream_failure": upstream_failure},
+                          ttl=min(self.result_ttl, 1.0))
+            raise
+        else:
+            self._publish(result_key, {"result": result})
+            return result
+        finally:
+            self._release(lock_key, token)
+
+    def _release(self, lock_key: str, token: str):
+        try:
+            self.redis.eval(_RELEASE_LOCK_LUA, 1, lock_key, token)
+        except Exception:
+            pass
+
+    def _wait_for_turn(self, lock_key: str, result_key: str, token: str):
+        """
+        Wait until either a result is published or this worker acquires the lock.
+
+        Returns:
+            tuple: (published result bytes or None, whether this worker is now the leader).
+                   (None, False) means the wait timed out.
+        """
+        deadline = time.monotonic() + self.wait_timeout
+        delay = 0.005
+        while True:
+            published = self.redis.get(result_key)
+            if published is not None:
+                return published, False
+            if self.redis.set(lock_key, token, nx=True, px=int(self.lock_ttl * 1000)):
+                # The previous leader may have published and released between the two calls.
+                published = self.redis.get(result_key)
+                if published is not None:
+                    self._release(lock_key, token)
+                    return published, False
+                return None, True
+            if time.monotonic() >= deadline:
+                return None, False
+            time.sleep(delay)
+            delay = min(delay * 2, self.poll_interval)
+
+    def _publish(self, result_key: str, payload: Dict[str, Any], ttl: Optional[float] = None):
+        try:
+            self.redis.set(result_key, json.dumps(payload), px=int((ttl or self.result_ttl) * 1000))
+        except Exception as e:
+            print(f"Single-flight could not publish result: {e}")
+
+    @staticmethod
+    def _unpack(published: bytes) -> Any:
+        payload = json.loads(published)
+        if "error" in payload:
+            raise SingleFlightLeaderError(payload["error"], payload.get("type"), payload.get("status"),
+                                          payload.get("upstream_failure"))
+        return payload["result"]
+
+
+def coalescing_fetcher(fetch_json: Callable, single_flight: Optional[SingleFlight] = None) -> Callable:
+    """
+    Wrap a FetchJSON function (see api_calls.stormglass) so identical concurrent requests
+    from any worker share one upstream call.
+    """
+    single_flight = single_flight or SingleFlight()
+
+    def fetch(url: str, params: Dict[str, Any], headers: Dict[str, str]) -> Dict[str, Any]:
+        return single_flight.do(request_key(url, params), lambda: fetch_json(url, params, headers))
+
+    return fetch
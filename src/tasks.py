@@ -3,7 +3,72 @@ from models import db, EnvironmentData
 from api_calls.tides import TideAPIClient
 from api_calls.weather import WeatherAPIClient
 from api_calls.astronomy import AstronomyAPIClient
+from flask import current_app
+from profiling import profiled, stage
+from upstream import build_fetch_json
+from circuitbreaker import is_upstream_failure
+from profiles import profile_values, update_profiles
+from neighbours import reuse_values, UPSTREAM_SOURCE
 import json
+from functools import lru_cache
+
+def _stormglass_url(path):
+    """Build a Stormglass endpoint URL from the configured STORMGLASS_BASE_URL."""
+    return f"{current_app.config['STORMGLASS_BASE_URL'].rstrip('/')}/{path}"
+
+@lru_cache(maxsize=None)
+def _grid_store(path):
+    """Open the gridded weather store once per process; the memory map is shared by all tasks."""
+    # numpy is only imported by deployments that use a grid.
+    from api_calls.weather_grid import GridWeatherStore
+    return GridWeatherStore(path)
+
+@lru_cache(maxsize=None)
+def _tide_timeline_store(ttl_days):
+    """One tide timeline store per process, so its in-memory timelines are shared by all tasks."""
+    from api_calls.tide_timeline import RedisTideTimelineStore
+    from redis_store import get_redis
+    return RedisTideTimelineStore(get_redis(), ttl_seconds=ttl_days * 86400)
+
+@lru_cache(maxsize=None)
+def _hourly_series_store(decimals):
+    """One hourly series buffer per process (see hourly_series.py)."""
+    from hourly_series import HourlySeriesStore
+    return HourlySeriesStore(decimals)
+
+def _series_store():
+    config = current_app.config
+    return _hourly_series_store(config['STORMGLASS_COORD_DECIMALS']) if config['HOURLY_SERIES_ENABLED'] else None
+
+def build_api_clients(fetch_json=None):
+    """
+    Build the tide, weather and astronomy clients pointed at the configured Stormglass URL.
+
+    Args:
+        fetch_json (callable, optional): HTTP fetcher passed to every client (see api_calls.stormglass).
+                                         Defaults to the configured chain from upstream.build_fetch_json.
+
+    Returns:
+        tuple: (TideAPIClient, WeatherAPIClient, AstronomyAPIClient). With WEATHER_GRID_DIR set, the
+               weather client is a GridWeatherClient that falls back to Stormglass outside the grid.
+    """
+    if fetch_json is None:
+        fetch_json = build_fetch_json(current_app.config)
+    tide_client = TideAPIClient(base_url_extremes=_stormglass_url("tide/extremes/point"),
+                                base_url_sea_level=_stormglass_url("tide/sea-level/point"),
+                                fetch_json=fetch_json,
+                                timeline_store=(_tide_timeline_store(current_app.config['TIDE_TIMELINE_TTL_DAYS'])
+                                                if current_app.config['TIDE_TIMELINE_ENABLED'] else None),
+                                location_decimals=current_app.config['STORMGLASS_COORD_DECIMALS'],
+                                series_store=_series_store())
+    weather_client = WeatherAPIClient(base_url=_stormglass_url("weather/point"), fetch_json=fetch_json,
+                                      series_store=_series_store())
+    if current_app.config['WEATHER_GRID_DIR']:
+        from api_calls.weather_grid import GridWeatherClient
+        weather_client = GridWeatherClient(_grid_store(current_app.config['WEATHER_GRID_DIR']),
+                                           fallback=weather_client, method=current_app.config['WEATHER_GRID_METHOD'])
+    astronomy_client = AstronomyAPIClient(base_url=_stormglass_url("astronomy/point"), fetch_json=fetch_json)
+    return tide_client, weather_client, astronomy_client
 
 @celery.task(name='fetch_env_data')
 def fetch_env_data(record_id):
@@ -20,18 +85,40 @@ def fetch_env_data(record_id):
         currentMoonPhaseText, currentMoonPhaseValue, lightLevel.
     
     After all data are updated, the record status is set to "complete".
+    When profiling is switched on, slow runs are captured with per-stage timings.
     """
-    env_data = EnvironmentData.query.get(record_id)
+    with profiled("fetch_env_data", record_id=str(record_id)):
+        _fetch_env_data(record_id)
+
+def _fetch_env_data(record_id):
+    with stage("db_load"):
+        env_data = EnvironmentData.query.get(record_id)
     if not env_data:
         print(f"Record ID {record_id} not found.")
         return
+    # What the record contributed to its user's condition profile before this run.
+    previous = profile_values(env_data)
 
     try:
         print(f"Processing environment data for record {record_id}")
+        # Nearby complete records make the API calls unnecessary (see neighbours.py).
+        with stage("neighbour_lookup"):
+            reused = reuse_values(env_data.timestamp, env_data.latitude, env_data.longitude, env_data.id)
+        if reused is not None:
+            for field, value in reused.items():
+                setattr(env_data, field, value)
+            env_data.status = "complete"
+            print(f"Record {record_id} enriched from record {reused['source_record_id']} ({reused['enrichment_source']}).")
+            with stage("db_commit"):
+                update_profiles(added=[profile_values(env_data)], removed=[previous])
+                db.session.commit()
+            return
+        
+        tide_client, weather_client, astronomy_client = build_api_clients()
         
         # 1. Tide API
-        tide_client = TideAPIClient()
-        tide_data = tide_client.get_tide_data(env_data.timestamp, env_data.latitude, env_data.longitude)
+        with stage("tide_api"):
+            tide_data = tide_client.get_tide_data(env_data.timestamp, env_data.latitude, env_data.longitude)
         if tide_data:
             env_data.currentTideHeight = tide_data.get("currentTideHeight")
             env_data.tideHour = tide_data.get("tideHour")
@@ -42,8 +129,8 @@ def fetch_env_data(record_id):
             print("Tide API returned no data.")
         
         # 2. Weather API
-        weather_client = WeatherAPIClient()
-        weather_data = weather_client.get_weather_data(env_data.timestamp, env_data.latitude, env_data.longitude)
+        with stage("weather_api"):
+            weather_data = weather_client.get_weather_data(env_data.timestamp, env_data.latitude, env_data.longitude)
         if weather_data:
             env_data.airTemperature = weather_data.get("airTemperature")
             env_data.pressure = weather_data.get("pressure")
@@ -70,8 +157,8 @@ def fetch_env_data(record_id):
             print("Weather API returned no data.")
         
         # 3. Astronomy API
-        astronomy_client = AstronomyAPIClient()
-        astronomy_data = astronomy_client.get_astronomy_data(env_data.timestamp, env_data.latitude, env_data.longitude)
+        with stage("astronomy_api"):
+            astronomy_data = astronomy_client.get_astronomy_data(env_data.timestamp, env_data.latitude, env_data.longitude)
         if astronomy_data:
             env_data.sunrise = astronomy_data.get("sunrise")
             env_data.sunset = astronomy_data.get("sunset")
@@ -85,12 +172,37 @@ def fetch_env_data(record_id):
         else:
             print("Astronomy API returned no data.")
         
+        env_data.enrichment_source = UPSTREAM_SOURCE
+        env_data.source_record_id = None
         env_data.status = "complete"
         print(f"Task for record {record_id} completed successfully.")
-        db.session.commit()
+        with stage("db_commit"):
+            update_profiles(added=[profile_values(env_data)], removed=[previous])
+            if tide_client.series_store is not None:
+                tide_client.series_store.write_pending()
+            db.session.commit()
     
     except Exception as e:
         print(f"General Task Error: {e}")
         db.session.rollback()
-        env_data.status = "error"
+        # Upstream outages (including an open circuit) defer the record for replay by
+        # queues.admit_deferred instead of failing it.
+        env_data.status = "deferred" if is_upstream_failure(e) else "error"
+        update_profiles(removed=[previous])
         db.session.commit()
+
+@celery.task(name='fetch_env_data_batch')
+def fetch_env_data_batch(record_ids):
+    """
+    Enrich many EnvironmentData records in one task using the asyncio engine.
+
+    All records are fetched concurrently on non-blocking HTTP and written back in batches,
+    so one worker process can keep hundreds of records in flight.
+    """
+    import asyncio
+    from async_enrichment import AsyncEnrichmentEngine, load_records
+
+    engine = AsyncEnrichmentEngine(max_records=current_app.config['ASYNC_MAX_RECORDS'],
+                                   max_connections=current_app.config['ASYNC_MAX_CONNECTIONS'],
+                                   batch_size=current_app.config['ASYNC_BATCH_SIZE'])
+    return asyncio.run(engine.run(load_records(record_ids)))
@@ -1,7 +1,11 @@
 import requests
 import uuid
 import argparse
+import random
+import threading
+import time
 from datetime import datetime, timezone
+from bench.stats import summarize_latencies
 
 BASE_URL = "http://127.0.0.1:5001"
 PASSWORD = "password123"
@@ -12,64 +16,228 @@ def generate_unique_user():
     email = f"{username}@example.com"
     return username, email
 
-def register_user(username, email, is_admin=False):
+def register_user(username, email, is_admin=False, session=None, verbose=True):
     url = f"{BASE_URL}/register"
     payload = {"username": username, "password": PASSWORD, "email": email}
     if is_admin:
         payload["is_admin"] = True
-    response = requests.post(url, json=payload)
-    print("Register response:", response.json())
+    response = (session or requests).post(url, json=payload)
+    if verbose:
+        print("Register response:", response.json())
     return response
 
-def login_user(username):
+def login_user(username, session=None, verbose=True):
     url = f"{BASE_URL}/login"
     payload = {"username": username, "password": PASSWORD}
-    response = requests.post(url, json=payload)
+    response = (session or requests).post(url, json=payload)
     data = response.json()
-    print("Login response:", data)
+    if verbose:
+        print("Login response:", data)
     token = data.get("token")
     return token
 
-def submit_timestamp(token):
+def submit_timestamp(token, session=None, verbose=True, lat=50.220564, lng=-4.801677):
     url = f"{BASE_URL}/submit_timestamp"
     headers = {"Authorization": f"Bearer {token}"}
     # Get the current UTC time without microseconds
     utc_timestamp = datetime.now(timezone.utc).replace(microsecond=0).isoformat()
     payload = {
         "timestamp": utc_timestamp,
-        "lat": 50.220564,
-        "lng": -4.801677
+        "lat": lat,
+        "lng": lng
     }
-    response = requests.post(url, json=payload, headers=headers)
-    print("Submit Timestamp response:", response.json())
+    response = (session or requests).post(url, json=payload, headers=headers)
+    if verbose:
+        print("Submit Timestamp response:", response.json())
+    return response
 
-def view_my_data(token):
+def view_my_data(token, session=None, verbose=True):
     url = f"{BASE_URL}/my_data"
     headers = {"Authorization": f"Bearer {token}"}
-    response = requests.get(url, headers=headers)
-    print("My Data response:", response.json())
+    response = (session or requests).get(url, headers=headers)
+    if verbose:
+        print("My Data response:", response.json())
+    return response
 
-def view_all_data(token):
+def view_all_data(token, session=None, verbose=True):
     url = f"{BASE_URL}/all_data"
     headers = {"Authorization": f"Bearer {token}"}
-    response = requests.get(url, headers=headers)
-    print("All Data response:", response.json())
+    response = (session or requests).get(url, headers=headers)
+    if verbose:
+        print("All Data response:", response.json())
+    return response
+
+# --- Load generation ---
+
+# Marks used for simulated submissions, so enrichment sees a realistic spread of locations.
+LOAD_MARKS = [
+    (50.220564, -4.801677),
+    (50.3763, -4.1438),
+    (50.1506, -5.0664),
+    (50.6139, -2.4574),
+]
+
+class LoadStats:
+    """Thread-safe per-endpoint request counts, error counts and latencies."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latencies = {}
+        self.errors = {}
+        self.started = time.perf_counter()
+
+    def timed(self, endpoint, call, expected_status=None):
+        """Run call(), record its latency under endpoint and return the response (or None on failure)."""
+        begin = time.perf_counter()
+        response = None
+        failed = False
+        try:
+            response = call()
+            if expected_status is not None:
+                failed = response.status_code != expected_status
+            else:
+                failed = response.status_code >= 400
+        except requests.RequestException:
+            failed = True
+        elapsed = time.perf_counter() - begin
+        with self.lock:
+            self.latencies.setdefault(endpoint, []).append(elapsed)
+            if failed:
+                self.errors[endpoint] = self.errors.get(endpoint, 0) + 1
+        return None if failed else response
+
+    def snapshot(self):
+        with self.lock:
+            return {endpoint: list(values) for endpoint, values in self.latencies.items()}, dict(self.errors)
+
+    def report(self, final=False):
+        latencies, errors = self.snapshot()
+        elapsed = time.perf_counter() - self.started
+        total = sum(len(values) for values in latencies.values())
+        print(f"\n[{elapsed:7.1f}s] {total} requests, {total / elapsed if elapsed else 0:.1f} req/s"
+              + (" (final)" if final else ""))
+        print(f"{'endpoint':<20}{'count':>8}{'req/s':>9}{'err%':>8}{'p50ms':>9}{'p95ms':>9}{'p99ms':>9}{'maxms':>9}")
+        for endpoint in sorted(latencies):
+            values = latencies[endpoint]
+            summary = summarize_latencies(values)
+            error_pct = 100.0 * errors.get(endpoint, 0) / len(values)
+            print(f"{endpoint:<20}{len(values):>8}{len(values) / elapsed:>9.1f}{error_pct:>8.2f}"
+                  f"{summary['p50_ms']:>9.1f}{summary['p95_ms']:>9.1f}{summary['p99_ms']:>9.1f}{summary['max_ms']:>9.1f}")
+
+def parse_mix(mix):
+    """Parse 'submit=1,poll=5,admin=0.2' into a dict of action weights."""
+    weights = {}
+    for part in mix.split(","):
+        name, _, weight = part.partition("=")
+        name = name.strip()
+        if name not in ("submit", "poll", "admin"):
+            raise argparse.ArgumentTypeError(f"Unknown action in mix: {name!r}")
+        weights[name] = float(weight)
+    return weights
+
+def ramp_delay(index, users, profile, ramp_seconds, steps):
+    """Seconds after the start at which virtual user number `index` should start."""
+    if profile == "constant" or ramp_seconds <= 0:
+        return 0.0
+    if profile == "linear":
+        return ramp_seconds * index / users
+    # step: users arrive in `steps` equal batches spread over ramp_seconds.
+    batch = max(1, -(-users // steps))
+    return ramp_seconds * (index // batch) / steps
+
+def get_admin_token(session=None, verbose=True):
+    """Log in as the fixed admin account, registering it first if needed."""
+    admin_username = "admin"
+    admin_email = "admin@example.com"
+    token = login_user(admin_username, session=session, verbose=verbose)
+    if not token:
+        if verbose:
+            print("Admin login failed, attempting to register admin.")
+        register_user(admin_username, admin_email, is_admin=True, session=session, verbose=verbose)
+        token = login_user(admin_username, session=session, verbose=verbose)
+    return token
+
+def virtual_user(index, args, weights, admin_token, stats, stop_at, start_delay):
+    """One simulated angler: register, log in, then loop over weighted actions until stop_at."""
+    time.sleep(start_delay)
+    rng = random.Random(args.seed + index)
+    session = requests.Session()
+    username, email = generate_unique_user()
+    stats.timed("/register", lambda: register_user(username, email, session=session, verbose=False),
+                expected_status=201)
+    response = stats.timed("/login", lambda: session.post(f"{BASE_URL}/login",
+                                                          json={"username": username, "password": PASSWORD}))
+    token = response.json().get("token") if response is not None else None
+    if not token:
+        return
+    actions = list(weights)
+    action_weights = [weights[action] for action in actions]
+    lat, lng = rng.choice(LOAD_MARKS)
+    while time.perf_counter() < stop_at:
+        action = rng.choices(actions, weights=action_weights)[0]
+        if action == "submit":
+            stats.timed("/submit_timestamp",
+                        lambda: submit_timestamp(token, session=session, verbose=False, lat=lat, lng=lng),
+                        expected_status=202)
+        elif action == "poll":
+            stats.timed("/my_data", lambda: view_my_data(token, session=session, verbose=False))
+        elif action == "admin" and admin_token:
+            stats.timed("/all_data", lambda: view_all_data(admin_token, session=session, verbose=False))
+        if args.think_time > 0:
+            time.sleep(rng.expovariate(1.0 / args.think_time))
+
+def run_load(args):
+    """Drive args.users concurrent virtual users and print per-endpoint statistics."""
+    weights = parse_mix(args.mix)
+    admin_token = get_admin_token(verbose=False) if weights.get("admin") else None
+    if weights.get("admin") and not admin_token:
+        print("Could not obtain an admin token; admin reads will be skipped.")
+    stats = LoadStats()
+    stop_at = time.perf_counter() + args.ramp_seconds + args.duration
+    threads = []
+    for index in range(args.users):
+        delay = ramp_delay(index, args.users, args.ramp, args.ramp_seconds, args.ramp_steps)
+        thread = threading.Thread(target=virtual_user,
+                                  args=(index, args, weights, admin_token, stats, stop_at, delay),
+                                  daemon=True)
+        thread.start()
+        threads.append(thread)
+    print(f"Started {args.users} virtual users ({args.ramp} ramp over {args.ramp_seconds}s, "
+          f"then {args.duration}s steady) against {BASE_URL}")
+    next_report = time.perf_counter() + args.report_interval
+    while any(thread.is_alive() for thread in threads):
+        time.sleep(0.5)
+        if time.perf_counter() >= next_report:
+            stats.report()
+            next_report += args.report_interval
+    stats.report(final=True)
 
 def main():
+    global BASE_URL
     parser = argparse.ArgumentParser(description="Test workflow for user or admin")
     parser.add_argument("--admin", action="store_true", help="Run admin workflow")
+    parser.add_argument("--base-url", default=BASE_URL, help="Server to test")
+    load_group = parser.add_argument_group("load testing")
+    load_group.add_argument("--load", action="store_true", help="Run a concurrent load test instead of a single workflow")
+    load_group.add_argument("--users", type=int, default=100, help="Number of concurrent virtual users")
+    load_group.add_argument("--duration", type=float, default=60.0, help="Seconds to hold full load after ramp-up")
+    load_group.add_argument("--ramp", choices=["constant", "linear", "step"], default="linear", help="Ramp-up profile")
+    load_group.add_argument("--ramp-seconds", type=float, default=30.0, help="Length of the ramp-up")
+    load_group.add_argument("--ramp-steps", type=int, default=5, help="Number of batches for the step profile")
+    load_group.add_argument("--mix", default="submit=1,poll=5,admin=0.2",
+                            help="Relative weights of submit (/submit_timestamp), poll (/my_data) and admin (/all_data)")
+    load_group.add_argument("--think-time", type=float, default=1.0, help="Mean think time between actions, in seconds")
+    load_group.add_argument("--report-interval", type=float, default=10.0, help="Seconds between progress reports")
+    load_group.add_argument("--seed", type=int, default=0)
     args = parser.parse_args()
 
-    if args.admin:
+    BASE_URL = args.base_url.rstrip("/")
+
+    if args.load:
+        run_load(args)
+    elif args.admin:
         # Admin workflow using fixed credentials.
-        admin_username = "admin"
-        admin_email = "admin@example.com"
-        # Try logging in first.
-        token = login_user(admin_username)
-        if not token:
-            print("Admin login failed, attempting to register admin.")
-            register_user(admin_username, admin_email, is_admin=True)
-            token = login_user(admin_username)
+        token = get_admin_token()
         if token:
             submit_timestamp(token)
             view_my_data(token)
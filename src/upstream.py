@@ -0,0 +1,70 @@
+import json
+from typing import Any, Dict
+
+from api_calls.stormglass import FetchJSON, get_json, snapping_fetcher
+from circuitbreaker import breaking_fetcher, build_circuit_breaker, is_upstream_failure
+from redis_store import get_redis
+from singleflight import SingleFlight, coalescing_fetcher, request_key
+
+CACHE_PREFIX = "stormglass:cache"
+
+def caching_fetcher(fetch_json: FetchJSON, ttl: float, redis_client=None) -> FetchJSON:
+    """
+    Wrap a fetcher with a Redis response cache keyed by URL and query parameters.
+
+    Responses are day windows, so a cached response serves every record captured at the same
+    location on the same day. Redis errors fall through to the wrapped fetcher.
+
+    Args:
+        fetch_json (callable): The fetcher to wrap.
+        ttl (float): Seconds a response is kept.
+        redis_client (redis.Redis, optional): Client to use. Defaults to redis_store.get_redis().
+    """
+    def fetch(url: str, params: Dict[str, Any], headers: Dict[str, str]) -> Dict[str, Any]:
+        client = redis_client or get_redis()
+        key = f"{CACHE_PREFIX}:{request_key(url, params)}"
+        try:
+            cached = client.get(key)
+            if cached is not None:
+                return json.loads(cached)
+        except Exception as e:
+            print(f"Response cache unavailable: {e}")
+        result = fetch_json(url, params, headers)
+        try:
+            client.set(key, json.dumps(result), px=int(ttl * 1000))
+        except Exception:
+            pass
+        return result
+
+    return fetch
+
+def build_fetch_json(config, http_fetch: FetchJSON = get_json) -> FetchJSON:
+    """
+    Build the fetcher the API clients use to call Stormglass, layering the configured
+    protections around the plain HTTP call.
+
+    From the outside in: coordinate snapping, the response cache, the per-endpoint circuit
+    breaker, then cross-worker single-flight coalescing. Cached responses are served even
+    while a circuit is open.
+
+    Args:
+        config (dict): The Flask app config.
+        http_fetch (callable, optional): The innermost fetcher that actually calls upstream.
+
+    Returns:
+        callable: A FetchJSON function (see api_calls.stormglass).
+    """
+    fetch_json = http_fetch
+    if config['SINGLE_FLIGHT_ENABLED']:
+        fetch_json = coalescing_fetcher(fetch_json, SingleFlight(lock_ttl=config['SINGLE_FLIGHT_LOCK_TTL'],
+                                                                 result_ttl=config['SINGLE_FLIGHT_RESULT_TTL'],
+                                                                 wait_timeout=config['SINGLE_FLIGHT_WAIT_TIMEOUT'],
+                                                                 classify_failure=is_upstream_failure))
+    breaker = build_circuit_breaker(config)
+    if breaker is not None:
+        fetch_json = breaking_fetcher(fetch_json, breaker)
+    if config['RESPONSE_CACHE_TTL'] > 0:
+        fetch_json = caching_fetcher(fetch_json, config['RESPONSE_CACHE_TTL'])
+    if config['STORMGLASS_COORD_DECIMALS'] is not None:
+        fetch_json = snapping_fetcher(fetch_json, config['STORMGLASS_COORD_DECIMALS'])
+    return fetch_json
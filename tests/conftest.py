@@ -0,0 +1,19 @@
+import os
+import sys
+
+import pytest
+import requests
+
+# The application modules live flat in src/ and import one another by name.
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'src'))
+os.environ.setdefault('DATABASE_URL', 'sqlite://')
+
+
+@pytest.fixture
+def http_error():
+    """Factory for the requests.HTTPError raised by get_json for an HTTP `status`."""
+    def make(status):
+        response = requests.Response()
+        response.status_code = status
+        return requests.HTTPError(f"{status} error", response=response)
+    return make
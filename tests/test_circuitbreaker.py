@@ -0,0 +1,84 @@
+import fakeredis
+import pytest
+import requests
+
+from circuitbreaker import CircuitBreaker, CircuitOpenError, is_upstream_failure
+from singleflight import SingleFlight, SingleFlightLeaderError
+
+
+def raising(error):
+    def fn():
+        raise error
+    return fn
+
+
+@pytest.fixture
+def breaker():
+    return CircuitBreaker(fakeredis.FakeRedis(), failure_threshold=3, failure_window=60, open_seconds=30)
+
+
+def expire_open_period(breaker, name):
+    breaker.redis.delete(breaker._key(name, "open"))
+
+
+def test_opens_after_threshold_and_probe_closes(breaker, http_error):
+    for _ in range(3):
+        with pytest.raises(requests.HTTPError):
+            breaker.call("tide", raising(http_error(503)))
+    assert breaker.tripped_circuits() == {"tide": True}
+    with pytest.raises(CircuitOpenError):
+        breaker.call("tide", lambda: pytest.fail("called while open"))
+
+    expire_open_period(breaker, "tide")
+    assert breaker.call("tide", lambda: "ok") == "ok"
+    assert breaker.tripped_circuits() == {}
+
+
+def test_client_errors_do_not_count(breaker, http_error):
+    for _ in range(5):
+        with pytest.raises(requests.HTTPError):
+            breaker.call("tide", raising(http_error(402)))
+    assert breaker.tripped_circuits() == {}
+
+
+def test_failed_probe_reopens(breaker):
+    breaker.trip("tide")
+    expire_open_period(breaker, "tide")
+    with pytest.raises(requests.Timeout):
+        breaker.call("tide", raising(requests.Timeout()))
+    assert breaker.tripped_circuits() == {"tide": True}
+
+
+def test_probe_sharing_leader_outage_reopens(breaker):
+    breaker.trip("tide")
+    expire_open_period(breaker, "tide")
+    shared = SingleFlightLeaderError("HTTPError: 503", "HTTPError", 503, upstream_failure=True)
+    with pytest.raises(SingleFlightLeaderError):
+        breaker.call("tide", raising(shared))
+    assert breaker.tripped_circuits() == {"tide": True}
+
+
+def test_waiters_sharing_leader_outage_are_not_counted_again(breaker):
+    shared = SingleFlightLeaderError("Timeout: ", "Timeout", None, upstream_failure=True)
+    for _ in range(5):
+        with pytest.raises(SingleFlightLeaderError):
+            breaker.call("tide", raising(shared))
+    assert breaker.tripped_circuits() == {}
+
+
+@pytest.mark.parametrize("status, expected", [(402, False), (404, False), (429, True), (503, True)])
+def test_leader_error_classified_by_leader(status, expected, http_error):
+    redis_client = fakeredis.FakeRedis()
+    single_flight = SingleFlight(redis_client, classify_failure=is_upstream_failure)
+    with pytest.raises(requests.HTTPError):
+        single_flight.do("k", raising(http_error(status)))
+    with pytest.raises(SingleFlightLeaderError) as raised:
+        single_flight.do("k", lambda: pytest.fail("waiter called upstream"))
+    assert raised.value.upstream_failure is expected
+    assert is_upstream_failure(raised.value) is expected
+
+
+def test_unclassified_leader_error_falls_back_to_status_and_type():
+    assert not is_upstream_failure(SingleFlightLeaderError("HTTPError: 402", "HTTPError", 402))
+    assert is_upstream_failure(SingleFlightLeaderError("HTTPError: 500", "HTTPError", 500))
+    assert is_upstream_failure(SingleFlightLeaderError("ReadTimeout: ", "ReadTimeout"))
@@ -0,0 +1,43 @@
+from datetime import datetime
+
+import pytest
+
+from celery_app import create_app
+from hourly_series import HourlySeriesStore
+from models import db, HourlySeries
+
+
+@pytest.fixture
+def app(tmp_path):
+    app = create_app({'SQLALCHEMY_DATABASE_URI': f"sqlite:///{tmp_path / 'test.db'}",
+                      'SQLALCHEMY_ENGINE_OPTIONS': {}})
+    with app.app_context():
+        db.create_all()
+        yield app
+
+
+def save_sea_level(store):
+    store.save(50.0, -4.0, datetime(2024, 5, 1, 12), "seaLevel", {"seaLevel": [1.0] * 24})
+
+
+def test_rolled_back_series_are_written_again(app):
+    store = HourlySeriesStore()
+    save_sea_level(store)
+    store.write_pending()
+    db.session.rollback()
+    assert not store._written
+
+    save_sea_level(store)
+    store.write_pending()
+    db.session.commit()
+    assert db.session.query(HourlySeries).count() == 1
+    assert len(store._written) == 1
+
+
+def test_committed_series_are_skipped(app):
+    store = HourlySeriesStore()
+    save_sea_level(store)
+    store.write_pending()
+    db.session.commit()
+    save_sea_level(store)
+    assert not store._pending
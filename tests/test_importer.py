@@ -0,0 +1,153 @@
+import io
+from datetime import datetime
+from types import SimpleNamespace
+
+import fakeredis
+import pytest
+
+import importer
+import ratelimit
+import redis_store
+from celery_app import create_app
+from importer import ImportFormatError, iter_csv_rows, iter_gpx_rows, load_rows, parse_row, schedule_imported
+from models import db, User, EnvironmentData
+
+
+@pytest.fixture
+def app(tmp_path):
+    app = create_app({'SQLALCHEMY_DATABASE_URI': f"sqlite:///{tmp_path / 'test.db'}",
+                      'SQLALCHEMY_ENGINE_OPTIONS': {}})
+    with app.app_context():
+        db.create_all()
+        yield app
+
+
+@pytest.fixture
+def user(app):
+    user = User(username='angler', password_hash='x')
+    db.session.add(user)
+    db.session.commit()
+    return user
+
+
+def test_parse_row_normalises_to_naive_utc():
+    assert parse_row(' 2024-05-01T14:30:00+02:00 ', '50.2', '-4.8') == (datetime(2024, 5, 1, 12, 30), 50.2, -4.8)
+
+
+@pytest.mark.parametrize("values, message", [
+    (('', '50', '-4'), 'missing timestamp'),
+    (('2024-05-01T12:00', '50', ''), 'missing latitude or longitude'),
+    (('2024-05-01T12:00', '91', '0'), 'out of range'),
+    (('yesterday', '50', '-4'), 'Invalid isoformat'),
+])
+def test_parse_row_rejects_bad_values(values, message):
+    with pytest.raises(ValueError, match=message):
+        parse_row(*values)
+
+
+def test_csv_header_aliases_and_stream_left_open():
+    stream = io.BytesIO('﻿DateTime, Latitude ,Long,species\n'
+                        '2024-05-01T06:00,50.1,-4.1,bass\n2024-05-01T07:00,50.2,-4.2,pollack\n'.encode('utf-8'))
+    rows = list(iter_csv_rows(stream))
+    assert rows == [(2, '2024-05-01T06:00', '50.1', '-4.1'), (3, '2024-05-01T07:00', '50.2', '-4.2')]
+    assert not stream.closed
+
+
+def test_csv_without_position_columns_is_refused():
+    with pytest.raises(ImportFormatError, match='lat, latitude'):
+        list(iter_csv_rows(io.BytesIO(b'time,depth\n2024-05-01T06:00,12\n')))
+
+
+def test_gpx_yields_timed_points_only_and_detaches_them():
+    gpx = b'''<?xml version="1.0"?>
+    <gpx xmlns="http://www.topografix.com/GPX/1/1">
+      <wpt lat="50.1" lon="-4.1"><time>2024-05-01T06:00:00Z</time><name>bass</name></wpt>
+      <trk><trkseg>
+        <trkpt lat="50.2" lon="-4.2"><time>2024-05-01T07:00:00Z</time></trkpt>
+        <trkpt lat="50.3" lon="-4.3"></trkpt>
+        <trkpt lat="50.4" lon="-4.4"><time>2024-05-01T08:00:00Z</time></trkpt>
+      </trkseg></trk>
+    </gpx>'''
+    assert list(iter_gpx_rows(io.BytesIO(gpx))) == [(1, '2024-05-01T06:00:00Z', '50.1', '-4.1'), (2, '2024-05-01T07:00:00Z', '50.2', '-4.2'),
+                    (4, '2024-05-01T08:00:00Z', '50.4', '-4.4')]
+
+
+def test_gpx_points_are_removed_from_their_parent(monkeypatch):
+    parents = []
+    original = importer.ET.iterparse
+
+    def recording_iterparse(*args, **kwargs):
+        for event, element in original(*args, **kwargs):
+            if event == 'end' and element.tag.endswith('trkseg'):
+                parents.append(len(element))
+            yield event, element
+
+    monkeypatch.setattr(importer.ET, 'iterparse', recording_iterparse)
+    gpx = b'<gpx><trk><trkseg>' + b''.join(
+        b'<trkpt lat="50" lon="-4"><time>2024-05-01T%02d:00:00Z</time></trkpt>' % hour for hour in range(5)
+    ) + b'</trkseg></trk></gpx>'
+    assert len(list(iter_gpx_rows(io.BytesIO(gpx)))) == 5
+    assert parents == [0]
+
+
+def test_load_rows_counts_chunks_and_reports_errors(user):
+    rows = [(2, '2024-05-01T06:00', '50.1', '-4.1'), (3, '', '50.1', '-4.1'), (4, '2024-05-01T07:00', '50.1', '-4.1'),
+            (5, '2024-05-01T08:00', '50.1', '-4.1'), (6, '2024-05-01T09:00', '95', '-4.1')]
+    progress = []
+    stats = load_rows(user.id, rows, chunk_size=2, progress=lambda stats: progress.append(stats['imported']))
+    assert (stats['rows'], stats['imported'], stats['rejected']) == (5, 3, 2)
+    assert [error['line'] for error in stats['errors']] == [3, 6]
+    assert progress == [2, 3]
+    statuses = {status for (status,) in db.session.query(EnvironmentData.status)}
+    assert statuses == {importer.IMPORTED_STATUS}
+
+
+def test_schedule_imported_queues_batches_by_location_and_day(user, monkeypatch):
+    sent = []
+    monkeypatch.setattr(importer, 'enqueue_bulk_enrichment', lambda ids, batch_size: sent.append(list(ids)))
+    rows = [(1, '2024-05-02T06:00', '50.111', '-4.1'), (2, '2024-05-01T06:00', '51.0', '-4.1'),
+            (3, '2024-05-01T09:00', '50.112', '-4.1'), (4, '2024-05-01T07:00', '51.0', '-4.1'),
+            (5, '2024-05-02T08:00', '50.109', '-4.1')]
+    load_rows(user.id, rows)
+
+    assert schedule_imported(user.id, batch_size=2, batches_per_page=1) == 5
+    positions = {record.id: (record.latitude, record.timestamp.day) for record in EnvironmentData.query}
+    batches = [[positions[record_id] for record_id in batch] for batch in sent]
+    # Cell 50.11 (day 1, then day 2), then cell 51.00.
+    assert [len(batch) for batch in batches] == [2, 2, 1]
+    assert [round(lat, 2) for batch in batches for lat, _ in batch] == [50.11, 50.11, 50.11, 51.0, 51.0]
+    assert [day for batch in batches for _, day in batch] == [1, 2, 2, 1, 1]
+    assert {status for (status,) in db.session.query(EnvironmentData.status)} == {importer.QUEUED_STATUS}
+    assert schedule_imported(user.id) == 0
+
+
+def test_import_endpoint_has_its_own_rate_limit(tmp_path, monkeypatch):
+    import app as web
+    monkeypatch.setattr(redis_store, '_client', fakeredis.FakeRedis())
+    monkeypatch.setattr(ratelimit, '_buckets', {})
+    monkeypatch.setattr(web.celery, 'send_task', lambda name, args, task_id, queue: SimpleNamespace(id=task_id))
+    monkeypatch.setitem(web.app.config, 'IMPORT_DIR', str(tmp_path))
+    monkeypatch.setitem(web.app.config, 'RATE_LIMIT_IMPORT', '10/hour')
+    monkeypatch.setitem(web.app.config, 'RATE_LIMIT_IMPORT_BURST', 3)
+    with web.app.app_context():
+        db.create_all()
+        try:
+            user = User(username='importer', password_hash='x')
+            db.session.add(user)
+            db.session.commit()
+            # SQLite's UUID column wants the UUID itself rather than the token's string.
+            monkeypatch.setattr(web.jwt, 'decode', lambda token, key, algorithms: {'user_id': user.id})
+            client = web.app.test_client()
+
+            def upload():
+                return client.post('/import_catches', headers={'Authorization': 'Bearer token'},
+                                   data={'file': (io.BytesIO(b'timestamp,lat,lng\n'), 'log.csv')})
+
+            assert [upload().status_code for _ in range(3)] == [202, 202, 202]
+            refused = upload()
+            assert refused.status_code == 429
+            # Ten an hour: one upload every six minutes.
+            assert 300 < int(refused.headers['Retry-After']) <= 360
+        finally:
+            db.session.remove()
+            db.drop_all()
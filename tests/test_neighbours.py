@@ -0,0 +1,96 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+import neighbours
+from celery_app import create_app
+from models import TIDE_FIELDS, WEATHER_FIELDS, ASTRONOMY_FIELDS
+from neighbours import _interpolate, _shifted_tide_hour, reuse_values
+
+CATCH_TIME = datetime(2024, 5, 1, 12, 0)
+
+
+@pytest.fixture
+def app():
+    app = create_app({'NEIGHBOUR_REUSE_ENABLED': True})
+    with app.app_context():
+        yield app
+
+
+def neighbour(offset_minutes, distance, **values):
+    row = {field: None for field in TIDE_FIELDS + WEATHER_FIELDS + ASTRONOMY_FIELDS}
+    row.update(sunrise="2024-05-01T05:30:00+00:00", sunset="2024-05-01T20:15:00+00:00", lightLevel="day")
+    row.update(values)
+    offset = offset_minutes * 60.0
+    row.update(id=f"n{offset_minutes}", timestamp=CATCH_TIME + timedelta(seconds=offset),
+               offset=offset, distance=distance)
+    return row
+
+
+def use_neighbours(monkeypatch, rows):
+    monkeypatch.setattr(neighbours, "find_neighbours", lambda *args, **kwargs: rows)
+
+
+@pytest.mark.parametrize("before, after, weight, expected", [
+    (350.0, 10.0, 0.5, 0.0),
+    (10.0, 350.0, 0.25, 5.0),
+    (90.0, 180.0, 0.5, 135.0),
+])
+def test_directions_interpolate_the_short_way_round(before, after, weight, expected):
+    result = _interpolate("windDirection", before, after, weight)
+    # Compare around the circle, where 359.999 and 0 are the same direction.
+    assert (result - expected + 180.0) % 360.0 - 180.0 == pytest.approx(0.0, abs=1e-9)
+
+
+def test_scalars_interpolate_linearly_and_missing_sides_take_the_nearer():
+    assert _interpolate("windSpeed", 4.0, 8.0, 0.25) == pytest.approx(5.0)
+    assert _interpolate("windSpeed", None, 8.0, 0.25) is None
+    assert _interpolate("windSpeed", None, 8.0, 0.75) == 8.0
+
+
+@pytest.mark.parametrize("tide_hour, offset_hours, expected", [
+    (2.0, 0.5, 2.5),
+    (11.8, 0.5, 12),
+    (12.0, 1.0, 12),
+    (12.0, -0.1, False),
+    (0.2, -0.5, False),
+    (None, 1.0, None),
+])
+def test_shifted_tide_hour(tide_hour, offset_hours, expected):
+    result = _shifted_tide_hour({"tideHour": tide_hour}, offset_hours * 3600)
+    assert result == (pytest.approx(expected) if isinstance(expected, float) else expected)
+
+
+def test_interpolates_between_neighbours_on_both_sides(app, monkeypatch):
+    use_neighbours(monkeypatch, [
+        neighbour(-10, 50.0, tideHour=2.0, currentTideHeight=1.0, windDirection=350.0, windSpeed=4.0),
+        neighbour(30, 20.0, tideHour=2.6667, currentTideHeight=3.0, windDirection=30.0, windSpeed=8.0),
+    ])
+    values = reuse_values(CATCH_TIME, 50.0, -4.0)
+    assert values["enrichment_source"] == neighbours.INTERPOLATED_SOURCE
+    assert values["source_record_id"] == "n-10"
+    # A quarter of the way from the earlier neighbour to the later one.
+    assert values["currentTideHeight"] == pytest.approx(1.5)
+    assert values["windSpeed"] == pytest.approx(5.0)
+    assert (values["windDirection"] + 180.0) % 360.0 - 180.0 == pytest.approx(0.0, abs=1e-9)
+    # tideHour comes from the closest neighbour, moved by the time between the catches.
+    assert values["tideHour"] == pytest.approx(2.0 + 10 / 60)
+
+
+def test_copies_a_one_sided_neighbour_with_shifted_tide_hour(app, monkeypatch):
+    use_neighbours(monkeypatch, [neighbour(-20, 100.0, tideHour=5.0, windSpeed=6.0, maxHighTide=4.2)])
+    values = reuse_values(CATCH_TIME, 50.0, -4.0)
+    assert values["enrichment_source"] == neighbours.NEIGHBOUR_SOURCE
+    assert values["windSpeed"] == 6.0
+    assert values["maxHighTide"] == 4.2
+    assert values["tideHour"] == pytest.approx(5.0 + 20 / 60)
+
+
+def test_neighbours_across_a_high_tide_or_sunset_are_not_used(app, monkeypatch):
+    use_neighbours(monkeypatch, [
+        # A high tide lies between: it was 0.1h after high tide 30 minutes later.
+        neighbour(30, 10.0, tideHour=0.1),
+        # Sunset lies between the two catches.
+        neighbour(-15, 10.0, tideHour=3.0, sunset="2024-05-01T11:55:00+00:00"),
+    ])
+    assert reuse_values(CATCH_TIME, 50.0, -4.0) is None
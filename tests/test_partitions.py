@@ -0,0 +1,49 @@
+import os
+from datetime import datetime
+
+import partitions
+
+MONTH = datetime(2024, 1, 1)
+
+
+class FakeResult:
+    def scalar(self):
+        return True
+
+
+class FakeConnection:
+    def __init__(self):
+        self.statements = []
+
+    def execute(self, statement, params=None):
+        self.statements.append(str(statement))
+        return FakeResult()
+
+
+def test_archiving_a_month_twice_keeps_both_parts(tmp_path, monkeypatch):
+    exports = iter([b'id,timestamp\n1,2024-01-03\n', b'id,timestamp\n2,2024-01-20\n'])
+    monkeypatch.setattr(partitions, 'copy_to_file', lambda connection, statement, stream: stream.write(next(exports)))
+
+    first = partitions.archive_partition(FakeConnection(), MONTH, str(tmp_path))
+    second = partitions.archive_partition(FakeConnection(), MONTH, str(tmp_path))
+
+    assert first != second
+    assert partitions.archive_paths(str(tmp_path), MONTH) == [first, second]
+    assert sorted(os.listdir(tmp_path)) == ['environment_data_y2024m01.csv.gz', 'environment_data_y2024m01_2.csv.gz']
+
+
+def test_restore_loads_every_part_and_retire_hides_them(tmp_path, monkeypatch):
+    exports = iter([b'id,timestamp\n1,2024-01-03\n', b'id,timestamp\n2,2024-01-20\n'])
+    monkeypatch.setattr(partitions, 'copy_to_file', lambda connection, statement, stream: stream.write(next(exports)))
+    partitions.archive_partition(FakeConnection(), MONTH, str(tmp_path))
+    partitions.archive_partition(FakeConnection(), MONTH, str(tmp_path))
+    loaded = []
+    monkeypatch.setattr(partitions, 'copy_from_file',
+                        lambda connection, statement, stream: loaded.append((statement, stream.read())))
+
+    partitions.restore_partition(FakeConnection(), MONTH, str(tmp_path), table='january')
+
+    assert [data for _, data in loaded] == ['1,2024-01-03\n', '2,2024-01-20\n']
+    assert all(statement.startswith('COPY january ("id", "timestamp")') for statement, _ in loaded)
+    partitions.retire_archives(str(tmp_path), MONTH)
+    assert partitions.archive_paths(str(tmp_path), MONTH) == []
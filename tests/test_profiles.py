@@ -0,0 +1,44 @@
+import statistics
+
+import pytest
+
+from profiles import PROFILE_METRICS, _new_profile, apply_record
+
+
+def record(swell, wind, light="day"):
+    return {"swellHeight": swell, "windSpeed": wind, "pressure": None, "tideHour": None, "lightLevel": light}
+
+
+def snapshot(profile):
+    return {metric: (getattr(profile, f"{metric}Count"), getattr(profile, f"{metric}Mean"),
+                     getattr(profile, f"{metric}M2")) for metric in PROFILE_METRICS}
+
+
+def test_removing_a_record_restores_mean_and_variance():
+    profile = _new_profile("user")
+    records = [record(1.2, 5.0), record(0.8, 7.5), record(2.5, 3.0, "night")]
+    for values in records:
+        apply_record(profile, values)
+    before = snapshot(profile)
+
+    apply_record(profile, record(4.0, 12.0, "dusk"))
+    apply_record(profile, record(4.0, 12.0, "dusk"), sign=-1)
+
+    for metric, (count, mean, m2) in snapshot(profile).items():
+        assert count == before[metric][0]
+        assert mean == pytest.approx(before[metric][1])
+        assert m2 == pytest.approx(before[metric][2])
+    swells = [values["swellHeight"] for values in records]
+    assert profile.swellHeightMean == pytest.approx(statistics.mean(swells))
+    assert profile.swellHeightM2 / profile.swellHeightCount == pytest.approx(statistics.pvariance(swells))
+    assert profile.catches == 3
+    assert profile.lightLevelCounts == {"day": 2, "night": 1}
+
+
+def test_removing_the_only_record_empties_the_profile():
+    profile = _new_profile("user")
+    apply_record(profile, record(1.0, 2.0))
+    apply_record(profile, record(1.0, 2.0), sign=-1)
+    assert profile.catches == 0
+    assert (profile.swellHeightCount, profile.swellHeightMean, profile.swellHeightM2) == (0, 0.0, 0.0)
+    assert profile.lightLevelCounts == {}
@@ -0,0 +1,110 @@
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import func, select
+
+from celery_app import create_app
+from models import db, ConditionProfile, EnvironmentData, User
+from profiles import PROFILE_METRICS, profile_summary, rebuild_profiles
+from purge import InvalidFilterError, delete_in_batches, record_filter_conditions
+
+
+@pytest.fixture
+def app(tmp_path):
+    app = create_app({'SQLALCHEMY_DATABASE_URI': f"sqlite:///{tmp_path / 'test.db'}",
+                      'SQLALCHEMY_ENGINE_OPTIONS': {}})
+    with app.app_context():
+        db.create_all()
+        yield app
+
+
+def make_user(name):
+    user = User(username=name, password_hash='x')
+    db.session.add(user)
+    db.session.commit()
+    return user
+
+
+def add_records(user, count, status='complete', start=datetime(2024, 5, 1)):
+    records = [EnvironmentData(user_id=user.id, timestamp=start + timedelta(hours=i), latitude=50.0,
+                               longitude=-4.0, status=status, swellHeight=1.0 + i, windSpeed=5.0 + i % 3,
+                               pressure=1010.0 + i, tideHour=float(i % 6),
+                               currentMoonPhaseText='Full moon' if i % 2 else 'New moon',
+                               lightLevel='day') for i in range(count)]
+    db.session.add_all(records)
+    db.session.commit()
+    return records
+
+
+def record_count(user):
+    return db.session.execute(
+        select(func.count()).select_from(EnvironmentData).where(EnvironmentData.user_id == user.id)).scalar()
+
+
+def profile(user):
+    return profile_summary(db.session.get(ConditionProfile, user.id))
+
+
+@pytest.mark.parametrize("batch_size, expected_progress", [
+    (3, [(3, 10), (6, 10), (9, 10), (10, 10)]),
+    # An exact multiple ends on an empty batch, which is not reported.
+    (5, [(5, 10), (10, 10)]),
+])
+def test_deletes_in_batches_and_reports_progress(app, batch_size, expected_progress):
+    angler, other = make_user('angler'), make_user('other')
+    add_records(angler, 7)
+    add_records(angler, 3, status='pending', start=datetime(2024, 6, 1))
+    add_records(other, 2)
+    progress = []
+
+    deleted = delete_in_batches([EnvironmentData.user_id == angler.id], batch_size,
+                                lambda done, total: progress.append((done, total)))
+
+    assert deleted == 10
+    assert progress == expected_progress
+    assert record_count(angler) == 0
+    assert record_count(other) == 2
+
+
+def test_deleted_complete_records_come_out_of_profiles(app):
+    angler, other = make_user('angler'), make_user('other')
+    records = add_records(angler, 8)
+    add_records(angler, 2, status='pending', start=datetime(2024, 6, 1))
+    add_records(other, 4)
+    rebuild_profiles()
+    other_before = profile(other)
+    doomed = [str(record.id) for record in records[::2]]
+
+    deleted = delete_in_batches(record_filter_conditions({'ids': doomed}), batch_size=3)
+
+    assert deleted == 4
+    remaining = profile(angler)
+    rebuild_profiles()
+    expected = profile(angler)
+    assert remaining['catches'] == expected['catches'] == 4
+    assert remaining['moonPhases'] == expected['moonPhases'] == {'Full moon': 4}
+    for metric in PROFILE_METRICS:
+        assert remaining['metrics'][metric]['count'] == expected['metrics'][metric]['count']
+        assert remaining['metrics'][metric]['mean'] == pytest.approx(expected['metrics'][metric]['mean'])
+        assert remaining['metrics'][metric]['variance'] == pytest.approx(expected['metrics'][metric]['variance'])
+    assert profile(other) == other_before
+
+
+def test_pending_records_leave_profiles_alone(app):
+    angler = make_user('angler')
+    add_records(angler, 3)
+    add_records(angler, 4, status='pending', start=datetime(2024, 6, 1))
+    rebuild_profiles()
+    before = profile(angler)
+
+    assert delete_in_batches(record_filter_conditions({'status': 'pending'}), batch_size=2) == 4
+
+    assert profile(angler) == before
+    assert record_count(angler) == 3
+
+
+def test_filters_are_required():
+    with pytest.raises(InvalidFilterError, match='at least one'):
+        record_filter_conditions({})
+    with pytest.raises(InvalidFilterError, match='Invalid filter value'):
+        record_filter_conditions({'before': 'last week'})
@@ -0,0 +1,30 @@
+import time
+
+import fakeredis
+import pytest
+
+import georouting
+import queues
+import redis_store
+from celery_app import create_app
+
+
+@pytest.fixture
+def app(monkeypatch):
+    server = fakeredis.FakeServer()
+    monkeypatch.setattr(redis_store, '_client', fakeredis.FakeRedis(server=server))
+    monkeypatch.setattr(queues, '_broker_client', fakeredis.FakeRedis(server=server))
+    app = create_app({'ENRICHMENT_BACKEND': 'celery'})
+    with app.app_context():
+        yield app
+
+
+def test_backlog_counts_geo_routed_queues(app):
+    redis_client = redis_store.get_redis()
+    redis_client.zadd(georouting.MEMBERS_KEY, {'live.geo.a': time.time() + 60, 'live.geo.gone': time.time() - 60})
+    redis_client.rpush('live', *range(3))
+    redis_client.rpush('live.geo.a', *range(4))
+    redis_client.rpush('live.geo.gone', *range(5))
+
+    assert queues.enrichment_backlog(100) == 7
+    assert queues.enrichment_backlog(5) == 5
@@ -0,0 +1,94 @@
+from types import SimpleNamespace
+
+import fakeredis
+import pytest
+from flask import Flask, g
+
+import ratelimit
+import redis_store
+from ratelimit import TokenBucket, parse_rate, rate_limited
+
+
+@pytest.fixture
+def redis_client(monkeypatch):
+    client = fakeredis.FakeRedis()
+    monkeypatch.setattr(redis_store, '_client', client)
+    monkeypatch.setattr(ratelimit, '_buckets', {})
+    return client
+
+
+def test_parse_rate():
+    assert parse_rate('60/minute') == 1.0
+    assert parse_rate('10/hour') == pytest.approx(10 / 3600)
+    assert parse_rate('') is None
+    with pytest.raises(ValueError, match='Invalid rate'):
+        parse_rate('60 per minute')
+
+
+def test_burst_is_allowed_then_denied_with_retry_after(redis_client):
+    bucket = TokenBucket(rate=0.5, burst=3, redis_client=redis_client)
+
+    assert [bucket.take('user-1') for _ in range(3)] == [(True, 0.0)] * 3
+    allowed, retry_after = bucket.take('user-1')
+
+    assert not allowed
+    # One token refills every two seconds.
+    assert 0 < retry_after <= 2
+    # Buckets are per key.
+    assert bucket.take('user-2') == (True, 0.0)
+
+
+def test_bucket_refills_over_time(redis_client):
+    bucket = TokenBucket(rate=0.5, burst=2, redis_client=redis_client)
+    assert bucket.take('user-1')[0] and bucket.take('user-1')[0]
+    assert not bucket.take('user-1')[0]
+
+    # Pretend the last request was ten seconds ago: the bucket is full again, but no fuller.
+    key = f'{ratelimit.BUCKET_PREFIX}:user-1'
+    redis_client.hset(key, 'ts', str(float(redis_client.hget(key, 'ts')) - 10))
+
+    assert [bucket.take('user-1')[0] for _ in range(3)] == [True, True, False]
+
+
+def test_decorator_returns_429_with_retry_after_header(redis_client):
+    app = Flask(__name__)
+    app.config.update(RATE_LIMIT_SUBMIT='1/minute', RATE_LIMIT_SUBMIT_BURST=2)
+
+    @app.before_request
+    def login():
+        g.current_user = SimpleNamespace(id='user-1')
+
+    @app.route('/submit', methods=['POST'])
+    @rate_limited('submit')
+    def submit():
+        return 'ok', 201
+
+    client = app.test_client()
+    assert [client.post('/submit').status_code for _ in range(2)] == [201, 201]
+    response = client.post('/submit')
+
+    assert response.status_code == 429
+    assert 1 <= int(response.headers['Retry-After']) <= 60
+
+
+def unreachable_redis():
+    raise ConnectionError('Redis is down')
+
+
+def test_decorator_lets_requests_through_without_redis(monkeypatch):
+    monkeypatch.setattr(ratelimit, '_buckets', {})
+    monkeypatch.setattr(ratelimit, 'get_redis', unreachable_redis)
+    app = Flask(__name__)
+    app.config.update(RATE_LIMIT_SUBMIT='1/minute', RATE_LIMIT_SUBMIT_BURST=1)
+
+    @app.before_request
+    def login():
+        g.current_user = SimpleNamespace(id='user-1')
+
+    @app.route('/submit', methods=['POST'])
+    @rate_limited('submit')
+    def submit():
+        return 'ok', 201
+
+    client = app.test_client()
+    assert [client.post('/submit').status_code for _ in range(3)] == [201, 201, 201]
@@ -0,0 +1,66 @@
+import threading
+
+import fakeredis
+import pytest
+import requests
+
+from singleflight import SingleFlight, SingleFlightLeaderError
+
+
+@pytest.fixture
+def redis_client():
+    return fakeredis.FakeRedis()
+
+
+def test_waiter_shares_leader_result(redis_client):
+    leader = SingleFlight(redis_client)
+    waiter = SingleFlight(redis_client, poll_interval=0.01)
+    started, release = threading.Event(), threading.Event()
+    calls = []
+
+    def slow_call():
+        calls.append(1)
+        started.set()
+        release.wait(5)
+        return {"value": 1}
+
+    results = []
+    thread = threading.Thread(target=lambda: results.append(leader.do("k", slow_call)))
+    thread.start()
+    started.wait(5)
+    shared = threading.Thread(target=lambda: results.append(waiter.do("k", lambda: calls.append(2))))
+    shared.start()
+    release.set()
+    thread.join(5)
+    shared.join(5)
+
+    assert calls == [1]
+    assert results == [{"value": 1}, {"value": 1}]
+    assert waiter.stats["shared"] == 1
+
+
+def test_failure_shared_for_a_second_with_error_type_and_status(redis_client, http_error):
+    single_flight = SingleFlight(redis_client)
+    with pytest.raises(requests.HTTPError):
+        single_flight.do("k", lambda: (_ for _ in ()).throw(http_error(402)))
+    # The failure stays published for up to a second, for waiters and later callers alike.
+    with pytest.raises(SingleFlightLeaderError) as raised:
+        single_flight.do("k", lambda: pytest.fail("waiter called upstream"))
+    assert raised.value.error_type == "HTTPError"
+    assert raised.value.status == 402
+    assert 0 < redis_client.pttl("singleflight:result:k") <= 1000
+
+
+def test_result_published_before_lock_is_shared(redis_client, monkeypatch):
+    single_flight = SingleFlight(redis_client)
+    original_set = redis_client.set
+
+    def set_after_leader_finished(key, value, **kwargs):
+        # Another leader publishes and releases between this worker's GET and SETNX.
+        if kwargs.get("nx") and not redis_client.exists("singleflight:result:k"):
+            original_set("singleflight:result:k", '{"result": 7}', px=1000)
+        return original_set(key, value, **kwargs)
+
+    monkeypatch.setattr(redis_client, "set", set_after_leader_finished)
+    assert single_flight.do("k", lambda: pytest.fail("called upstream twice")) == 7
+    assert not redis_client.exists("singleflight:lock:k")
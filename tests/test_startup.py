@@ -0,0 +1,26 @@
+import os
+import subprocess
+import sys
+
+from api_calls.weather import WEATHER_PARAMS
+from hourly_series import WEATHER_SERIES
+
+SRC = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'src')
+
+# Imported by workers and CLI commands only, never by the web process at startup.
+WORKER_ONLY_MODULES = ('requests', 'arrow', 'aiohttp', 'numpy', 'tasks', 'upstream',
+                       'api_calls.stormglass', 'api_calls.weather', 'api_calls.tides')
+
+
+def test_web_startup_does_not_import_api_clients():
+    code = ("import sys, app; "
+            f"print(','.join(name for name in {WORKER_ONLY_MODULES!r} if name in sys.modules))")
+    env = {**os.environ, 'DATABASE_URL': 'sqlite://'}
+    result = subprocess.run([sys.executable, '-c', code], cwd=SRC, env=env,
+                            capture_output=True, text=True, check=True)
+    assert result.stdout.strip() == ''
+
+
+def test_stored_weather_rows_follow_weather_params():
+    # Packed rows are stored in this order; changing it would misread existing rows.
+    assert WEATHER_SERIES == tuple(WEATHER_PARAMS)
@@ -0,0 +1,93 @@
+from datetime import datetime, timezone
+
+import numpy as np
+import pytest
+
+from api_calls.weather import WEATHER_PARAMS
+from api_calls.weather_grid import GridWeatherClient, GridWeatherStore
+
+
+def global_store(path):
+    """A one-step 0..359 grid at 1 degree whose waveHeight is the column's longitude."""
+    store = GridWeatherStore.create(str(path), 0, 3600, 1, 10.0, -1.0, 3, 0.0, 1.0, 360,
+                                    params=["waveHeight", "windDirection"])
+    columns = np.arange(360, dtype=np.float32)
+    store.write("waveHeight", np.broadcast_to(columns, (1, 3, 360)))
+    store.write("windDirection", np.broadcast_to(columns, (1, 3, 360)))
+    return store
+
+
+def test_negative_longitudes_match_a_0_360_grid(tmp_path):
+    store = global_store(tmp_path)
+    values, covered = store.lookup([0, 0], [9.0, 9.0], [-10.0, 350.0], method="nearest")
+    assert covered.all()
+    assert values[:, 0].tolist() == [350.0, 350.0]
+
+
+def test_wraps_between_last_and_first_column(tmp_path):
+    store = global_store(tmp_path)
+    values, covered = store.lookup([0], [9.0], [359.5])
+    assert covered.all()
+    # Halfway between column 359 and column 0.
+    assert values[0, 0] == pytest.approx(179.5)
+    assert values[0, 1] == pytest.approx(359.5)
+
+
+def test_regional_grid_in_minus_180_180(tmp_path):
+    store = GridWeatherStore.create(str(tmp_path), 0, 3600, 1, 50.0, 1.0, 2, -10.0, 1.0, 5,
+                                    params=["waveHeight"])
+    store.write("waveHeight", np.full((1, 2, 5), 2.0))
+    values, covered = store.lookup([0, 0, 0], [50.0, 50.0, 50.0], [350.0, -10.4, 20.0])
+    assert covered.tolist() == [True, True, False]
+    assert values[:2, 0].tolist() == [2.0, 2.0]
+
+
+class FakeFallback:
+    def __init__(self):
+        self.calls = []
+        self.series_store = FakeSeriesStore()
+
+    def get_weather_data(self, timestamp, lat, lon):
+        self.calls.append((timestamp, lat, lon))
+        return {param: -1.0 for param in WEATHER_PARAMS}
+
+
+class FakeSeriesStore:
+    decimals = 2
+
+    def __init__(self):
+        self.saved = []
+
+    def save(self, lat, lon, timestamp, column, values):
+        self.saved.append((lat, lon, column, values))
+
+
+def hourly_store(path, params):
+    """24 hourly steps on 2024-05-01 over a small area; each parameter's value is the hour."""
+    start = datetime(2024, 5, 1, tzinfo=timezone.utc).timestamp()
+    store = GridWeatherStore.create(str(path), start, 3600, 24, 50.0, 1.0, 2, -5.0, 1.0, 2, params=params)
+    for param in params:
+        store.write(param, np.broadcast_to(np.arange(24, dtype=np.float32)[:, None, None], (24, 2, 2)))
+    return store
+
+
+def test_partial_grid_merges_stormglass_values(tmp_path):
+    fallback = FakeFallback()
+    client = GridWeatherClient(hourly_store(tmp_path, ["waveHeight"]), fallback=fallback)
+    result = client.get_weather_data(datetime(2024, 5, 1, 6), 50.5, -4.5)
+    assert result["waveHeight"] == pytest.approx(6.0)
+    assert result["windSpeed"] == -1.0
+    assert len(fallback.calls) == 1
+
+
+def test_complete_grid_serves_alone_and_stores_the_days_series(tmp_path):
+    fallback = FakeFallback()
+    client = GridWeatherClient(hourly_store(tmp_path, WEATHER_PARAMS), fallback=fallback)
+    results = client.get_weather_data_many([(datetime(2024, 5, 1, 6), 50.5, -4.5),
+                                            (datetime(2024, 5, 1, 9), 50.5, -4.5)])
+    assert [result["windSpeed"] for result in results] == [pytest.approx(6.0), pytest.approx(9.0)]
+    assert fallback.calls == []
+    # One location-day, stored once with all 24 hours.
+    [(lat, lon, column, series)] = fallback.series_store.saved
+    assert column == "weather"
+    assert series["windSpeed"] == pytest.approx(list(range(24)))